@@ -1,6 +1,16 @@
 from .__version__ import VERSION
 from .options import Options
 from .clients import Client, AsyncClient, ApiCommon
-from .models import ApiResult, RestResult, Session
-from .store import CostMemoryStore, TimeMemoryStore, StateStore
+from .models import ApiResult, BulkProgress, RestResult, Session
+from .store import BoundedMemoryStore, BucketMemoryStore, CostMemoryStore, TimeMemoryStore, SharedFileStore, StateStore
+from .bucket import CostEstimator, LeakyBucket
+from .breaker import CircuitBreaker, CircuitOpenError
+from .cache import DiskCache, MemoryCache, ResponseCache
 from .deferrer import Deferrer, SleepDeferrer
+from .flight import SingleFlight
+from .retry import RetryBudget
+from .bulk import assemble_bulk_rows
+from .scheduler import BulkJob, BulkScheduler
+from .transport import SharedTransport
+from .pool import ClientPool
+from .emulator import ShopifyEmulator
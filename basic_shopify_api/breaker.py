@@ -0,0 +1,224 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, FrozenSet
+
+from .constants import ONE_SECOND
+
+# Calls go through, outcomes are counted
+CLOSED = "closed"
+# Calls fail fast, until the reset timeout passes
+OPEN = "open"
+# A few trial calls go through, to find out if the shop recovered
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    """
+    A call was refused without being sent, as the shop's circuit is open.
+    """
+
+    def __init__(self, domain: str, retry_in: int):
+        """
+        Args:
+            domain: The shop's domain.
+            retry_in: The time in ms until a trial call is allowed.
+        """
+
+        super().__init__(f"Circuit for {domain} is open, calls are refused for {retry_in}ms")
+        self.domain = domain
+        self.retry_in = retry_in
+
+
+class Circuit:
+    """
+    The state of a shop in a `CircuitBreaker`.
+    """
+
+    __slots__ = ("state", "failures", "outcomes", "since", "trials")
+
+    def __init__(self, window: int):
+        self.state = CLOSED
+        # Number of failures in a row
+        self.failures = 0
+        # Outcomes of the last calls, True for a success
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        # Time in ms the circuit opened, or went half-open
+        self.since = 0
+        # Number of trial calls in flight while half-open
+        self.trials = 0
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per shop, so calls to a shop which is down or has revoked the token
+    fail fast with `CircuitOpenError`, instead of tying up workers with retries.
+
+    A shop's circuit opens after `failure_threshold` failures in a row, or when at least `error_rate`
+    of the last `window` calls failed. After `reset_timeout` ms it is half-open: `half_open_calls` trial calls
+    go through, a success closes the circuit and a failure opens it again.
+    Trial calls which do not land within `reset_timeout` ms make way for new ones.
+
+    Failures are responses with a 5xx status or a status in `failure_status`, and calls which raised.
+    Throttling (429) is left to the rate limiting.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        error_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        reset_timeout: int = 30 * ONE_SECOND,
+        half_open_calls: int = 1,
+        failure_status: FrozenSet[int] = frozenset([401, 402, 403, 423]),
+        max_shops: int = 10000,
+    ):
+        """
+        Args:
+            failure_threshold: Failures in a row which open the circuit.
+            error_rate: Fraction of failed calls in the window which opens the circuit.
+            window: Number of last calls the error rate is measured on.
+            min_calls: Calls needed in the window before the error rate is considered.
+            reset_timeout: Time in ms the circuit stays open before trial calls.
+            half_open_calls: Number of trial calls at once while half-open.
+            failure_status: Status codes below 500 which are failures, example: 401 for a revoked token.
+            max_shops: The number of shops to track, the least recently used are forgotten first.
+        """
+
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.failure_status = failure_status
+        self.max_shops = max_shops
+        self.container: "OrderedDict[str, Circuit]" = OrderedDict()
+        # Number of times a circuit opened
+        self.opened = 0
+        # Number of calls refused
+        self.rejected = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Circuits opened and calls refused so far, and the number of circuits open or half-open.
+        """
+
+        tripped = sum(1 for circuit in self.container.values() if circuit.state != CLOSED)
+        return {"opened": self.opened, "rejected": self.rejected, "tripped": tripped}
+
+    def _circuit(self, domain: str) -> Circuit:
+        circuit = self.container.get(domain)
+        if circuit is None:
+            circuit = Circuit(self.window)
+            self.container[domain] = circuit
+            if len(self.container) > self.max_shops:
+                self.container.popitem(last=False)
+        else:
+            self.container.move_to_end(domain)
+        return circuit
+
+    def state(self, domain: str) -> str:
+        """
+        The state of the shop's circuit: CLOSED, OPEN or HALF_OPEN.
+
+        Args:
+            domain: The shop's domain.
+        """
+
+        circuit = self.container.get(domain)
+        return CLOSED if circuit is None else circuit.state
+
+    def is_failure(self, status_code: int) -> bool:
+        """
+        Determine if a response's status is a failure of the shop.
+        """
+
+        return status_code >= 500 or status_code in self.failure_status
+
+    def allow(self, domain: str, now: int) -> None:
+        """
+        Let a call through, or raise `CircuitOpenError` if the shop's circuit is open.
+
+        Args:
+            domain: The shop's domain.
+            now: The current time in ms.
+        """
+
+        circuit = self._circuit(domain)
+        if circuit.state == CLOSED:
+            return
+
+        retry_in = circuit.since + self.reset_timeout - now
+        if circuit.state == OPEN:
+            if retry_in > 0:
+                self.rejected += 1
+                raise CircuitOpenError(domain, retry_in)
+            self._half_open(circuit, now)
+        elif circuit.trials >= self.half_open_calls:
+            if retry_in > 0:
+                # Trial calls are still in flight
+                self.rejected += 1
+                raise CircuitOpenError(domain, retry_in)
+            # Trial calls never landed, start new ones
+            self._half_open(circuit, now)
+        circuit.trials += 1
+
+    def record(self, domain: str, success: bool, now: int) -> None:
+        """
+        Record the outcome of a call which was let through.
+
+        Args:
+            domain: The shop's domain.
+            success: If the call succeeded.
+            now: The current time in ms.
+        """
+
+        circuit = self._circuit(domain)
+        if circuit.state == OPEN:
+            # A call from before the circuit opened, nothing new
+            return
+
+        if circuit.state == HALF_OPEN:
+            if success:
+                circuit.state = CLOSED
+                circuit.failures = 0
+                circuit.outcomes.clear()
+            else:
+                self._open(circuit, now)
+            return
+
+        circuit.outcomes.append(success)
+        circuit.failures = 0 if success else circuit.failures + 1
+        if success:
+            return
+
+        failed = circuit.outcomes.count(False)
+        if (
+            circuit.failures >= self.failure_threshold or
+            (len(circuit.outcomes) >= self.min_calls and failed / len(circuit.outcomes) >= self.error_rate)
+        ):
+            self._open(circuit, now)
+
+    def release(self, domain: str) -> None:
+        """
+        Forget a call which was let through but never completed (cancelled), freeing its trial.
+
+        Args:
+            domain: The shop's domain.
+        """
+
+        circuit = self.container.get(domain)
+        if circuit is not None and circuit.state == HALF_OPEN:
+            circuit.trials = max(circuit.trials - 1, 0)
+
+    def _open(self, circuit: Circuit, now: int) -> None:
+        circuit.state = OPEN
+        circuit.since = now
+        circuit.trials = 0
+        self.opened += 1
+
+    def _half_open(self, circuit: Circuit, now: int) -> None:
+        circuit.state = HALF_OPEN
+        circuit.since = now
+        circuit.trials = 0
@@ -0,0 +1,155 @@
+import math
+from collections import OrderedDict
+from typing import List, Union
+
+from .constants import ONE_SECOND
+from .types import StoreValue
+
+
+class LeakyBucket:
+    """
+    Model of Shopify's leaky bucket, used for both REST calls and GraphQL cost.
+
+    The bucket holds `level` units out of `capacity` and leaks `leak_rate` units per second.
+    A call may go through as long as its units fit into the room left in the bucket.
+    """
+
+    def __init__(self, capacity: float, leak_rate: float, level: float = 0.0, updated_at: int = 0):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.level = level
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_values(cls, values: List[StoreValue], capacity: float, leak_rate: float) -> "LeakyBucket":
+        """
+        Rebuild a bucket from the values saved in a store.
+        If nothing was saved yet, an empty bucket is created with the supplied capacity and leak rate.
+
+        Args:
+            values: The values from the store.
+            capacity: The default capacity of the bucket.
+            leak_rate: The default leak rate (units per second) of the bucket.
+        """
+
+        if len(values) < 4:
+            return cls(capacity, leak_rate)
+        return cls(*values[:4])
+
+    def to_values(self) -> List[StoreValue]:
+        """
+        Values to save into a store.
+        """
+
+        return [self.capacity, self.leak_rate, self.level, self.updated_at]
+
+    @property
+    def available(self) -> float:
+        """
+        The room left in the bucket.
+        """
+
+        return self.capacity - self.level
+
+    def leak(self, now: int) -> None:
+        """
+        Leak the bucket for the time passed since the last update.
+
+        Args:
+            now: The current time in ms.
+        """
+
+        elapsed = max(now - self.updated_at, 0)
+        self.level = max(self.level - (elapsed * self.leak_rate / ONE_SECOND), 0.0)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> Union[bool, int]:
+        """
+        Reserve room in the bucket for a call.
+
+        If the room is available, it is taken and False is returned.
+        If not, nothing is taken and the time in ms until the room is available is returned.
+
+        Args:
+            amount: The units the call requires.
+        """
+
+        # A call can never require more than the whole bucket
+        amount = min(amount, self.capacity)
+        overflow = self.level + amount - self.capacity
+        if overflow <= 0:
+            self.level += amount
+            return False
+        return math.ceil(overflow / self.leak_rate * ONE_SECOND)
+
+    def release(self, amount: float) -> None:
+        """
+        Give back units which were reserved but not used.
+
+        Args:
+            amount: The units to give back.
+        """
+
+        self.level = max(self.level - amount, 0.0)
+
+    def sync(self, level: float, capacity: float, leak_rate: float) -> None:
+        """
+        Bring the bucket in line with what Shopify reported.
+
+        The higher of the two levels is kept, as the local level also includes
+        calls which are still in-flight and not yet seen by Shopify.
+
+        Args:
+            level: The level reported by Shopify.
+            capacity: The capacity reported by Shopify.
+            leak_rate: The leak rate (units per second) for the capacity.
+        """
+
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.level = max(self.level, level)
+
+
+class CostEstimator:
+    """
+    Remembers the "requestedQueryCost" of GraphQL queries, so the cost
+    can be reserved in the bucket before the query is sent again.
+    """
+
+    def __init__(self, default: int = 50, max_size: int = 1000):
+        """
+        Args:
+            default: The cost to use for queries which were never sent before.
+            max_size: The number of queries to remember, the least recently used are forgotten first.
+        """
+
+        self.default = default
+        self.max_size = max_size
+        self.container: "OrderedDict[str, int]" = OrderedDict()
+
+    def estimate(self, query: str) -> int:
+        """
+        Get the estimated cost of a query.
+
+        Args:
+            query: The GraphQL query.
+        """
+
+        if query not in self.container:
+            return self.default
+        self.container.move_to_end(query)
+        return self.container[query]
+
+    def update(self, query: str, cost: int) -> None:
+        """
+        Remember the requested cost of a query.
+
+        Args:
+            query: The GraphQL query.
+            cost: The "requestedQueryCost" reported by Shopify.
+        """
+
+        self.container[query] = int(cost)
+        self.container.move_to_end(query)
+        if len(self.container) > self.max_size:
+            self.container.popitem(last=False)
@@ -0,0 +1,267 @@
+import math
+from typing import (IO, Any, AsyncIterable, AsyncIterator, Callable, Dict,
+                    Iterable, Iterator, List, Optional, Tuple, Union)
+
+from .codec import JsonCodec
+
+# Key in bulk operation results linking a child row to its parent
+PARENT_KEY = "__parentId"
+# Key in bulk mutation results with the line of the input the result is for
+LINE_NUMBER_KEY = "__lineNumber"
+# Key to nest child rows under when their type can not be determined
+CHILDREN_KEY = "__children"
+# Bytes of JSONL to gather before sending a chunk of a bulk mutation upload
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Rows for a bulk mutation, sync or async
+BulkRows = Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]]
+
+
+def children_key(row: Dict[str, Any]) -> str:
+    """
+    Key to nest a child row under in its parent, taken from the type of its global ID.
+    Example: "gid://shopify/LineItem/1" is nested under "LineItem".
+    """
+
+    gid = row.get("id")
+    if isinstance(gid, str) and gid.startswith("gid://"):
+        return gid.split("/")[3]
+    return CHILDREN_KEY
+
+
+def assemble_bulk_rows(
+    rows: Iterable[Dict[str, Any]],
+    key: Optional[Callable[[Dict[str, Any]], str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Nest the flattened rows of a bulk query back into their parents.
+
+    Shopify writes a parent before its children, and all of a top-level object's
+    descendants before the next top-level object. So each top-level object is
+    yielded, fully nested, as soon as the next one starts, and only one
+    top-level object is held in memory at a time.
+
+    Args:
+        rows: The rows of the bulk query results, example: the reader from `download_bulk_results`.
+        key: Returns the key to nest a child row under in its parent; default: `children_key`.
+
+    Raises:
+        ValueError: If a child row comes before its parent.
+    """
+
+    key = key or children_key
+    current = None
+    # IDs of the current top-level object and its descendants
+    index: Dict[str, Dict[str, Any]] = {}
+
+    for row in rows:
+        parent_id = row.pop(PARENT_KEY, None)
+        if parent_id is None:
+            # New top-level object, the previous one is complete
+            if current is not None:
+                yield current
+            current = row
+            index.clear()
+        else:
+            parent = index.get(parent_id)
+            if parent is None:
+                raise ValueError(f"Parent {parent_id} not found, results are not in order")
+            parent.setdefault(key(row), []).append(row)
+
+        if "id" in row:
+            index[row["id"]] = row
+
+    if current is not None:
+        yield current
+
+
+def join_bulk_results(
+    files: List[IO[bytes]],
+    counts: List[int],
+    loads: Callable[[bytes], Any],
+    dumps: Callable[[Any], bytes],
+) -> Iterator[bytes]:
+    """
+    Join the result files of a bulk mutation sent in shards, in order, as JSONL lines.
+
+    Each shard numbers its "__lineNumber" from 0, they are shifted by the rows of the shards before,
+    so a result matches the line of its row as if every row was sent in one file.
+    Each file is closed once read.
+
+    Args:
+        files: The result files, one per shard.
+        counts: The number of rows of each shard.
+        loads: Decodes a line.
+        dumps: Encodes a row.
+    """
+
+    offset = 0
+    try:
+        for index, file in enumerate(files):
+            for line in file:
+                if offset and line.strip():
+                    row = loads(line)
+                    if isinstance(row, dict) and LINE_NUMBER_KEY in row:
+                        row[LINE_NUMBER_KEY] += offset
+                        line = dumps(row) + b"\n"
+                yield line
+            file.close()
+            offset += counts[index]
+    finally:
+        for file in files:
+            file.close()
+
+
+async def iterate_rows(rows: BulkRows) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Iterate sync or async rows the same way.
+    """
+
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+class JsonlShards:
+    """
+    Split rows into shards of JSONL of at most `max_size` bytes, encoded as the rows are read.
+    A single row larger than `max_size` is given a shard of its own.
+
+    Each shard must be read fully before the next one is started.
+    """
+
+    def __init__(
+        self,
+        rows: BulkRows,
+        key: Optional[str] = None,
+        max_size: float = math.inf,
+        dumps: Optional[Callable[[Any], bytes]] = None,
+    ):
+        """
+        Args:
+            rows: The rows to encode.
+            key: Wrap each row in a dict under this key, example: the "input" variable of the mutation.
+            max_size: The maximum bytes of a shard.
+            dumps: Encodes a row to JSON, example: `options.json_codec.dumps`; default: the standard library.
+        """
+
+        self.rows = iterate_rows(rows)
+        self.key = key
+        self.dumps = dumps or JsonCodec().dumps
+        self.max_size = max_size
+        # Line read which did not fit into the previous shard
+        self.pending: Optional[bytes] = None
+        self.shards = 0
+        # Number of rows in each completed shard
+        self.counts: List[int] = []
+
+    async def _next_line(self) -> Optional[bytes]:
+        if self.pending is not None:
+            line, self.pending = self.pending, None
+            return line
+
+        try:
+            row = await self.rows.__anext__()
+        except StopAsyncIteration:
+            return None
+        return self.dumps({self.key: row} if self.key is not None else row) + b"\n"
+
+    async def has_next(self) -> bool:
+        """
+        Determine if there are rows left for another shard.
+        """
+
+        if self.pending is None:
+            self.pending = await self._next_line()
+        return self.pending is not None
+
+    async def shard(self) -> AsyncIterator[bytes]:
+        """
+        Encode the next shard, yielding chunks of about UPLOAD_CHUNK_SIZE bytes as the rows are read.
+        """
+
+        self.shards += 1
+        lines: List[bytes] = []
+        size = total = count = 0
+        while True:
+            line = await self._next_line()
+            if line is None:
+                break
+            if total and total + len(line) > self.max_size:
+                # Full, keep the line for the next shard
+                self.pending = line
+                break
+
+            lines.append(line)
+            size += len(line)
+            total += len(line)
+            count += 1
+            if size >= UPLOAD_CHUNK_SIZE:
+                yield b"".join(lines)
+                lines, size = [], 0
+
+        if lines:
+            yield b"".join(lines)
+        self.counts.append(count)
+
+
+def multipart_envelope(boundary: str, fields: Dict[str, str], filename: str) -> Tuple[bytes, bytes]:
+    """
+    The bytes of a multipart/form-data body before and after the file content,
+    so the length of the body is known before the content is sent.
+
+    Args:
+        boundary: The multipart boundary, also sent in the Content-Type header.
+        fields: The form fields to send before the file.
+        filename: The name of the file.
+    """
+
+    head = "".join(
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+        f"{value}\r\n"
+        for name, value in fields.items()
+    )
+    head += (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    )
+    return head.encode("utf-8"), f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+
+async def encode_multipart(
+    boundary: str,
+    fields: Dict[str, str],
+    filename: str,
+    content: AsyncIterator[bytes],
+) -> AsyncIterator[bytes]:
+    """
+    Encode a multipart/form-data body with a file, streaming the file content as it is produced.
+
+    Args:
+        boundary: The multipart boundary, also sent in the Content-Type header.
+        fields: The form fields to send before the file.
+        filename: The name of the file.
+        content: The chunks of the file.
+    """
+
+    head, tail = multipart_envelope(boundary, fields, filename)
+    yield head
+    async for chunk in content:
+        yield chunk
+    yield tail
+
+
+async def read_chunks(file: IO[bytes], size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Read a file in chunks of `size` bytes, to stream it as an upload.
+    """
+
+    while True:
+        chunk = file.read(size)
+        if not chunk:
+            break
+        yield chunk
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+from httpx import Request, Response
+
+# Finds mutations in a GraphQL document, their responses are never cached
+MUTATION_PATTERN = re.compile(r"\bmutation\b")
+# Headers which describe the body as it was sent, not as it is cached
+STRIPPED_HEADERS = frozenset(["content-encoding", "content-length", "transfer-encoding"])
+
+
+class CachedResponse:
+    """
+    A response kept by a `ResponseCache`, with its body already decoded.
+    """
+
+    __slots__ = ("url", "status_code", "headers", "content", "stored_at")
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int,
+        headers: List[Tuple[str, str]],
+        content: bytes,
+        stored_at: float,
+    ):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.stored_at = stored_at
+
+    @classmethod
+    def from_response(cls, response: Response, stored_at: float) -> "CachedResponse":
+        """
+        Keep a response from HTTPX.
+
+        Args:
+            response: The response.
+            stored_at: The current time in seconds.
+        """
+
+        headers = [(name, value) for name, value in response.headers.items() if name not in STRIPPED_HEADERS]
+        return cls(str(response.request.url), response.status_code, headers, response.content, stored_at)
+
+    @property
+    def etag(self) -> Optional[str]:
+        for name, value in self.headers:
+            if name == "etag":
+                return value
+        return None
+
+    def to_response(self, headers: Optional[List[Tuple[str, str]]] = None) -> Response:
+        """
+        Rebuild the response for HTTPX.
+
+        Args:
+            headers: Headers to use over the kept ones, example: the headers of a 304 response.
+        """
+
+        merged = dict(self.headers)
+        for name, value in headers or []:
+            if name not in STRIPPED_HEADERS:
+                merged[name] = value
+        return Response(
+            status_code=self.status_code,
+            headers=list(merged.items()),
+            content=self.content,
+            request=Request("GET", self.url),
+        )
+
+
+class ResponseCache(ABC):
+    """
+    Cache of responses to REST GET calls and GraphQL queries, keyed by shop and request.
+
+    A response younger than `ttl` seconds is returned without calling Shopify or taking from the limits.
+    An older response with an ETag is revalidated with `If-None-Match`, and kept for up to `max_age` seconds.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 60.0,
+        max_age: float = 3600.0,
+        max_size: int = 1000,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            ttl: Seconds a response is used without asking Shopify.
+            max_age: Seconds a response is kept for revalidation.
+            max_size: Number of responses to keep, the least recently used are forgotten first.
+            clock: Source of the current time in seconds.
+        """
+
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_size = max_size
+        self.clock = clock
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """
+        Build a key from the parts of a request.
+        """
+
+        encoded = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+    def fresh(self, entry: CachedResponse) -> bool:
+        """
+        Determine if a response can be used without asking Shopify.
+        """
+
+        return self.clock() - entry.stored_at <= self.ttl
+
+    def expired(self, entry: CachedResponse) -> bool:
+        """
+        Determine if a response is too old to keep.
+        """
+
+        return self.clock() - entry.stored_at > self.max_age
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Get a response, None if it is not kept or expired.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def set(self, key: str, entry: CachedResponse) -> None:
+        """
+        Keep a response.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        Forget a response.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Forget every response.
+        """
+
+        pass  # pragma: no cover
+
+
+class MemoryCache(ResponseCache):
+    """
+    Response cache in memory, per process.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.container: "OrderedDict[str, CachedResponse]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self.container.get(key)
+        if entry is None:
+            return None
+        if self.expired(entry):
+            del self.container[key]
+            return None
+        self.container.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        self.container[key] = entry
+        self.container.move_to_end(key)
+        while len(self.container) > self.max_size:
+            self.container.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self.container.pop(key, None)
+
+    def clear(self) -> None:
+        self.container.clear()
+
+
+class DiskCache(ResponseCache):
+    """
+    Response cache in a SQLite file on local disk, kept between runs and shared between processes.
+    """
+
+    def __init__(self, path: str, *args: Any, **kwargs: Any):
+        """
+        Args:
+            path: The path of the SQLite file, created if missing.
+        """
+
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, url TEXT, status_code INTEGER, headers TEXT, content BLOB, "
+            "stored_at REAL, used_at REAL)"
+        )
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT url, status_code, headers, content, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            url, status_code, headers, content, stored_at = row
+            entry = CachedResponse(url, status_code, [tuple(pair) for pair in json.loads(headers)], content, stored_at)
+            if self.expired(entry):
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self.connection.execute("UPDATE responses SET used_at = ? WHERE key = ?", (self.clock(), key))
+            return entry
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    entry.url,
+                    entry.status_code,
+                    json.dumps(entry.headers),
+                    entry.content,
+                    entry.stored_at,
+                    self.clock(),
+                ),
+            )
+            # Forget the least recently used past the size
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        """
+        Close the SQLite file.
+        """
+
+        self.connection.close()
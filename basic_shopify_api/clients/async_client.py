@@ -1,25 +1,32 @@
 import asyncio
-from typing import Any
+import inspect
+from typing import IO, Any, AsyncIterator, Awaitable, Callable, Iterator
 from . import ApiCommon
 import logging
 from ..options import Options
-from ..models import ApiResult, RestResult, Session
-from ..constants import REST, GRAPHQL
+from ..models import ApiResult, BulkProgress, RestResult, Session
+from ..constants import ONE_SECOND, REST, GRAPHQL
+from ..cache import CachedResponse
+from ..bulk import (BulkRows, JsonlShards, assemble_bulk_rows, encode_multipart, join_bulk_results,
+                    multipart_envelope, read_chunks)
 from httpx import AsyncClient as AsyncHttpxClient
 from httpx._types import HeaderTypes, QueryParamTypes
 from httpx._models import Response
-from pathlib import Path
+from ..queries import GQL_DIR, queries  # noqa: F401
 from httpx import Response as HttpxResponse
 import jsonlines
-from io import BytesIO
 import uuid
-import httpx
+import tempfile
+import math
+from weakref import WeakValueDictionary
 
 
-GQL_DIR = Path(__file__).parent.parent / "gql"
-
 logger = logging.getLogger(__name__)
 
+# Locks to serialize bucket reservations per store and shop, shared between clients
+BUCKET_LOCKS: "WeakValueDictionary[tuple, asyncio.Lock]" = WeakValueDictionary()
+
+
 class AsyncClient(AsyncHttpxClient, ApiCommon):
     """
     Sync client, extends the common client and HTTPX.
@@ -37,145 +44,264 @@ class AsyncClient(AsyncHttpxClient, ApiCommon):
 
         self.session = session
         self.options = options
+        # Headers sent with every request, built on first use
+        self._prebuilt_headers = None
+        self._prebuilt_source = None
+        # Client for bulk uploads and downloads, created on first use
+        self._transfers: AsyncHttpxClient | None = None
+        if self.options.transport is not None and "transport" not in kwargs:
+            kwargs["transport"] = self.options.transport.borrow()
         super().__init__(
             base_url=self.session.base_url,
             auth=None if self.options.is_public else (self.session.key, self.session.password),
             **kwargs
         )
 
+    @property
+    def transfers(self) -> AsyncHttpxClient:
+        """
+        Client for bulk uploads and downloads to the storage host, kept open for reuse.
+
+        It sends no auth, and uses `options.transport` when set.
+        """
+        if self._transfers is None:
+            transport = self.options.transport.borrow() if self.options.transport is not None else None
+            self._transfers = AsyncHttpxClient(transport=transport)
+        return self._transfers
+
+    async def aclose(self) -> None:
+        """
+        Close the client, and the client for bulk transfers if it was used.
+        """
+        if self._transfers is not None:
+            await self._transfers.aclose()
+        await super().aclose()
+
+    async def __aexit__(self, *args: Any) -> None:
+        """
+        Exit the context, closing the client for bulk transfers as well: HTTPX does not call `aclose` here.
+        """
+        if self._transfers is not None:
+            await self._transfers.aclose()
+        await super().__aexit__(*args)
+
+    def _bucket_lock(self, api: str) -> asyncio.Lock:
+        """
+        Get the lock for the bucket of the API type for the session.
+
+        Only one coroutine per shop can wait on a bucket at a time, the rest
+        queue behind it in order of arrival. This prevents concurrent calls from
+        all seeing the same room in the bucket, and keeps waiting fair.
+
+        Args:
+            api: The API type, REST or GRAPHQL.
+        """
+
+        store = self.options.rest_bucket_store if api == REST else self.options.graphql_bucket_store
+        key = (id(store), self.session.domain)
+        lock = BUCKET_LOCKS.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            BUCKET_LOCKS[key] = lock
+        return lock
+
     async def _rest_rate_limit(self) -> None:
         """
         Handle rate limiting of REST.
         """
 
-        limiting_required = self._rest_rate_limit_required()
-        if limiting_required is not False:
-            # Rate limit was determined to be required, sleep for X ms
-            await self.options.deferrer.asleep(limiting_required)
+        async with self._bucket_lock(REST):
+            limiting_required = self._rest_rate_limit_required()
+            while limiting_required is not False:
+                # Rate limit was determined to be required, sleep for X ms and try again
+                await self.options.deferrer.asleep(limiting_required)
+                limiting_required = self._rest_rate_limit_required()
 
-    async def _graphql_cost_limit(self) -> None:
+    async def _graphql_cost_limit(self, cost: int) -> None:
         """
         Handle cost limiting for GraphQL.
         """
 
-        limiting_required = self._graphql_cost_limit_required()
-        if limiting_required is not False:
-            # Cost limit was determined to be required, sleep for X ms
-            await self.options.deferrer.asleep(limiting_required)
+        async with self._bucket_lock(GRAPHQL):
+            limiting_required = self._graphql_cost_limit_required(cost)
+            while limiting_required is not False:
+                # Cost limit was determined to be required, sleep for X ms and try again
+                await self.options.deferrer.asleep(limiting_required)
+                limiting_required = self._graphql_cost_limit_required(cost)
 
     async def _rest_pre_actions(self, **kwargs) -> None:
         """
-        Actions which fire before REST API call.
+        Actions which fire before REST API call, once for the call and its retries.
         """
 
-        # Determine if rate limiting is required and handle it
-        await self._rest_rate_limit()
-        # Add to the request times
-        self.options.time_store.append(self.session, self.options.deferrer.current_time())
         # Run user-defined actions and pass in the request built
         [await meth(self, **kwargs) for meth in self.options.rest_pre_actions]
 
     async def _graphql_pre_actions(self, **kwargs) -> None:
         """
-        Actions which fire before GraphQL API call.
+        Actions which fire before GraphQL API call, once for the call and its retries.
         """
 
-        # Determine if cost limiting is required and handle it
-        await self._graphql_cost_limit()
-        # Add to the request times
-        self.options.time_store.append(self.session, self.options.deferrer.current_time())
         # Run user-defined actions and pass in the request built
         [await meth(self, **kwargs) for meth in self.options.graphql_pre_actions]
 
-    async def _rest_post_actions(self, response: Response, retries: int) -> RestResult:
+    async def _rest_post_actions(self, result: RestResult) -> RestResult:
         """
-        Actions which fire after REST API call.
+        Actions which fire after REST API call, once with the result of the last attempt.
         """
 
-        # Parse the response from HTTPX
-        result = self._parse_response(REST, response, retries)
         # Run user-defined actions and pass in the result object
         [await meth(self, result) for meth in self.options.rest_post_actions]
         return result
 
-    async def _graphql_post_actions(self, response: Response, retries: int) -> ApiResult:
+    async def _graphql_post_actions(self, result: ApiResult) -> ApiResult:
         """
-        Actions which fire after GraphQL API call.
+        Actions which fire after GraphQL API call, once with the result of the last attempt.
         """
 
-        # Parse the response from HTTPX
-        result = self._parse_response(GRAPHQL, response, retries)
-        # Add to the costs
-        self._cost_update(result.body)
         # Run user-defined actions and pass in the result object
         [await meth(self, result) for meth in self.options.graphql_post_actions]
         return result
 
-    def _retry_request(meth: callable) -> callable:
+    async def _rest_attempt(
+        self,
+        meth: Callable[..., Awaitable[Response]],
+        kwargs: dict,
+        cached: CachedResponse | None,
+        retries: int,
+    ) -> RestResult:
+        """
+        One attempt of a REST API call: rate limited, sent, and the bucket brought in line with Shopify's.
         """
-        Determine if retry is required.
 
-        If it is, retry the request.
-        If not, return the result.
+        # Fail fast if the shop is failing, then determine if rate limiting is required and handle it
+        self._circuit_check()
+        await self._rest_rate_limit()
+        # Run the call
+        try:
+            response = await meth(**self._encode_request(kwargs))
+        except BaseException as e:
+            # Call never completed (cancelled or failed), give back the reservation
+            self._bucket_release(REST, 1)
+            self._circuit_record(None, e)
+            raise
+        self._circuit_record(response)
+        # Bring the bucket in line with Shopify's
+        self._rest_bucket_update(response.headers)
+        # Parse the response from HTTPX
+        return self._parse_response(REST, self._cache_revalidate(cached, response), retries)
+
+    async def _graphql_attempt(
+        self,
+        query: str,
+        kwargs: dict,
+        cached: CachedResponse | None,
+        retries: int,
+    ) -> ApiResult:
+        """
+        One attempt of a GraphQL call: cost limited, sent, and the reserved cost swapped for the actual cost.
+        """
+
+        # Fail fast if the shop is failing, then estimate the cost of the query to reserve and handle cost limiting
+        self._circuit_check()
+        cost = self.options.cost_estimator.estimate(query)
+        await self._graphql_cost_limit(cost)
+        # Run the call
+        try:
+            response = await self.post(**self._encode_request(kwargs))
+        except BaseException as e:
+            # Call never completed (cancelled or failed), give back the reservation
+            self._bucket_release(GRAPHQL, cost)
+            self._circuit_record(None, e)
+            raise
+        self._circuit_record(response)
+        response = self._cache_revalidate(cached, response)
+        # Parse the response from HTTPX, decoding the body once for the result and the cost
+        decoded = self._decode(response)
+        result = self._parse_response(GRAPHQL, response, retries, decoded)
+        # Swap the reserved cost for the actual cost
+        self._cost_update(decoded[0], query, cost)
+        return result
+
+    def _shares_responses(self) -> bool:
+        """
+        Determine if responses are shared between calls, by the response cache or single-flight,
+        so requests need a key
         """
+        return self.options.response_cache is not None or self.options.single_flight is not None
 
-        async def wrapper(*args, **kwargs) -> ApiResult:
-            # Get the instance
-            inst: AsyncClient = args[0]
-            # Get the number of retries so far
-            retries = kwargs.get("_retries", 0)
-            # Run the call (rest or graphql)
-            result: ApiResult = await meth(*args, **kwargs)
-            # Get the response and determine if retry is required
-            response = result.response
-            retry = inst._retry_required(response, retries)
+    async def _single_flight(self, key: str | None, send: Callable[[], Awaitable[ApiResult]]) -> ApiResult:
+        """
+        Send a request, sharing the call and its result with identical read requests already in flight
+        when `options.single_flight` is set.
+        """
+        flights = self.options.single_flight
+        if flights is None or key is None:
+            return await send()
+        return await flights.run(key, send)
 
-            if retry is not False:
-                # Retry is needed, sleep for X ms
-                await inst.options.deferrer.asleep(retry)
+    async def _retry_request(self, attempt: Callable[[int], Awaitable[ApiResult]]) -> ApiResult:
+        """
+        Run attempts of a call until no retry is required, waiting between them, and return the last result.
 
-                # Re-run the request
-                kwargs["_retries"] = retries + 1
-                inst_meth = getattr(inst, meth.__name__)
-                return await inst_meth(*args[1:], **kwargs)
-            return result
-        return wrapper
+        :param attempt: Runs one attempt, given the number of retries so far
+        """
+        deadline = self._retry_deadline()
+        retries = 0
+        while True:
+            result = await attempt(retries)
+            retry = self._retry_delay(result.response, retries, result, deadline)
+            if retry is False:
+                return result
+
+            # Retry is needed, sleep for X ms
+            await self.options.deferrer.asleep(retry)
+            retries += 1
 
-    @_retry_request
     async def rest(
         self,
         method: str,
         path: str,
         params: QueryParamTypes = None,
         headers: HeaderTypes = {},
-        _retries: int = 0
+        cache: bool = True,
     ) -> RestResult:
         """
         Fire a REST API call.
+        GET calls go through `options.response_cache` if set, unless `cache` is False.
         """
 
         # Dynamically map to HTTPX's method for get/post/put/etc
         meth = getattr(self, method)
         # Build the request based on the method and inputs
         kwargs = self._build_request(method, path, params, headers)
-        # Run the pre-actions
-        await self._rest_pre_actions(**kwargs)
+        # Use the cached response if still fresh, skipping the call and the limits
+        key = self._request_key(REST, method, kwargs) if self._shares_responses() else None
+        cached = self._cache_lookup(key, kwargs) if cache else None
+        if self._cache_hit(cached):
+            return self._parse_response(REST, cached.to_response(), 0)
+
+        async def send() -> RestResult:
+            # Run the pre-actions, the call with its retries, and the post-actions, and return the result
+            self._headers_for_actions(kwargs, self.options.rest_pre_actions)
+            await self._rest_pre_actions(**kwargs)
+            result = await self._retry_request(lambda retries: self._rest_attempt(meth, kwargs, cached, retries))
+            result = await self._rest_post_actions(result)
+            self._cache_store(key if cache else None, result)
+            return result
 
-        # Run the call and post-actions, and return the result
-        response = await meth(**kwargs)
-        result = await self._rest_post_actions(response, _retries)
-        return result
+        return await self._single_flight(key, send)
 
-    @_retry_request
     async def graphql(
         self,
         query: str,
         variables: dict = None,
         headers: HeaderTypes = {},
-        _retries: int = 0,
+        cache: bool = True,
     ) -> ApiResult:
         """
         Fire a GraphQL call.
+        Queries go through `options.response_cache` if set, unless `cache` is False.
         """
 
         # Build the request
@@ -185,13 +311,22 @@ class AsyncClient(AsyncHttpxClient, ApiCommon):
             {"query": query, "variables": variables},
             headers,
         )
-        # Run the pre-actions
-        await self._graphql_pre_actions(**kwargs)
+        # Use the cached response if still fresh, skipping the call and the limits
+        key = self._request_key(GRAPHQL, "post", kwargs) if self._shares_responses() else None
+        cached = self._cache_lookup(key, kwargs) if cache else None
+        if self._cache_hit(cached):
+            return self._parse_response(GRAPHQL, cached.to_response(), 0)
+
+        async def send() -> ApiResult:
+            # Run the pre-actions, the call with its retries, and the post-actions, and return the result
+            self._headers_for_actions(kwargs, self.options.graphql_pre_actions)
+            await self._graphql_pre_actions(**kwargs)
+            result = await self._retry_request(lambda retries: self._graphql_attempt(query, kwargs, cached, retries))
+            result = await self._graphql_post_actions(result)
+            self._cache_store(key if cache else None, result)
+            return result
 
-        # Run the call and post-actions, and return the result
-        response = await self.post(**kwargs)
-        result = await self._graphql_post_actions(response, _retries)
-        return result
+        return await self._single_flight(key, send)
 
     async def graphql_call_with_pagination(
         self, entity: str, query: str, variables: dict[str, Any] = {}, max_limit: int | None = None
@@ -205,49 +340,87 @@ class AsyncClient(AsyncHttpxClient, ApiCommon):
 
         :return: A list of entity data
         """
-        has_next_page = True
-        end_cursor: str | None = None
-        data = []
+        try:
+            return [node async for node in self.graphql_stream_with_pagination(entity, query, variables, max_limit)]
+        except ValueError:
+            return None
 
-        query = self.parse_query(query)
-        
-        while has_next_page:
-            variables["cursor"] = end_cursor
-
-            response = await self.graphql(query, variables)
-            if not response.body:
-                return None
-
-            entity_path = entity.split(".")
-            entity_data = response.body.get("data", {})
+    async def graphql_stream_with_pagination(
+        self,
+        entity: str,
+        query: str,
+        variables: dict[str, Any] = {},
+        max_limit: int | None = None,
+        pages: bool = False,
+    ) -> AsyncIterator[dict[str, Any] | list[dict[str, Any]]]:
+        """
+        Make a graphql query with pagination, yielding the entity data as each page arrives.
+        The next page is fetched while the current page is being processed.
 
-            for key in entity_path:
-                entity_data = entity_data.get(key, {})
-                if not entity_data:
-                    return None
+        If you stop iterating early, close the generator (e.g. `contextlib.aclosing`)
+        so the page being fetched ahead is cancelled.
 
-            page_info = entity_data.get("pageInfo", {})
+        :param entity: The entity to fetch, e.g "products", "orders"
+        :param query: The query to run
+        :param variables: The variables to pass to the query
+        :param max_limit: The maximum number of nodes to yield
+        :param pages: Yield a list of nodes per page, instead of each node
 
-            has_next_page = page_info.get("hasNextPage", False)
-            end_cursor = page_info.get("endCursor", None)
-            entity_data.pop("pageInfo", None)
+        :return: An async iterator of entity data
+        :raises ValueError: If a page has errors or no data for the entity
+        """
+        query = queries.parse(query)
+        entity_path = entity.split(".")
+        remaining = max_limit or None
+
+        request = asyncio.ensure_future(self.graphql(query, {**variables, "cursor": None}))
+        try:
+            while request is not None:
+                response = await request
+                request = None
+                nodes, has_next_page, end_cursor = self._pagination_page(response, entity_path)
+
+                if remaining is not None:
+                    nodes = nodes[:remaining]
+                    remaining -= len(nodes)
+                if has_next_page and (remaining is None or remaining > 0):
+                    # Fetch the next page while this one is processed
+                    request = asyncio.ensure_future(self.graphql(query, {**variables, "cursor": end_cursor}))
+
+                if pages:
+                    yield nodes
+                else:
+                    for node in nodes:
+                        yield node
+        finally:
+            if request is not None:
+                request.cancel()
+
+    @staticmethod
+    def _pagination_page(response: ApiResult, entity_path: list[str]) -> tuple[list[dict[str, Any]], bool, str | None]:
+        """
+        Get the nodes, if there is a next page, and the end cursor from a page of results
+        """
+        if not response.body:
+            raise ValueError(response.errors)
 
-            for edge in entity_data.get("edges", []):
-                data.append(edge.get("node", {}))
+        entity_data = response.body.get("data", {})
+        for key in entity_path:
+            entity_data = entity_data.get(key, {})
+            if not entity_data:
+                raise ValueError(f"No data found for {'.'.join(entity_path)}")
 
-            if max_limit and len(data) >= max_limit:
-                return data[:max_limit]
+        page_info = entity_data.get("pageInfo", {})
+        nodes = [edge.get("node", {}) for edge in entity_data.get("edges", [])]
+        return nodes, page_info.get("hasNextPage", False), page_info.get("endCursor", None)
 
-        return data
-    
     async def is_bulk_job_running(self, job_type: str) -> bool:
         """
         Check if a bulk operation is running
         job_type: "QUERY" or "MUTATION"
         """
-        query = open(GQL_DIR / "current_bulkoperation.gql").read() % {"job_type": job_type}
-        query = self.parse_query(query)
-        response = await self.graphql(query)
+        query = queries.render("current_bulkoperation", job_type=job_type)
+        response = await self.graphql(query, cache=False)
         if response.errors:
             raise ValueError(response.errors)
         current_bulk_operation = response.body["data"]["currentBulkOperation"]
@@ -256,51 +429,181 @@ class AsyncClient(AsyncHttpxClient, ApiCommon):
 
         return False
 
-    async def poll_until_complete(self, job_id: str, job_type: str) -> HttpxResponse:
+    async def wait_until_complete(
+        self,
+        job_id: str,
+        job_type: str,
+        progress: Callable[[BulkProgress], Any] | None = None,
+        timeout: int | None = None,
+        expected_count: int | None = None,
+    ) -> dict[str, Any]:
+        """
+        Poll the bulk operation by its ID until it is complete, then return the bulk operation
+
+        Polling backs off while the job runs, each wait being `options.bulk_poll_backoff` of the time spent
+        so far, kept between `options.bulk_poll_interval` and `options.bulk_poll_max_interval`.
+        The wait is doubled while less than half of the GraphQL cost budget is left,
+        and is cut short when the job is expected to complete sooner, which needs `expected_count`.
+        Shopify gives no total for queries, so only mutations, which know their rows, get an ETA.
+
+        :param job_id: The ID of the bulk operation
+        :param job_type: "QUERY" or "MUTATION", for logging
+        :param progress: Called (or awaited) with a BulkProgress after each poll
+        :param timeout: Time in ms to wait before raising TimeoutError; default: `options.bulk_poll_timeout`
+        :param expected_count: The number of objects the job will process, to estimate the time to completion;
+            without it there is no ETA
         """
-        Poll the bulk operation until it is complete, then return the dataframe
+        query = queries.render("bulkoperation")
+        timeout = self.options.bulk_poll_timeout if timeout is None else timeout
+
+        deferrer = self.options.deferrer
+        started_at = last_at = deferrer.current_time()
+        last_count = 0
+        rate = 0.0
+        while True:
+            bulk_check_response = await self.graphql(query, {"id": job_id}, cache=False)
+            if not bulk_check_response.body:
+                raise ValueError(bulk_check_response.errors)
+
+            current_bulk_operation = bulk_check_response.body["data"]["node"]
+            if current_bulk_operation is None or current_bulk_operation.get("id") != job_id:
+                raise ValueError(f"Job {job_id} not found")
+
+            status = current_bulk_operation["status"]
+            object_count = int(current_bulk_operation.get("objectCount") or 0)
+            now = deferrer.current_time()
+            elapsed = now - started_at
+
+            # Rate of objects processed since the last poll, and the time left if the total is known
+            if now > last_at:
+                rate = max(object_count - last_count, 0) / (now - last_at) * ONE_SECOND
+            last_at, last_count = now, object_count
+            eta = None
+            if expected_count is not None and rate > 0:
+                eta = max(expected_count - object_count, 0) / rate
+
+            await self._bulk_progress(progress, BulkProgress(
+                job_id=job_id,
+                status=status,
+                object_count=object_count,
+                file_size=int(current_bulk_operation.get("fileSize") or 0),
+                elapsed=elapsed / ONE_SECOND,
+                rate=rate,
+                eta=eta,
+            ))
+
+            if status == "COMPLETED":
+                return current_bulk_operation
+            elif status not in ["CREATED", "RUNNING"]:
+                raise ValueError(f"Job failed with status {status} [{bulk_check_response.body}]")
+
+            if timeout is not None and elapsed >= timeout:
+                raise TimeoutError(f"Job {job_id} did not complete within {timeout}ms")
+
+            wait = self._bulk_poll_wait(elapsed, eta)
+            if timeout is not None:
+                wait = min(wait, timeout - elapsed)
+            logger.debug(f"Job {job_id} {job_type} is {status}, objectCount:{object_count}, waiting {wait}ms")
+            await deferrer.asleep(wait)
+
+    @staticmethod
+    async def _bulk_progress(progress: Callable[[BulkProgress], Any] | None, bulk_progress: BulkProgress) -> None:
+        """
+        Call (or await) the progress callback, if any
+        """
+        if progress is None:
+            return
+        result = progress(bulk_progress)
+        if inspect.isawaitable(result):
+            await result
+
+    def _bulk_poll_wait(self, elapsed: float, eta: float | None) -> float:
+        """
+        Time in ms to wait before polling a bulk operation again
+        """
+        min_wait, max_wait = self.options.bulk_poll_interval, self.options.bulk_poll_max_interval
+        wait = min(max(elapsed * self.options.bulk_poll_backoff, min_wait), max_wait)
+        if eta is not None:
+            # Expected to complete sooner, poll right when it should be done
+            wait = min(wait, max(eta * ONE_SECOND, min_wait))
+
+        with self._bucket(GRAPHQL) as bucket:
+            if bucket.available < bucket.capacity / 2:
+                # Cost budget is running low, leave it for other calls
+                wait = min(wait * 2, max_wait)
+        return wait
+
+    async def poll_until_complete(self, job_id: str, job_type: str) -> HttpxResponse:
         """
-        query = open(GQL_DIR / "current_bulkoperation.gql").read() % {"job_type": job_type}
-        query = self.parse_query(query)
-        bulk_check_response = await self.graphql(query)
+        Poll the bulk operation until it is complete, then return the downloaded data in memory
 
-        current_bulk_operation = bulk_check_response.body["data"]["currentBulkOperation"]
-        if current_bulk_operation is None or current_bulk_operation["id"] != job_id:
-            raise ValueError(f"Job {job_id} not found")
+        For large results, use `wait_until_complete` and `download_bulk_results` instead
+        """
+        current_bulk_operation = await self.wait_until_complete(job_id, job_type)
+        data_url = current_bulk_operation["url"]
+        if data_url:
+            download_response = await self.transfers.get(data_url)
 
-        status = current_bulk_operation["status"]
-        objectCount = current_bulk_operation["objectCount"]
+            download_response.raise_for_status()
+            return download_response
 
-        if status in ["CREATED", "RUNNING"]:
-            logger.debug(f"Job {job_id} {job_type} is {status}, objectCount:{objectCount}, waiting 1 second")
-            await asyncio.sleep(1)
-            return await self.poll_until_complete(job_id, job_type)
+        else:  # data url was None, it means job returned no data
+            return HttpxResponse(status_code=204, content=b"")
 
-        elif status == "COMPLETED":
-            data_url = current_bulk_operation["url"]
-            if data_url:
-                async with AsyncHttpxClient() as client:
-                    download_response = await client.get(data_url)
+    async def download_bulk_results(self, data_url: str | None) -> jsonlines.Reader:
+        """
+        Stream the results of a bulk operation into a temporary file, which is only kept
+        in memory up to `options.bulk_spool_size` bytes and spooled to disk past that
 
-                download_response.raise_for_status()
-                return download_response
+        The returned reader parses one line at a time as it is iterated.
+        The temporary file is removed once the reader is garbage collected.
 
-            else:  # data url was None, it means job returned no data
-                return HttpxResponse(status_code=204, content=b"")
+        :param data_url: The url (or partialDataUrl) of the bulk operation, None if it returned no data
+        """
+        return jsonlines.Reader(await self._download_bulk_file(data_url), loads=self.options.json_codec.loads)
 
-        raise ValueError(f"Job failed with status {status} [{bulk_check_response.body}]")
+    async def _download_bulk_file(self, data_url: str | None) -> tempfile.SpooledTemporaryFile:
+        """
+        Stream the results of a bulk operation into a spooled temporary file, rewound to the start
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=self.options.bulk_spool_size)
+        if data_url:
+            try:
+                async with self.transfers.stream("GET", data_url) as download_response:
+                    download_response.raise_for_status()
+                    async for chunk in download_response.aiter_bytes():
+                        spool.write(chunk)
+            except BaseException:
+                spool.close()
+                raise
+
+        spool.seek(0)
+        return spool
 
     async def run_bulk_operation_query(
-        self, sub_query: str, variables: dict[str, Any] = {}, wait: bool = True
-    ) -> str | jsonlines.Reader:
-        # check if any bulk query job in progress currently
-        is_job_running = await self.is_bulk_job_running(job_type="QUERY")
-        if is_job_running:
-            raise ValueError("Bulk query job already running")
+        self,
+        sub_query: str,
+        variables: dict[str, Any] = {},
+        wait: bool = True,
+        assemble: bool = False,
+        progress: Callable[[BulkProgress], Any] | None = None,
+    ) -> str | jsonlines.Reader | Iterator[dict[str, Any]]:
+        """
+        Run a GQL query in bulk
 
-        query = open(GQL_DIR / "query_bulkoperation.gql").read() % {"sub_query": sub_query}
+        :param sub_query: The query to run in bulk
+        :param variables: The variables to pass to the query
+        :param wait: Wait for the job to complete and return its results, else return the job ID
+        :param assemble: Nest child rows back into their parents (by __parentId), one top-level object at a time
+        :param progress: Called (or awaited) with a BulkProgress after each poll while waiting
+        """
+        if self.options.bulk_max_concurrent <= 1:
+            # check if any bulk query job in progress currently
+            is_job_running = await self.is_bulk_job_running(job_type="QUERY")
+            if is_job_running:
+                raise ValueError("Bulk query job already running")
 
-        query = self.parse_query(query)
+        query = queries.render("query_bulkoperation", sub_query=sub_query)
         response = await self.graphql(query, variables)
 
         user_errors = (response.body and response.body["data"]["bulkOperationRunQuery"]["userErrors"]) or (
@@ -311,30 +614,123 @@ class AsyncClient(AsyncHttpxClient, ApiCommon):
 
         job_id: str = response.body["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
         if wait:
-            response = await self.poll_until_complete(job_id, "QUERY")
-            reader = jsonlines.Reader(BytesIO(response.content))
-            return reader
+            current_bulk_operation = await self.wait_until_complete(job_id, "QUERY", progress)
+            reader = await self.download_bulk_results(current_bulk_operation["url"])
+            return assemble_bulk_rows(reader) if assemble else reader
 
         return job_id
 
     async def run_bulk_operation_mutation(
-        self, query: str, rows: list[dict[str, Any]], key: str | None = "input", wait: bool = True
+        self,
+        query: str,
+        rows: BulkRows,
+        key: str | None = "input",
+        wait: bool = True,
+        progress: Callable[[BulkProgress], Any] | None = None,
     ) -> str | jsonlines.Reader:
         """
         Run a GQL mutation in bulk
 
         Supported operations: https://shopify.dev/docs/api/usage/bulk-operations/imports#limitations
         dataframe is expected to have ONLY the fields that you wish to change.
+
+        Rows can be any iterable or async iterable, they are encoded and spooled as they are read,
+        then uploaded with their length.
+
+        When waiting, rows past `options.bulk_mutation_max_size` bytes are split into more bulk operations.
+        The next shard is uploaded while the current one runs, and started as soon as it completes,
+        while the results are downloaded. The results of all shards
+        are returned as one reader, in order.
         """
-        filename = f"{uuid.uuid4()}.jsonl"
-        stage_mutation_query = open(GQL_DIR / "mutation_upload_bulkoperation.gql").read() % {"filename": filename}
+        max_size = self.options.bulk_mutation_max_size if wait else math.inf
+        shards = JsonlShards(rows, key, max_size, self.options.json_codec.dumps)
+
+        staged_upload_path = await self._upload_bulk_mutation(shards.shard())
+        job_id = await self._start_bulk_mutation(query, staged_upload_path)
+        if not wait:
+            return job_id
+
+        results = []
+        try:
+            while job_id is not None:
+                current_bulk_operation, job_id = await self._complete_bulk_mutation_shard(
+                    query, job_id, shards, len(results), progress
+                )
+                results.append(await self._download_bulk_file(current_bulk_operation["url"]))
+        except BaseException:
+            # Results of the shards before are of no use
+            for result in results:
+                result.close()
+            raise
+
+        if shards.shards > 1:
+            logger.debug(f"Bulk mutation ran in {shards.shards} shards")
+        codec = self.options.json_codec
+        return jsonlines.Reader(join_bulk_results(results, shards.counts, codec.loads, codec.dumps), loads=codec.loads)
+
+    async def _complete_bulk_mutation_shard(
+        self,
+        query: str,
+        job_id: str,
+        shards: JsonlShards,
+        shard_index: int,
+        progress: Callable[[BulkProgress], Any] | None,
+    ) -> tuple[dict[str, Any], str | None]:
+        """
+        Wait for the bulk mutation of a shard to complete, uploading the next shard meanwhile,
+        and start the next shard as soon as it does
+
+        :return: The completed bulk operation, and the job ID of the next shard, None if it was the last
+        """
+        # Upload the next shard while the current one runs
+        upload = None
+        if await shards.has_next():
+            upload = asyncio.ensure_future(self._upload_bulk_mutation(shards.shard()))
+
+        try:
+            current_bulk_operation = await self.wait_until_complete(
+                job_id, "MUTATION", progress, expected_count=shards.counts[shard_index]
+            )
+            if upload is None:
+                return current_bulk_operation, None
+            # Start the next shard before the results of this one are downloaded
+            return current_bulk_operation, await self._start_bulk_mutation(query, await upload)
+        except BaseException:
+            if upload is not None:
+                upload.cancel()
+            raise
+
+    async def _upload_bulk_mutation(self, content: AsyncIterator[bytes]) -> str:
+        """
+        Stage an upload for a bulk mutation and send the JSONL content to it
 
+        The content is spooled first, in memory up to `options.bulk_spool_size` bytes and to disk past that,
+        so the upload is sent with its Content-Length instead of chunked
+
+        :return: The staged upload path for the bulk mutation
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=self.options.bulk_spool_size)
+        with spool:
+            size = 0
+            async for chunk in content:
+                spool.write(chunk)
+                size += len(chunk)
+            spool.seek(0)
+            return await self._upload_bulk_file(spool, size)
+
+    async def _upload_bulk_file(self, file: IO[bytes], size: int) -> str:
+        """
+        Stage an upload for a bulk mutation and stream the JSONL file of `size` bytes to it
+
+        :return: The staged upload path for the bulk mutation
+        """
+        filename = f"{uuid.uuid4()}.jsonl"
         ###################
         # Stage Mutations #
         ###################
         # Get the upload parameters for our mutation file
-        stage_mutation_query = self.parse_query(stage_mutation_query)
-        stage_mutations_response = await self.graphql(stage_mutation_query)
+        stage_mutation_query = queries.render("mutation_upload_bulkoperation")
+        stage_mutations_response = await self.graphql(stage_mutation_query, {"filename": filename})
         if not stage_mutations_response.body:
             raise ValueError(stage_mutations_response.errors)
 
@@ -345,33 +741,31 @@ class AsyncClient(AsyncHttpxClient, ApiCommon):
         ####################
         # Upload Mutations #
         ####################
-        if key is not None:
-            rows = [{key: row} for row in rows]
-        fp = BytesIO()
-        writer = jsonlines.Writer(fp)
-        writer.write_all(rows)
-        fp.seek(0)
-
-        files = {"file": (filename, fp, "application/octet-stream")}
-        data = {param["name"]: (param["value"],) for param in mutations_upload_params}
-        staged_upload_path = data["key"][0]
+        data = {param["name"]: param["value"] for param in mutations_upload_params}
+        staged_upload_path = data["key"]
+
+        # Stream the multipart body from the file, its length known up front
+        boundary = uuid.uuid4().hex
+        head, tail = multipart_envelope(boundary, data, filename)
+        body = encode_multipart(boundary, data, filename, read_chunks(file))
+        headers = {
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head) + size + len(tail)),
+        }
 
-        async with httpx.AsyncClient() as client:
-            mutations_upload_response = await client.post(mutations_upload_url, data=data, files=files)
+        mutations_upload_response = await self.transfers.post(mutations_upload_url, content=body, headers=headers)
 
         mutations_upload_response.raise_for_status()
+        return staged_upload_path
 
-        ######################
-        # Run Bulk Operation #
-        ######################
-        bulk_mutation_query = open(GQL_DIR / "mutation_bulkoperation.gql").read() % {
-            "mutation_query": query,
-            "staged_upload_path": staged_upload_path,
-        }
+    async def _start_bulk_mutation(self, query: str, staged_upload_path: str) -> str:
+        """
+        Start a bulk mutation for an uploaded file
 
-        # Perform the bulk mutation, and wait for its response
-        bulk_mutation_query = self.parse_query(bulk_mutation_query)
-        response = await self.graphql(bulk_mutation_query)
+        :return: The job ID
+        """
+        bulk_mutation_query = queries.render("mutation_bulkoperation", mutation_query=query)
+        response = await self.graphql(bulk_mutation_query, {"stagedUploadPath": staged_upload_path})
         if not response.body:
             raise ValueError(response.errors)
 
@@ -379,12 +773,4 @@ class AsyncClient(AsyncHttpxClient, ApiCommon):
         if user_errors:
             raise ValueError(user_errors)
 
-        job_id: str = response.body["data"]["bulkOperationRunMutation"]["bulkOperation"]["id"]
-
-        if not wait:
-            return job_id
-
-        response = await self.poll_until_complete(job_id, "MUTATION")
-        reader = jsonlines.Reader(BytesIO(response.content))
-        return reader
-
+        return response.body["data"]["bulkOperationRunMutation"]["bulkOperation"]["id"]
@@ -1,9 +1,10 @@
-from typing import Any
+from typing import Any, Callable, Optional
 
 from httpx import Client as HttpxClient
 from httpx._models import Response
 from httpx._types import HeaderTypes
 
+from ..cache import CachedResponse
 from ..constants import GRAPHQL, REST
 from ..models import ApiResult, RestResult, Session
 from ..options import Options
@@ -23,6 +24,9 @@ class Client(HttpxClient, ApiCommon):
 
         self.session = session
         self.options = options
+        # Headers sent with every request, built on first use
+        self._prebuilt_headers = None
+        self._prebuilt_source = None
         super().__init__(
             base_url=self.session.base_url,
             auth=None if self.options.is_public else (self.session.key, self.session.password),
@@ -35,141 +39,195 @@ class Client(HttpxClient, ApiCommon):
         """
 
         limiting_required = self._rest_rate_limit_required()
-        if limiting_required is not False:
-            # Rate limit was determined to be required, sleep for X ms
+        while limiting_required is not False:
+            # Rate limit was determined to be required, sleep for X ms and try again
             self.options.deferrer.sleep(limiting_required)
+            limiting_required = self._rest_rate_limit_required()
 
-    def _graphql_cost_limit(self) -> None:
+    def _graphql_cost_limit(self, cost: int) -> None:
         """
         Handle cost limiting for GraphQL.
         """
 
-        limiting_required = self._graphql_cost_limit_required()
-        if limiting_required is not False:
-            # Cost limit was determined to be required, sleep for X ms
+        limiting_required = self._graphql_cost_limit_required(cost)
+        while limiting_required is not False:
+            # Cost limit was determined to be required, sleep for X ms and try again
             self.options.deferrer.sleep(limiting_required)
+            limiting_required = self._graphql_cost_limit_required(cost)
 
     def _rest_pre_actions(self, **kwargs) -> None:
         """
-        Actions which fire before REST API call.
+        Actions which fire before REST API call, once for the call and its retries.
         """
 
-        # Determine if rate limiting is required and handle it
-        self._rest_rate_limit()
-        # Add to the request times
-        self.options.time_store.append(self.session, self.options.deferrer.current_time())
         # Run user-defined actions and pass in the request built
         [meth(self, **kwargs) for meth in self.options.rest_pre_actions]
 
     def _graphql_pre_actions(self, **kwargs) -> None:
         """
-        Actions which fire before GraphQL API call.
+        Actions which fire before GraphQL API call, once for the call and its retries.
         """
 
-        # Determine if cost limiting is required and handle it
-        self._graphql_cost_limit()
-        # Add to the request times
-        self.options.time_store.append(self.session, self.options.deferrer.current_time())
         # Run user-defined actions and pass in the request built
         [meth(self, **kwargs) for meth in self.options.graphql_pre_actions]
 
-    def _rest_post_actions(self, response: Response, retries: int) -> RestResult:
+    def _rest_post_actions(self, result: RestResult) -> RestResult:
         """
-        Actions which fire after REST API call.
+        Actions which fire after REST API call, once with the result of the last attempt.
         """
 
-        # Parse the response from HTTPX
-        result = self._parse_response(REST, response, retries)
         # Run user-defined actions and pass in the result object
         [meth(self, result) for meth in self.options.rest_post_actions]
         return result
 
-    def _graphql_post_actions(self, response: Response, retries: int) -> ApiResult:
+    def _graphql_post_actions(self, result: ApiResult) -> ApiResult:
         """
-        Actions which fire after GraphQL API call.
+        Actions which fire after GraphQL API call, once with the result of the last attempt.
         """
 
-        # Parse the response from HTTPX
-        result = self._parse_response(GRAPHQL, response, retries)
-        # Add to the costs
-        self._cost_update(result.body)
         # Run user-defined actions and pass in the result object
         [meth(self, result) for meth in self.options.graphql_post_actions]
         return result
 
-    def _retry_request(meth: callable) -> callable:
+    def _rest_attempt(
+        self,
+        meth: Callable[..., Response],
+        kwargs: dict,
+        cached: Optional[CachedResponse],
+        retries: int,
+    ) -> RestResult:
         """
-        Determine if retry is required.
+        One attempt of a REST API call: rate limited, sent, and the bucket brought in line with Shopify's.
+        """
+
+        # Fail fast if the shop is failing, then determine if rate limiting is required and handle it
+        self._circuit_check()
+        self._rest_rate_limit()
+        # Run the call
+        try:
+            response = meth(**self._encode_request(kwargs))
+        except BaseException as e:
+            # Call never completed, give back the reservation
+            self._bucket_release(REST, 1)
+            self._circuit_record(None, e)
+            raise
+        self._circuit_record(response)
+        # Bring the bucket in line with Shopify's
+        self._rest_bucket_update(response.headers)
+        # Parse the response from HTTPX
+        return self._parse_response(REST, self._cache_revalidate(cached, response), retries)
 
-        If it is, retry the request.
-        If not, return the result.
+    def _graphql_attempt(
+        self,
+        query: str,
+        kwargs: dict,
+        cached: Optional[CachedResponse],
+        retries: int,
+    ) -> ApiResult:
         """
+        One attempt of a GraphQL call: cost limited, sent, and the reserved cost swapped for the actual cost.
+        """
+
+        # Fail fast if the shop is failing, then estimate the cost of the query to reserve and handle cost limiting
+        self._circuit_check()
+        cost = self.options.cost_estimator.estimate(query)
+        self._graphql_cost_limit(cost)
+        # Run the call
+        try:
+            response = self.post(**self._encode_request(kwargs))
+        except BaseException as e:
+            # Call never completed, give back the reserved cost
+            self._bucket_release(GRAPHQL, cost)
+            self._circuit_record(None, e)
+            raise
+        self._circuit_record(response)
+        response = self._cache_revalidate(cached, response)
+        # Parse the response from HTTPX, decoding the body once for the result and the cost
+        decoded = self._decode(response)
+        result = self._parse_response(GRAPHQL, response, retries, decoded)
+        # Swap the reserved cost for the actual cost
+        self._cost_update(decoded[0], query, cost)
+        return result
 
-        def wrapper(*args, **kwargs) -> ApiResult:
-            # Get the instance
-            inst: Client = args[0]
-            # Get the number of retries so far
-            retries: int = kwargs.get("_retries", 0)
-            # Run the call (rest or graphql)
-            result: ApiResult = meth(*args, **kwargs)
-            # Get the response and determine if retry is required
-            response: Response = result.response
-            retry = inst._retry_required(response, retries)
+    def _retry_request(self, attempt: Callable[[int], ApiResult]) -> ApiResult:
+        """
+        Run attempts of a call until no retry is required, waiting between them, and return the last result.
 
-            if retry is not False:
-                # Retry is needed, sleep for X ms
-                inst.options.deferrer.sleep(retry)
+        Args:
+            attempt: Runs one attempt, given the number of retries so far.
+        """
 
-                # Re-run the request
-                kwargs["_retries"] = retries + 1
-                inst_meth = getattr(inst, meth.__name__)
-                return inst_meth(*args[1:], **kwargs)
-            return result
+        deadline = self._retry_deadline()
+        retries = 0
+        while True:
+            result = attempt(retries)
+            retry = self._retry_delay(result.response, retries, result, deadline)
+            if retry is False:
+                return result
 
-        return wrapper
+            # Retry is needed, sleep for X ms
+            self.options.deferrer.sleep(retry)
+            retries += 1
 
-    @_retry_request
     def rest(
         self,
         method: str,
         path: str,
         params: UnionRequestData = None,
         headers: HeaderTypes = {},
-        _retries: int = 0,
+        cache: bool = True,
         **httpx_kwargs: dict[str, Any]
     ) -> RestResult:
         """
         Fire a REST API call.
+        GET calls go through `options.response_cache` if set, unless `cache` is False.
         """
 
         # Dynamically map to HTTPX's method for get/post/put/etc
         meth = getattr(self, method)
         # Build the request based on the method and inputs
         kwargs = self._build_request(method, path, params, headers, **httpx_kwargs)
-
-        # Run the pre-actions
+        # Use the cached response if still fresh, skipping the call and the limits
+        key = self._request_key(REST, method, kwargs) if cache and self.options.response_cache is not None else None
+        cached = self._cache_lookup(key, kwargs)
+        if self._cache_hit(cached):
+            return self._parse_response(REST, cached.to_response(), 0)
+
+        # Run the pre-actions, the call with its retries, and the post-actions, and return the result
+        self._headers_for_actions(kwargs, self.options.rest_pre_actions)
         self._rest_pre_actions(**kwargs)
-        # Run the call and post-actions, and return the result
-        return self._rest_post_actions(meth(**kwargs), _retries)
+        result = self._retry_request(lambda retries: self._rest_attempt(meth, kwargs, cached, retries))
+        result = self._rest_post_actions(result)
+        self._cache_store(key, result)
+        return result
 
-    @_retry_request
     def graphql(
         self,
         query: str,
         variables: dict = None,
         headers: HeaderTypes = {},
-        _retries: int = 0,
+        cache: bool = True,
         **httpx_kwargs: dict[str, Any]
     ) -> ApiResult:
         """
         Fire a GraphQL call.
+        Queries go through `options.response_cache` if set, unless `cache` is False.
         """
 
         # Build the request
         kwargs = self._build_request(
             "post", "/admin/api/graphql.json", {"query": query, "variables": variables}, headers, **httpx_kwargs
         )
-        # Run the pre-actions
+        # Use the cached response if still fresh, skipping the call and the limits
+        key = self._request_key(GRAPHQL, "post", kwargs) if cache and self.options.response_cache is not None else None
+        cached = self._cache_lookup(key, kwargs)
+        if self._cache_hit(cached):
+            return self._parse_response(GRAPHQL, cached.to_response(), 0)
+
+        # Run the pre-actions, the call with its retries, and the post-actions, and return the result
+        self._headers_for_actions(kwargs, self.options.graphql_pre_actions)
         self._graphql_pre_actions(**kwargs)
-        # Run the call and post-actions, and return the result
-        return self._graphql_post_actions(self.post(**kwargs), _retries)
+        result = self._retry_request(lambda retries: self._graphql_attempt(query, kwargs, cached, retries))
+        result = self._graphql_post_actions(result)
+        self._cache_store(key, result)
+        return result
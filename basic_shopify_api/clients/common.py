@@ -1,14 +1,50 @@
 import re
-from typing import Optional, Pattern, Union
+from contextlib import contextmanager
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Iterator, Mapping, Optional, Pattern, Union
 
+from httpx import QueryParams
 from httpx._models import Response
 from httpx._types import HeaderTypes
 
-from ..constants import (ACCESS_TOKEN_HEADER, LINK_HEADER, LINK_PATTERN,
+from ..breaker import OPEN
+from ..bucket import LeakyBucket
+from ..cache import MUTATION_PATTERN, CachedResponse, ResponseCache
+from ..constants import (ACCESS_TOKEN_HEADER, CALL_LIMIT_HEADER,
+                         ETAG_MATCH_HEADER, GRAPHQL, LINK_HEADER,
                          NOT_AUTHABLE_PATTERN, NOT_VERSIONABLE_PATTERN,
                          ONE_SECOND, REST, RETRY_HEADER)
-from ..models import ApiResult, RestLink, RestResult
-from ..types import ParsedBody, UnionRequestData
+from ..models import LINK_REGEX, ApiResult, RestLink, RestResult
+from ..queries import minify_query
+from ..retry import full_jitter
+from ..types import Decoded, UnionRequestData
+
+# Compiled NOT_AUTHABLE_PATTERN
+NOT_AUTHABLE_REGEX = re.compile(NOT_AUTHABLE_PATTERN)
+# Compiled NOT_VERSIONABLE_PATTERN
+NOT_VERSIONABLE_REGEX = re.compile(NOT_VERSIONABLE_PATTERN)
+
+
+@lru_cache(maxsize=1024)
+def versioned_path(path: str, version: str) -> str:
+    """
+    Add the API version to the path, unless it does not need authentication,
+    does not need versioning, or already has it.
+
+    Results are memoized by path and version, paths are shared between every client.
+
+    Args:
+        path: The URL path.
+        version: The API version, example: "2020-04".
+    """
+
+    ignore_versioning = (
+        bool(NOT_AUTHABLE_REGEX.match(path)) or
+        bool(NOT_VERSIONABLE_REGEX.match(path)) or
+        version in path
+    )
+    return path if ignore_versioning else path.replace("/api", f"/api/{version}")
 
 
 class ApiCommon:
@@ -20,26 +56,26 @@ class ApiCommon:
     @property
     def _regex_not_authable(self) -> Pattern:
         """
-        Compile NOT_AUTHABLE_PATTERN once.
+        Compiled NOT_AUTHABLE_PATTERN.
         """
 
-        return re.compile(NOT_AUTHABLE_PATTERN)
+        return NOT_AUTHABLE_REGEX
 
     @property
     def _regex_not_versionable(self) -> Pattern:
         """
-        Compile NOT_VERSIONABLE_PATH once.
+        Compiled NOT_VERSIONABLE_PATTERN.
         """
 
-        return re.compile(NOT_VERSIONABLE_PATTERN)
+        return NOT_VERSIONABLE_REGEX
 
     @property
     def _regex_link(self) -> Pattern:
         """
-        Compile LINK_PATTERN once.
+        Compiled LINK_PATTERN.
         """
 
-        return re.compile(LINK_PATTERN)
+        return LINK_REGEX
 
     def is_authable(self, path: str) -> bool:
         """
@@ -49,7 +85,7 @@ class ApiCommon:
             path: The URL path.
         """
 
-        return not bool(self._regex_not_authable.match(path))
+        return not bool(NOT_AUTHABLE_REGEX.match(path))
 
     def is_versionable(self, path: str) -> bool:
         """
@@ -59,7 +95,7 @@ class ApiCommon:
             path: The URL path.
         """
 
-        return not bool(self._regex_not_versionable.match(path))
+        return not bool(NOT_VERSIONABLE_REGEX.match(path))
 
     def replace_path(self, path: str) -> str:
         """
@@ -82,27 +118,60 @@ class ApiCommon:
 
         if ignore_check:
             return self.replace_path(path)
+        return versioned_path(path, self.options.version)
 
-        ignore_versioning = (
-            not self.is_authable(path) or
-            not self.is_versionable(path) or
-            self.options.version in path
-        )
-        return path if ignore_versioning else self.replace_path(path)
+    def _base_headers(self) -> Mapping[str, str]:
+        """
+        The headers sent with every request: the headers defined in options,
+        and ACCESS_TOKEN_HEADER if the API call is public. Read-only.
+
+        Built once per client, and again only when `options.headers` is replaced or changed,
+        or the mode or the password changes.
+        """
 
-    def _build_headers(self, headers: HeaderTypes) -> HeaderTypes:
+        headers = self.options.headers
+        source = self._prebuilt_source
+        if (
+            source is None or
+            source[0] is not headers or
+            source[1] != headers.revision or
+            source[2] != self.options.mode or
+            source[3] != self.session.password
+        ):
+            built = dict(headers)
+            if self.options.is_public:
+                built = {ACCESS_TOKEN_HEADER: self.session.password, **built}
+            self._prebuilt_headers = MappingProxyType(built)
+            self._prebuilt_source = (headers, headers.revision, self.options.mode, self.session.password)
+        return self._prebuilt_headers
+
+    def _build_headers(self, headers: HeaderTypes) -> Mapping[str, str]:
         """
         Build headers to send with the request.
-        Combines headers defined in options with inputted headers.
-        Also will add in ACCESS_TOKEN_HEADER if the API call is public.
+        Combines the base headers with inputted headers, inputted headers win.
+        Without inputted headers, the read-only base headers are used as they are.
 
         Args:
             headers: Dict of headers to add to the request.
         """
 
-        if self.options.is_public:
-            headers = {ACCESS_TOKEN_HEADER: self.session.password, **headers}
-        return {**self.options.headers, **headers}
+        base = self._base_headers()
+        if not headers:
+            return base
+        return {**base, **headers}
+
+    def _headers_for_actions(self, kwargs: dict, actions: list) -> None:
+        """
+        Give the request its own copy of the read-only base headers when pre-actions run,
+        so they can change the headers of their request.
+
+        Args:
+            kwargs: The request built.
+            actions: The pre-actions to run.
+        """
+
+        if actions and isinstance(kwargs["headers"], MappingProxyType):
+            kwargs["headers"] = dict(kwargs["headers"])
 
     def _build_request(
         self,
@@ -131,123 +200,272 @@ class ApiCommon:
 
         return kwargs
 
+    def _encode_request(self, kwargs: dict) -> dict:
+        """
+        Encode the JSON body of a built request with `options.json_codec`, for HTTPX to send as is.
+        """
+
+        if kwargs.get("json") is None:
+            return kwargs
+
+        kwargs = dict(kwargs)
+        kwargs["content"] = self.options.json_codec.dumps(kwargs.pop("json"))
+        if not any(name.lower() == "content-type" for name in kwargs["headers"]):
+            kwargs["headers"] = {**kwargs["headers"], "Content-Type": "application/json"}
+        return kwargs
+
     def _rest_extract_link(self, headers: HeaderTypes) -> RestLink:
         """
         REST responses, if paginated, will contain a header which will
         contain a string (pageinfo) for the next and previous calls.
         """
 
-        link = {"next": None, "prev": None}
-        if LINK_HEADER in headers:
-            results = self._regex_link.findall(headers[LINK_HEADER])
-            for result in results:
-                link[result[1][0:4]] = result[0]
-        return RestLink(**link)
+        return RestLink.from_header(headers.get(LINK_HEADER))
+
+    @contextmanager
+    def _bucket(self, api: str) -> Iterator[LeakyBucket]:
+        """
+        Load the bucket of the API type for the session, leaked up to the current time.
+        Any changes made to the bucket are saved back to the store, all under the store's lock.
+
+        Args:
+            api: The API type, REST or GRAPHQL.
+        """
+
+        if api == REST:
+            store = self.options.rest_bucket_store
+            capacity, leak_rate = self.options.rest_bucket_size, self.options.rest_limit
+        else:
+            store = self.options.graphql_bucket_store
+            capacity, leak_rate = self.options.graphql_bucket_size, self.options.graphql_limit
+
+        with store.lock(self.session):
+            bucket = LeakyBucket.from_values(store.all(self.session), capacity, leak_rate)
+            bucket.leak(self.options.deferrer.current_time())
+            yield bucket
+            store.replace(self.session, bucket.to_values())
 
     def _rest_rate_limit_required(self) -> Union[bool, int]:
         """
         Determines if rate limiting is required.
 
-        First, we check the number of requests. If they're below the limit, we allow it.
+        The REST API is a leaky bucket, so calls are allowed to burst
+        as long as there is room left in the bucket.
+
+        If there is room, a spot in the bucket is reserved for the call and no limiting is required.
+        If there is no room, we must sleep for the time it takes the bucket to drain enough for the call.
+        """
 
-        Next, we check if the number of requests happened within a "window of time".
-        A "window of time" is the first request time, plus 1 second.
+        with self._bucket(REST) as bucket:
+            # False = no limiting and reserved, else limit for X ms
+            return bucket.reserve(1)
 
-        If the request is inside the window, we must sleep the difference.
-        If the request is outside the window, we allow it and reset the request times.
+    def _bucket_release(self, api: str, amount: float) -> None:
         """
+        Give back a reservation for a call which never completed (cancelled or failed).
 
-        all_time = self.options.time_store.all(self.session)
-        if len(all_time) < self.options.rest_limit:
-            # Number of requests is below the limit, no limiting required
-            return False
+        Args:
+            api: The API type, REST or GRAPHQL.
+            amount: The units which were reserved.
+        """
 
-        # We've reached the limit, lets see if the request happened within or outside the window of time
-        current_time = self.options.deferrer.current_time()
-        window_time = all_time[0] + ONE_SECOND
+        with self._bucket(api) as bucket:
+            bucket.release(amount)
 
-        # Reset the request times, return result... False = no limiting, else limit for X ms
-        self.options.time_store.reset(self.session)
-        return False if current_time > window_time else window_time - current_time
+    def _rest_bucket_update(self, headers: HeaderTypes) -> None:
+        """
+        Read the CALL_LIMIT_HEADER (example: 32/40) to bring the REST bucket in line with Shopify's.
 
-    def _graphql_cost_limit_required(self) -> Union[bool, int]:
+        The capacity is taken from the header, which means Plus shops are detected automatically.
+        The leak rate is scaled by how much larger the bucket is than the default.
+        """
+
+        if CALL_LIMIT_HEADER not in headers:
+            return
+
+        try:
+            used, capacity = (int(value) for value in headers[CALL_LIMIT_HEADER].split("/"))
+        except ValueError:
+            # Malformed header, nothing to sync with
+            return
+
+        leak_rate = self.options.rest_limit * capacity / self.options.rest_bucket_size
+        with self._bucket(REST) as bucket:
+            bucket.sync(used, capacity, leak_rate)
+
+    def _graphql_cost_limit_required(self, cost: int) -> Union[bool, int]:
         """
         Determine if cost limiting is required.
 
-        First we check if the number of requests is empty or the costs are empty.
-        If they are, we allow the request to continue as normal.
+        The GraphQL API is a leaky bucket of cost points, restored at a rate per second.
 
-        Next, we compare the last request time and current time.
-        If its over 1 second, we allow it through without limiting.
-        If its under 1 second, we check the cost of the query to determine if its over the limit.
-        If its over the limit, we sleep the difference in ms.
-        If its under the limit, we allow it through without limiting.
+        If there is room for the estimated cost of the query, the cost is reserved
+        in the bucket and no limiting is required.
+        If there is no room, we must sleep for the time it takes the bucket to restore enough for the query.
 
-        In both cases, request times and costing is reset.
+        Args:
+            cost: The estimated cost of the query.
         """
 
-        all_time = self.options.time_store.all(self.session)
-        all_cost = self.options.cost_store.all(self.session)
-        if len(all_time) == 0 or len(all_cost) == 0:
-            # Nothing was done to warrant checking
-            return False
+        with self._bucket(GRAPHQL) as bucket:
+            # False = no limiting and reserved, else limit for X ms
+            return bucket.reserve(cost)
+
+    def _cost_update(self, document: Any, query: str, cost: int) -> None:
+        """
+        Read the cost extension of the body to swap the reserved cost for the "actualQueryCost",
+        and bring the GraphQL bucket in line with the "throttleStatus".
+
+        The "requestedQueryCost" is remembered to use as the estimate next time the query is ran.
+
+        Args:
+            document: The decoded body of the response, None if it could not be decoded.
+            query: The query which was ran.
+            cost: The estimated cost which was reserved.
+        """
+
+        extensions = (document.get("extensions") if isinstance(document, dict) else None) or {}
+        query_cost = extensions.get("cost")
+
+        with self._bucket(GRAPHQL) as bucket:
+            if query_cost is None:
+                # Nothing known about the cost, give back the reservation
+                bucket.release(cost)
+                return
+
+            # Throttled queries have no actual cost
+            bucket.release(cost - (query_cost.get("actualQueryCost") or 0))
+            throttle_status = query_cost["throttleStatus"]
+            bucket.sync(
+                throttle_status["maximumAvailable"] - throttle_status["currentlyAvailable"],
+                throttle_status["maximumAvailable"],
+                throttle_status["restoreRate"],
+            )
+        self.options.cost_estimator.update(query, query_cost["requestedQueryCost"])
+
+    def _request_key(self, api: str, method: str, kwargs: dict) -> Optional[str]:
+        """
+        Key of a read request, by shop, access token, headers and normalized request:
+        REST GET calls and GraphQL queries, so sessions with different tokens or scopes never share a response.
+        None for anything which could write, REST calls of other methods and GraphQL mutations.
 
-        # Determine time difference between last request and current
-        last_time, last_cost = all_time[-1], all_cost[-1]
-        time_diff = self.options.deferrer.current_time() - last_time
-        points_per_sec = self.options.graphql_limit
+        Args:
+            api: The API type, REST or GraphQL.
+            method: The HTTP method.
+            kwargs: The request built.
+        """
+
+        if api == REST:
+            if method != "get":
+                return None
+            request = sorted(QueryParams(kwargs.get("params")).multi_items())
+        else:
+            request = kwargs["json"]
+            if MUTATION_PATTERN.search(request["query"]):
+                return None
+            request = (request["query"], request.get("variables"))
 
-        # Reset request times and costing, return if sleeping should happen or not
-        self.options.time_store.reset(self.session)
-        self.options.cost_store.reset(self.session)
-        return False if time_diff > ONE_SECOND or last_cost < points_per_sec else ONE_SECOND - time_diff
+        headers = sorted((name.lower(), value) for name, value in kwargs["headers"].items())
+        credentials = (self.session.key, self.session.password)
+        return ResponseCache.key(self.session.domain, api, kwargs["url"], request, credentials, headers)
 
-    def _cost_update(self, body: Optional[ParsedBody]) -> None:
+    def _cache_lookup(self, key: Optional[str], kwargs: dict) -> Optional[CachedResponse]:
         """
-        Read the body and grab the "actualQueryCost" to use for cost limiting.
+        Find the cached response of a read request, when a response cache is set.
+
+        A stale response with an ETag is revalidated, by adding "If-None-Match" to the request.
+        A stale response without one is of no use.
+
+        Args:
+            key: The key of the request.
+            kwargs: The request built.
         """
 
-        if body is None or "extensions" not in body:
+        cache = self.options.response_cache
+        if cache is None or key is None:
+            return None
+
+        entry = cache.get(key)
+        if entry is not None and not cache.fresh(entry):
+            etag = entry.etag
+            if etag is None:
+                return None
+            kwargs["headers"] = {**kwargs["headers"], ETAG_MATCH_HEADER: etag}
+        return entry
+
+    def _cache_hit(self, entry: Optional[CachedResponse]) -> bool:
+        """
+        Determine if a cached response can be used without calling Shopify.
+        """
+
+        return entry is not None and self.options.response_cache.fresh(entry)
+
+    def _cache_revalidate(self, entry: Optional[CachedResponse], response: Response) -> Response:
+        """
+        Swap a "304 Not Modified" for the cached response, with the new headers (example: the call limit).
+        """
+
+        if entry is not None and response.status_code == 304:
+            return entry.to_response(list(response.headers.items()))
+        return response
+
+    def _cache_store(self, key: Optional[str], result: ApiResult) -> None:
+        """
+        Keep a successful response of a request which can be cached.
+        """
+
+        cache = self.options.response_cache
+        if cache is None or key is None or result.errors is not None or result.response.status_code != 200:
             return
-        self.options.cost_store.append(self.session, int(body["extensions"]["cost"]["actualQueryCost"]))
+        cache.set(key, CachedResponse.from_response(result.response, cache.clock()))
 
-    def _parse_response(self, api: str, response: Response, retries: int) -> Union[ApiResult, RestResult]:
+    def _decode(self, response: Response) -> Decoded:
         """
-        Get the response from HTTPX and parse it for a JSON body and errors.
+        Decode the JSON body of a response with `options.json_codec`.
+        Returns the document, or the exception if the body could not be decoded.
+
+        Each response is decoded once, and the document shared between parsing, cost and retry checks.
         """
 
         try:
-            # Try to decode the JSON
-            errors = None
-            body = response.json()
-            if "errors" in body or "error" in body:
-                # JSON body has an "error" or "errors" key, grab it, kill the body
-                errors = body.get("errors", body.get("error", None))
-                body = None
+            return self.options.json_codec.loads(response.content), None
         except Exception as e:
-            # Error decoding for some reason, get the exception and kill the body
-            errors = e
-            body = None
+            return None, e
 
-        # Return the HTTPX response, HTTP status code, JSON body, errors body/exception, and number of retires
+    def _parse_response(
+        self,
+        api: str,
+        response: Response,
+        retries: int,
+        decoded: Optional[Decoded] = None,
+    ) -> Union[ApiResult, RestResult]:
+        """
+        Get the response from HTTPX as a result, parsed for a JSON body and errors when first accessed.
+        Pass `decoded` from `_decode` if the body was already decoded.
+        """
+
+        # Return the HTTPX response, HTTP status code, and number of retires
         kwargs = {
             "response": response,
             "status": response.status_code,
-            "body": body,
-            "errors": errors,
             "retries": retries,
+            "decoded": decoded,
+            "loads": self.options.json_codec.loads,
         }
         if api == REST:
-            # Include "link" for REST calls
-            return RestResult(
-                link=self._rest_extract_link(response.headers),
-                **kwargs,
-            )
+            # Includes "link" for REST calls
+            return RestResult(**kwargs)
         return ApiResult(**kwargs)
 
-    def _retry_required(self, response: Response, retries: int) -> Union[bool, float]:
+    def _retry_required(
+        self,
+        response: Response,
+        retries: int,
+        result: Optional[ApiResult] = None,
+    ) -> Union[bool, float]:
         """
         Determine if a retry of the request is required.
+        Pass the `result` of the response to check its errors without decoding the body again.
         """
 
         if response.status_code in self.options.retry_on_status and retries < self.options.max_retries:
@@ -257,18 +475,94 @@ class ApiCommon:
                 return float(response.headers[RETRY_HEADER]) * ONE_SECOND
             return 0.0
         elif response.status_code == 200:
-            result = response.json()
-            if "errors" in result:
-                codes = {error.get("extensions", {}).get("code") for error in result["errors"]}
+            if result is None:
+                result = self._parse_response(GRAPHQL, response, retries)
+            # Only GraphQL is throttled with a 200, REST bodies are not decoded for the check
+            if not isinstance(result, RestResult) and isinstance(result.errors, list):
+                codes = {
+                    error.get("extensions", {}).get("code") for error in result.errors if isinstance(error, dict)
+                }
                 if "THROTTLED" in codes:
-                    cost = response.json()["extensions"]["cost"]
-                    expected_query_cost = cost["requestedQueryCost"] + 10
-                    currently_available = cost["throttleStatus"]["currentlyAvailable"]
-                    restore_rate = cost["throttleStatus"]["restoreRate"]
-                    time_to_sleep = (expected_query_cost - currently_available) / restore_rate
-                    return float(time_to_sleep) * ONE_SECOND
+                    # The bucket was synced with the "throttleStatus", cost limiting will wait the exact time
+                    return 0.0
         return False
 
+    def _retry_deadline(self) -> Optional[int]:
+        """
+        The time in ms past which a call starting now is not retried, None for no limit.
+        """
+
+        if self.options.retry_deadline is None:
+            return None
+        return self.options.deferrer.current_time() + self.options.retry_deadline
+
+    def _retry_delay(
+        self,
+        response: Response,
+        retries: int,
+        result: ApiResult,
+        deadline: Optional[int] = None,
+    ) -> Union[bool, float]:
+        """
+        Determine if and after how long in ms to retry the request, False to return the result as is.
+
+        Retries paced by Shopify, with a Retry-After header or a throttled GraphQL query, wait the time given.
+        Other retries back off exponentially with full jitter, and take from the shop's `options.retry_budget`.
+        No retry is made which would wait past the deadline, or once the shop's circuit opened.
+
+        Args:
+            response: The response of the attempt.
+            retries: The number of retries done so far.
+            result: The result of the response.
+            deadline: The time in ms past which no retry is made, from `_retry_deadline`.
+        """
+
+        delay = self._retry_required(response, retries, result)
+        breaker = self.options.circuit_breaker
+        if delay is False or (breaker is not None and breaker.state(self.session.domain) == OPEN):
+            # Nothing to retry, or the shop's circuit opened
+            return False
+
+        now = self.options.deferrer.current_time()
+        paced = response.status_code == 200 or RETRY_HEADER in response.headers
+        if not paced:
+            delay = full_jitter(retries, self.options.retry_backoff, self.options.retry_max_backoff)
+        if deadline is not None and now + delay > deadline:
+            return False
+
+        budget = self.options.retry_budget
+        if not paced and budget is not None and not budget.withdraw(self.session.domain, now):
+            return False
+        return delay
+
+    def _circuit_check(self) -> None:
+        """
+        Fail fast with `CircuitOpenError` if the shop's circuit is open, when a circuit breaker is set.
+        """
+
+        breaker = self.options.circuit_breaker
+        if breaker is not None:
+            breaker.allow(self.session.domain, self.options.deferrer.current_time())
+
+    def _circuit_record(self, response: Optional[Response], error: Optional[BaseException] = None) -> None:
+        """
+        Record the outcome of a call in the shop's circuit, when a circuit breaker is set.
+
+        Args:
+            response: The response, None if the call raised.
+            error: The exception the call raised. A cancelled call is forgotten instead of counted.
+        """
+
+        breaker = self.options.circuit_breaker
+        if breaker is None:
+            return
+        if error is not None and not isinstance(error, Exception):
+            breaker.release(self.session.domain)
+            return
+
+        success = response is not None and not breaker.is_failure(response.status_code)
+        breaker.record(self.session.domain, success, self.options.deferrer.current_time())
+
     @staticmethod
     def parse_query(query: str) -> str:
-        return " ".join([x.strip() for x in query.split("\n")])
\ No newline at end of file
+        return minify_query(query)
@@ -0,0 +1,88 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    # Optional, faster codec
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    # Optional, faster codec
+    msgspec = None
+
+
+class JsonCodec:
+    """
+    JSON codec of the standard library, used for request bodies, response bodies and bulk JSONL files.
+    The default, it encodes like HTTPX does for `json=`.
+    """
+
+    def dumps(self, value: Any) -> bytes:
+        """
+        Encode a value to JSON, compact and in UTF-8.
+        """
+
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """
+        Decode JSON to a value.
+        """
+
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    JSON codec backed by orjson, requires `orjson`.
+
+    Differs from `JsonCodec`: dicts with keys which are not strings and integers past 64 bits raise TypeError,
+    NaN and infinity are encoded as null, and integers past 64 bits are decoded as floats.
+    """
+
+    def __init__(self):
+        if orjson is None:
+            raise ValueError("orjson is not installed")
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+class MsgspecCodec(JsonCodec):
+    """
+    JSON codec backed by msgspec, requires `msgspec`.
+
+    Differs from `JsonCodec`: integers past 64 bits raise on encoding and are decoded as floats,
+    and NaN and infinity are encoded as null.
+    """
+
+    def __init__(self):
+        if msgspec is None:
+            raise ValueError("msgspec is not installed")
+        self.encoder = msgspec.json.Encoder()
+        self.decoder = msgspec.json.Decoder()
+
+    def dumps(self, value: Any) -> bytes:
+        return self.encoder.encode(value)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return self.decoder.decode(data)
+
+
+def fastest_codec() -> JsonCodec:
+    """
+    The fastest codec installed: orjson, then msgspec, then the standard library.
+    Opt-in, see the differences of `OrjsonCodec` and `MsgspecCodec`, example: `options.json_codec = fastest_codec()`.
+    """
+
+    if orjson is not None:
+        return OrjsonCodec()
+    if msgspec is not None:
+        return MsgspecCodec()
+    return JsonCodec()
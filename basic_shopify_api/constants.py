@@ -8,8 +8,12 @@ NOT_VERSIONABLE_PATTERN = r"\/(oauth\/access_scopes)"
 LINK_PATTERN = r"<.*?page_info=([a-zA-Z0-9\-_]+).*?>; rel=\"(next|previous)\""
 # Header supplied by Shopify when rate limit is hit
 RETRY_HEADER = "retry-after"
+# Header supplied by Shopify for REST API calls with the bucket usage, example: 32/40
+CALL_LIMIT_HEADER = "x-shopify-shop-api-call-limit"
 # Header supplied by Shopify for REST API calls, used by LINK_PATTERN
 LINK_HEADER = "link"
+# Header to send to revalidate a cached response by its ETag
+ETAG_MATCH_HEADER = "if-none-match"
 # Header to send for public API calls
 ACCESS_TOKEN_HEADER = "x-shopify-access-token"
 # Default API version
@@ -0,0 +1,648 @@
+import asyncio
+import base64
+import json
+import math
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+
+from .bucket import LeakyBucket
+from .constants import CALL_LIMIT_HEADER, LINK_HEADER, ONE_SECOND, RETRY_HEADER
+from .transport import BorrowedTransport
+
+# Status, headers and body of a response of the emulator
+Reply = Tuple[int, List[Tuple[str, str]], bytes]
+
+# REST paths: resources, single records and counts
+REST_PATTERN = re.compile(r"^/admin/api/[^/]+/(?P<resource>[a-z_]+)(?:/(?P<id>\d+|count))?\.json$")
+# GraphQL path
+GRAPHQL_PATTERN = re.compile(r"^/admin/api/[^/]+/graphql\.json$")
+# Results of a bulk operation
+BULK_RESULT_PATTERN = re.compile(r"^/_emulator/bulk/(?P<id>\d+)\.jsonl$")
+# Staged uploads
+UPLOAD_PATH = "/_emulator/uploads"
+# Names in a GraphQL document
+NAME_PATTERN = re.compile(r"[_A-Za-z][_0-9A-Za-z]*")
+# Block strings in a GraphQL document, the queries and mutations of bulk operations
+BLOCK_STRING_PATTERN = re.compile(r'"""([\s\S]*?)"""')
+# Cost of a GraphQL mutation
+MUTATION_COST = 10
+
+
+def encode_cursor(resource: str, offset: int) -> str:
+    """
+    Encode a pagination cursor, valid as a REST page_info and a GraphQL cursor.
+    """
+
+    return base64.urlsafe_b64encode(f"{resource}:{offset}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """
+    Decode a pagination cursor to its offset, 0 for no cursor or an invalid one.
+    """
+
+    if not cursor:
+        return 0
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        return max(int(decoded.rsplit(":", 1)[1]), 0)
+    except (ValueError, IndexError):
+        return 0
+
+
+def parse_multipart(content_type: str, body: bytes) -> Dict[str, bytes]:
+    """
+    Get the fields of a multipart/form-data body, by name.
+    """
+
+    boundary = content_type.split("boundary=")[-1].strip('"').encode("utf-8")
+    fields = {}
+    for part in body.split(b"--" + boundary):
+        head, separator, value = part.partition(b"\r\n\r\n")
+        name = re.search(rb'name="([^"]*)"', head)
+        if separator and name is not None:
+            fields[name.group(1).decode("utf-8")] = value[:-2] if value.endswith(b"\r\n") else value
+    return fields
+
+
+class BulkOperation:
+    """
+    A bulk operation of the emulator. It runs for its number of objects divided by the bulk rate.
+    """
+
+    __slots__ = ("id", "type", "lines", "created_at", "started_at", "duration", "result_url")
+
+    def __init__(self, id: int, type: str, lines: List[bytes], started_at: float, duration: float, result_url: str):
+        self.id = id
+        self.type = type
+        self.lines = lines
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.started_at = started_at
+        self.duration = duration
+        self.result_url = result_url
+
+    @property
+    def gid(self) -> str:
+        return f"gid://shopify/BulkOperation/{self.id}"
+
+    def running(self, now: float) -> bool:
+        return now < self.started_at + self.duration
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        """
+        The bulk operation as returned by GraphQL, at a time in seconds.
+        """
+
+        if self.running(now):
+            done = (now - self.started_at) / self.duration if self.duration else 1.0
+            return {
+                "id": self.gid,
+                "type": self.type,
+                "status": "RUNNING",
+                "errorCode": None,
+                "createdAt": self.created_at,
+                "completedAt": None,
+                "objectCount": str(int(len(self.lines) * done)),
+                "fileSize": None,
+                "url": None,
+                "partialDataUrl": None,
+            }
+
+        return {
+            "id": self.gid,
+            "type": self.type,
+            "status": "COMPLETED",
+            "errorCode": None,
+            "createdAt": self.created_at,
+            "completedAt": self.created_at,
+            "objectCount": str(len(self.lines)),
+            "fileSize": str(sum(len(line) for line in self.lines)),
+            "url": self.result_url if self.lines else None,
+            "partialDataUrl": None,
+        }
+
+
+class EmulatedShop:
+    """
+    The state of a shop of the emulator: its buckets, uploads and bulk operations.
+    """
+
+    __slots__ = ("rest_bucket", "graphql_bucket", "uploads", "operations")
+
+    def __init__(self, rest_bucket: LeakyBucket, graphql_bucket: LeakyBucket):
+        self.rest_bucket = rest_bucket
+        self.graphql_bucket = graphql_bucket
+        # Staged uploads, by key
+        self.uploads: Dict[str, bytes] = {}
+        # Bulk operations, by ID, oldest first
+        self.operations: Dict[int, BulkOperation] = {}
+
+
+class ShopifyEmulator:
+    """
+    Emulates the Shopify Admin API, with its throttling, to measure the client offline.
+
+    It implements:
+    - REST: the leaky bucket with call limit and Retry-After headers, paginated resources with Link headers,
+      single records, counts and writes.
+    - GraphQL: the cost bucket with "throttleStatus" and THROTTLED errors, paginated connections,
+      staged uploads, and bulk query and mutation operations which run for a time.
+
+    Every shop (by host) has its own buckets. Records are generated: `resources` sets how many of each.
+
+    It is an ASGI app. Use it as `options.transport` (AsyncClient), or run it as a local server with `serve`.
+    """
+
+    def __init__(
+        self,
+        resources: Optional[Dict[str, int]] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rest_bucket_size: int = 40,
+        rest_limit: float = 2,
+        graphql_bucket_size: int = 1000,
+        graphql_limit: float = 50,
+        bulk_rate: float = 1000.0,
+        bulk_max_concurrent: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            resources: The number of records of each resource, example: {"products": 250}.
+            latency: Seconds each response is delayed.
+            jitter: Most seconds added at random to the latency.
+            rest_bucket_size: Size of the REST bucket.
+            rest_limit: Calls per second leaked from the REST bucket.
+            graphql_bucket_size: Size of the GraphQL bucket, in cost points.
+            graphql_limit: Cost points restored per second.
+            bulk_rate: Objects per second processed by bulk operations.
+            bulk_max_concurrent: Number of bulk operations of each type a shop can run at once.
+            clock: Source of the current time in seconds.
+        """
+
+        self.resources = {"products": 250, "orders": 250, "customers": 250} if resources is None else resources
+        self.latency = latency
+        self.jitter = jitter
+        self.rest_bucket_size = rest_bucket_size
+        self.rest_limit = rest_limit
+        self.graphql_bucket_size = graphql_bucket_size
+        self.graphql_limit = graphql_limit
+        self.bulk_rate = bulk_rate
+        self.bulk_max_concurrent = bulk_max_concurrent
+        self.clock = clock
+        self.shops: Dict[str, EmulatedShop] = {}
+        self.pool = httpx.ASGITransport(app=self)
+        self.next_id = 1
+        # Number of requests handled
+        self.requests = 0
+        # Number of requests throttled, REST 429s and THROTTLED GraphQL queries
+        self.throttled = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Requests handled and throttled so far.
+        """
+
+        return {"requests": self.requests, "throttled": self.throttled}
+
+    def borrow(self) -> BorrowedTransport:
+        """
+        Get a transport for a client, which sends every request to the emulator.
+        """
+
+        return BorrowedTransport(self.pool)
+
+    async def aclose(self) -> None:
+        pass
+
+    def now(self) -> int:
+        """
+        The current time in ms.
+        """
+
+        return int(self.clock() * ONE_SECOND)
+
+    def shop(self, domain: str) -> EmulatedShop:
+        shop = self.shops.get(domain)
+        if shop is None:
+            shop = EmulatedShop(
+                LeakyBucket(self.rest_bucket_size, self.rest_limit, updated_at=self.now()),
+                LeakyBucket(self.graphql_bucket_size, self.graphql_limit, updated_at=self.now()),
+            )
+            self.shops[domain] = shop
+        return shop
+
+    def record(self, resource: str, index: int, graphql: bool = False) -> Dict[str, Any]:
+        """
+        A generated record of a resource, by its position from 0.
+        """
+
+        name = resource[:-1] if resource.endswith("s") else resource
+        number = index + 1
+        return {
+            "id": f"gid://shopify/{name.title().replace('_', '')}/{number}" if graphql else number,
+            "title": f"{name.replace('_', ' ').title()} {number}",
+        }
+
+    async def handle(
+        self,
+        method: str,
+        base_url: str,
+        host: str,
+        path: str,
+        query: Dict[str, str],
+        headers: Dict[str, str],
+        body: bytes,
+    ) -> Reply:
+        """
+        Handle a request, after the latency.
+
+        Args:
+            method: The HTTP method, upper case.
+            base_url: The scheme and host the request was sent to, for the URLs in responses.
+            host: The host, the shop's domain.
+            path: The URL path.
+            query: The query parameters.
+            headers: The headers, by lower case name.
+            body: The body.
+        """
+
+        self.requests += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        shop = self.shop(host)
+        if GRAPHQL_PATTERN.match(path) and method == "POST":
+            return self._graphql(shop, base_url, json.loads(body or b"{}"))
+        if path == UPLOAD_PATH and method == "POST":
+            fields = parse_multipart(headers.get("content-type", ""), body)
+            shop.uploads[fields["key"].decode("utf-8")] = fields.get("file", b"")
+            return HTTPStatus.CREATED.value, [], b""
+
+        match = BULK_RESULT_PATTERN.match(path)
+        if match is not None and method == "GET":
+            operation = shop.operations.get(int(match.group("id")))
+            if operation is None:
+                return self._json(HTTPStatus.NOT_FOUND.value, {"errors": "Not Found"})
+            return HTTPStatus.OK.value, [("Content-Type", "application/jsonl")], b"".join(operation.lines)
+
+        match = REST_PATTERN.match(path)
+        if match is not None:
+            return self._rest(shop, method, base_url + path, match.group("resource"), match.group("id"), query, body)
+        return self._json(HTTPStatus.NOT_FOUND.value, {"errors": "Not Found"})
+
+    @staticmethod
+    def _json(status: int, document: Any, headers: Optional[List[Tuple[str, str]]] = None) -> Reply:
+        content = json.dumps(document, separators=(",", ":")).encode("utf-8")
+        return status, [("Content-Type", "application/json"), *(headers or [])], content
+
+    def _rest(
+        self,
+        shop: EmulatedShop,
+        method: str,
+        url: str,
+        resource: str,
+        id: Optional[str],
+        query: Dict[str, str],
+        body: bytes,
+    ) -> Reply:
+        bucket = shop.rest_bucket
+        bucket.leak(self.now())
+        throttled = bucket.reserve(1) is not False
+        headers = [(CALL_LIMIT_HEADER, f"{math.ceil(bucket.level)}/{bucket.capacity}")]
+        if throttled:
+            self.throttled += 1
+            errors = "Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service."
+            return self._json(HTTPStatus.TOO_MANY_REQUESTS.value, {"errors": errors}, [*headers, (RETRY_HEADER, "1.0")])
+
+        name = resource[:-1] if resource.endswith("s") else resource
+        if resource == "shop":
+            domain = url.split("/")[2]
+            shop_document = {"id": 1, "name": domain.split(".")[0], "domain": domain}
+            return self._json(HTTPStatus.OK.value, {"shop": shop_document}, headers)
+        if resource not in self.resources:
+            return self._json(HTTPStatus.NOT_FOUND.value, {"errors": "Not Found"}, headers)
+
+        total = self.resources[resource]
+        if method == "POST":
+            document = json.loads(body or b"{}").get(name, {})
+            return self._json(HTTPStatus.CREATED.value, {name: {**document, "id": total + 1}}, headers)
+        if method == "PUT":
+            document = json.loads(body or b"{}").get(name, {})
+            return self._json(HTTPStatus.OK.value, {name: {**document, "id": int(id or 0)}}, headers)
+        if method == "DELETE":
+            return self._json(HTTPStatus.OK.value, {}, headers)
+
+        if id == "count":
+            return self._json(HTTPStatus.OK.value, {"count": total}, headers)
+        if id is not None:
+            if not 0 < int(id) <= total:
+                return self._json(HTTPStatus.NOT_FOUND.value, {"errors": "Not Found"}, headers)
+            return self._json(HTTPStatus.OK.value, {name: self.record(resource, int(id) - 1)}, headers)
+
+        return self._rest_list(url, resource, query, headers)
+
+    def _rest_list(self, url: str, resource: str, query: Dict[str, str], headers: List[Tuple[str, str]]) -> Reply:
+        """
+        A page of a resource, by page_info cursor, with the Link header to the next and previous pages.
+        """
+
+        total = self.resources[resource]
+        limit = min(max(int(query.get("limit", 50)), 1), 250)
+        offset = decode_cursor(query.get("page_info"))
+        records = [self.record(resource, index) for index in range(offset, min(offset + limit, total))]
+        links = []
+        if offset + limit < total:
+            links.append((offset + limit, "next"))
+        if offset > 0:
+            links.append((max(offset - limit, 0), "previous"))
+        if links:
+            headers.append((LINK_HEADER, ", ".join(
+                f'<{url}?limit={limit}&page_info={encode_cursor(resource, page)}>; rel="{rel}"' for page, rel in links
+            )))
+        return self._json(HTTPStatus.OK.value, {resource: records}, headers)
+
+    def _graphql(self, shop: EmulatedShop, base_url: str, request: Dict[str, Any]) -> Reply:
+        query = request.get("query") or ""
+        variables = request.get("variables") or {}
+        if "stagedUploadsCreate" in query:
+            cost, run = MUTATION_COST, lambda: self._staged_upload(base_url, variables)
+        elif "bulkOperationRunMutation" in query:
+            cost, run = MUTATION_COST, lambda: self._bulk_mutation(shop, base_url, query, variables)
+        elif "bulkOperationRunQuery" in query:
+            cost, run = MUTATION_COST, lambda: self._bulk_query(shop, base_url, query)
+        elif "currentBulkOperation" in query:
+            cost, run = 1, lambda: self._current_bulk_operation(shop, query)
+        elif "node(" in query.replace(" ", ""):
+            cost, run = 1, lambda: self._node(shop, variables)
+        else:
+            resource, first, after = self._connection(query, variables)
+            cost, run = 2 + first, lambda: self._page(resource, first, after)
+
+        bucket = shop.graphql_bucket
+        bucket.leak(self.now())
+        if bucket.reserve(cost) is not False:
+            # Not enough points left, nothing is run
+            self.throttled += 1
+            return self._json(HTTPStatus.OK.value, {
+                "errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+                "extensions": {"cost": self._cost(bucket, cost, None)},
+            })
+
+        data, actual = run()
+        bucket.release(cost - actual)
+        return self._json(HTTPStatus.OK.value, {"data": data, "extensions": {"cost": self._cost(bucket, cost, actual)}})
+
+    @staticmethod
+    def _cost(bucket: LeakyBucket, requested: int, actual: Optional[int]) -> Dict[str, Any]:
+        return {
+            "requestedQueryCost": requested,
+            "actualQueryCost": actual,
+            "throttleStatus": {
+                "maximumAvailable": float(bucket.capacity),
+                "currentlyAvailable": int(bucket.available),
+                "restoreRate": float(bucket.leak_rate),
+            },
+        }
+
+    def _resource(self, query: str) -> Optional[str]:
+        """
+        The first resource named in a query.
+        """
+
+        for name in NAME_PATTERN.findall(query):
+            if name in self.resources:
+                return name
+        return None
+
+    def _connection(self, query: str, variables: Dict[str, Any]) -> Tuple[Optional[str], int, Optional[str]]:
+        """
+        The resource, page size and cursor of a paginated query.
+        """
+
+        resource = self._resource(query)
+        if resource is None:
+            return None, 0, None
+
+        arguments = re.search(rf"\b{resource}\s*\(([^)]*)\)", query)
+        arguments = arguments.group(1) if arguments is not None else ""
+
+        def argument(name: str) -> Any:
+            match = re.search(rf"\b{name}\s*:\s*(\$\w+|\d+|\"[^\"]*\"|null)", arguments)
+            if match is None:
+                return None
+            value = match.group(1)
+            if value.startswith("$"):
+                return variables.get(value[1:])
+            if value == "null":
+                return None
+            return value.strip('"') if value.startswith('"') else int(value)
+
+        return resource, min(int(argument("first") or 50), 250), argument("after")
+
+    def _page(self, resource: Optional[str], first: int, after: Optional[str]) -> Tuple[Dict[str, Any], int]:
+        if resource is None:
+            return {}, 1
+
+        total = self.resources[resource]
+        offset = decode_cursor(after)
+        edges = [
+            {"cursor": encode_cursor(resource, index + 1), "node": self.record(resource, index, graphql=True)}
+            for index in range(offset, min(offset + first, total))
+        ]
+        page_info = {
+            "hasNextPage": offset + first < total,
+            "hasPreviousPage": offset > 0,
+            "endCursor": edges[-1]["cursor"] if edges else None,
+        }
+        return {resource: {"edges": edges, "pageInfo": page_info}}, 2 + len(edges)
+
+    def _staged_upload(self, base_url: str, variables: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        key = f"tmp/{uuid.uuid4().hex}/bulk/{variables.get('filename', 'upload.jsonl')}"
+        target = {
+            "url": base_url + UPLOAD_PATH,
+            "resourceUrl": None,
+            "parameters": [{"name": "key", "value": key}, {"name": "Content-Type", "value": "text/jsonl"}],
+        }
+        return {"stagedUploadsCreate": {"userErrors": [], "stagedTargets": [target]}}, MUTATION_COST
+
+    def _start(self, shop: EmulatedShop, base_url: str, type: str, lines: List[bytes]) -> Dict[str, Any]:
+        """
+        Start a bulk operation, or return the user errors if too many of the type are running.
+        """
+
+        now = self.clock()
+        running = [op for op in shop.operations.values() if op.type == type and op.running(now)]
+        if len(running) >= self.bulk_max_concurrent:
+            message = f"A bulk {type.lower()} operation for this app and shop is already in progress: {running[0].gid}."
+            return {"bulkOperation": None, "userErrors": [{"field": None, "message": message}]}
+
+        id = self.next_id
+        self.next_id += 1
+        operation = BulkOperation(
+            id, type, lines, now, len(lines) / self.bulk_rate, f"{base_url}/_emulator/bulk/{id}.jsonl"
+        )
+        shop.operations[id] = operation
+        return {"bulkOperation": {**operation.to_dict(now), "status": "CREATED"}, "userErrors": []}
+
+    def _bulk_query(self, shop: EmulatedShop, base_url: str, query: str) -> Tuple[Dict[str, Any], int]:
+        sub_query = BLOCK_STRING_PATTERN.search(query)
+        resource = self._resource(sub_query.group(1) if sub_query is not None else "")
+        total = self.resources.get(resource, 0) if resource is not None else 0
+        lines = [
+            json.dumps(self.record(resource, index, graphql=True), separators=(",", ":")).encode("utf-8") + b"\n"
+            for index in range(total)
+        ]
+        return {"bulkOperationRunQuery": self._start(shop, base_url, "QUERY", lines)}, MUTATION_COST
+
+    def _bulk_mutation(
+        self,
+        shop: EmulatedShop,
+        base_url: str,
+        query: str,
+        variables: Dict[str, Any],
+    ) -> Tuple[Dict[str, Any], int]:
+        upload = shop.uploads.pop(variables.get("stagedUploadPath"), None)
+        if upload is None:
+            errors = [{"field": ["stagedUploadPath"], "message": "The staged upload path is invalid."}]
+            return {"bulkOperationRunMutation": {"bulkOperation": None, "userErrors": errors}}, MUTATION_COST
+
+        mutation = BLOCK_STRING_PATTERN.search(query)
+        name = re.search(r"\{\s*(\w+)", mutation.group(1) if mutation is not None else "")
+        name = name.group(1) if name is not None else "mutation"
+        lines = [
+            json.dumps(
+                {"data": {name: {"userErrors": [], "input": json.loads(line)}}, "__lineNumber": number},
+                separators=(",", ":"),
+            ).encode("utf-8") + b"\n"
+            for number, line in enumerate(upload.splitlines())
+            if line.strip()
+        ]
+        return {"bulkOperationRunMutation": self._start(shop, base_url, "MUTATION", lines)}, MUTATION_COST
+
+    def _current_bulk_operation(self, shop: EmulatedShop, query: str) -> Tuple[Dict[str, Any], int]:
+        type = "MUTATION" if re.search(r"type\s*:\s*MUTATION", query) else "QUERY"
+        operations = [op for op in shop.operations.values() if op.type == type]
+        current = operations[-1].to_dict(self.clock()) if operations else None
+        return {"currentBulkOperation": current}, 1
+
+    def _node(self, shop: EmulatedShop, variables: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        id = str(variables.get("id", ""))
+        operation = None
+        if id.startswith("gid://shopify/BulkOperation/"):
+            operation = shop.operations.get(int(id.rsplit("/", 1)[1]))
+        return {"node": operation.to_dict(self.clock()) if operation is not None else None}, 1
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        """
+        The ASGI app.
+        """
+
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        host = headers.get("host", "")
+        status, reply_headers, content = await self.handle(
+            scope["method"],
+            f"{scope.get('scheme', 'http')}://{host}",
+            host,
+            scope["path"],
+            dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))),
+            headers,
+            body,
+        )
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in [*reply_headers, ("Content-Length", str(len(content)))]
+            ],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+        """
+        Run the emulator as a local HTTP/1.1 server, for clients which can not use it as a transport.
+        Close the returned server when done.
+
+        Args:
+            host: The host to listen on.
+            port: The port to listen on, 0 for any free port (see `server.sockets[0].getsockname()`).
+        """
+
+        return await asyncio.start_server(self._serve_connection, host, port)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await self._read_body(reader, headers)
+                path, _, query_string = target.partition("?")
+                host = headers.get("host", "")
+                status, reply_headers, content = await self.handle(
+                    method, f"http://{host}", host, path, dict(parse_qsl(query_string)), headers, body
+                )
+                head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+                head += [f"{name}: {value}" for name, value in [*reply_headers, ("Content-Length", str(len(content)))]]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + content)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+        """
+        Read the body of a request, sent whole or in chunks.
+        """
+
+        if headers.get("transfer-encoding", "").lower() != "chunked":
+            return await reader.readexactly(int(headers.get("content-length", 0)))
+
+        body = b""
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                return body
+            body += chunk[:-2]
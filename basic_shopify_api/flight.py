@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Shares one call between identical read requests in flight at the same time,
+    so only the first spends the rate limits and a round-trip, and the rest get its result.
+
+    Set it as `options.single_flight`, every `AsyncClient` using the options shares it.
+    """
+
+    def __init__(self):
+        # Calls in flight, by request key
+        self.calls: Dict[str, "asyncio.Future[Any]"] = {}
+        # Number of calls sent
+        self.sent = 0
+        # Number of requests which shared a call already in flight
+        self.coalesced = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Calls sent, requests coalesced, and calls in flight.
+        """
+
+        return {"sent": self.sent, "coalesced": self.coalesced, "in_flight": len(self.calls)}
+
+    async def run(self, key: str, send: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Send the request, or wait for the identical one in flight.
+
+        The call runs on its own, so cancelling one of the requests leaves the call to the others.
+
+        Args:
+            key: The key of the request, by shop and normalized request.
+            send: Sends the request and returns the result.
+        """
+
+        call = self.calls.get(key)
+        if call is None or call.done():
+            self.sent += 1
+            call = asyncio.ensure_future(send())
+            self.calls[key] = call
+
+            def landed(done: "asyncio.Future[Any]") -> None:
+                # A newer call may already have taken the key
+                if self.calls.get(key) is done:
+                    del self.calls[key]
+
+            call.add_done_callback(landed)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(call)
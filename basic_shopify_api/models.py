@@ -1,7 +1,12 @@
-from typing import Optional
+import re
+from typing import Any, Callable, Optional
 from httpx._models import Response
 from http import HTTPStatus
-from .types import ParsedBody, ParsedError
+from .constants import LINK_HEADER, LINK_PATTERN
+from .types import Decoded, ParsedBody, ParsedError
+
+# Compiled LINK_PATTERN
+LINK_REGEX = re.compile(LINK_PATTERN)
 
 
 class Session:
@@ -17,28 +22,153 @@ class Session:
 
 
 class RestLink:
+    __slots__ = ("next", "prev")
+
     def __init__(self, next: Optional[str], prev: Optional[str]):
         self.next = next
         self.prev = prev
 
+    @classmethod
+    def from_header(cls, header: Optional[str]) -> "RestLink":
+        """
+        Extract the page info for the next and previous calls from the link header of a paginated REST response.
+
+        Args:
+            header: The value of the link header, None if there is none.
+        """
+
+        link = {"next": None, "prev": None}
+        if header:
+            for result in LINK_REGEX.findall(header):
+                link[result[1][0:4]] = result[0]
+        return cls(**link)
+
 
 class ApiResult:
+    """
+    Result of an API call.
+
+    The body is decoded, and split into `body` and `errors`, only when either is first accessed.
+    """
+
+    __slots__ = ("response", "status", "retries", "_body", "_errors", "_decoded", "_loads")
+
     def __init__(
         self,
         response: Response,
         status: HTTPStatus,
-        body: ParsedBody,
-        errors: ParsedError,
+        body: ParsedBody = None,
+        errors: ParsedError = None,
         retries: int = 0,
+        decoded: Optional[Decoded] = None,
+        loads: Optional[Callable[[bytes], Any]] = None,
     ):
+        """
+        Args:
+            response: The response from HTTPX.
+            status: The HTTP status code.
+            body: The JSON body, if already parsed.
+            errors: The errors, if already parsed.
+            retries: The number of retries for the request.
+            decoded: The decoded body and decoding exception, to parse lazily.
+            loads: Decodes the body to parse lazily, when not already decoded.
+        """
+
         self.response = response
         self.status = status,
-        self.body = body
-        self.errors = errors
         self.retries = retries
+        self._body = body
+        self._errors = errors
+        self._decoded = decoded
+        self._loads = loads
+
+    def _parse(self) -> None:
+        """
+        Parse the body into `body` and `errors`, once.
+        """
+
+        loads = self._loads
+        decoded = self._decoded
+        if loads is None and decoded is None:
+            return
+        self._loads = self._decoded = None
+
+        if decoded is None:
+            try:
+                decoded = (loads(self.response.content), None)
+            except Exception as e:
+                decoded = (None, e)
+
+        # On a decoding failure, keep the exception and kill the body
+        body, errors = decoded
+        if isinstance(body, dict) and ("errors" in body or "error" in body):
+            # JSON body has an "error" or "errors" key, grab it, kill the body
+            errors = body.get("errors", body.get("error", None))
+            body = None
+        self._body = body
+        self._errors = errors
+
+    @property
+    def body(self) -> ParsedBody:
+        self._parse()
+        return self._body
+
+    @body.setter
+    def body(self, value: ParsedBody) -> None:
+        self._parse()
+        self._body = value
+
+    @property
+    def errors(self) -> ParsedError:
+        self._parse()
+        return self._errors
+
+    @errors.setter
+    def errors(self, value: ParsedError) -> None:
+        self._parse()
+        self._errors = value
 
 
 class RestResult(ApiResult):
-    def __init__(self, link: RestLink, **kwargs):
+    """
+    Result of a REST API call, the link is extracted from the headers only when first accessed.
+    """
+
+    __slots__ = ("_link",)
+
+    def __init__(self, link: Optional[RestLink] = None, **kwargs):
         super().__init__(**kwargs)
-        self.link = link
+        self._link = link
+
+    @property
+    def link(self) -> RestLink:
+        if self._link is None:
+            self._link = RestLink.from_header(self.response.headers.get(LINK_HEADER))
+        return self._link
+
+    @link.setter
+    def link(self, value: RestLink) -> None:
+        self._link = value
+
+
+class BulkProgress:
+    def __init__(
+        self,
+        job_id: str,
+        status: str,
+        object_count: int,
+        file_size: int,
+        elapsed: float,
+        rate: float,
+        eta: Optional[float],
+    ):
+        self.job_id = job_id
+        self.status = status
+        self.object_count = object_count
+        self.file_size = file_size
+        # Seconds since polling started
+        self.elapsed = elapsed
+        # Objects processed per second
+        self.rate = rate
+        # Seconds until the job is expected to complete, if the number of objects is known
+        self.eta = eta
@@ -1,8 +1,57 @@
 from http import HTTPStatus
-from .store import TimeMemoryStore, CostMemoryStore
+from .store import BoundedMemoryStore, StateStore
+from .bucket import CostEstimator
+from .codec import JsonCodec
+from .retry import RetryBudget
 from .deferrer import SleepDeferrer
-from .constants import DEFAULT_VERSION, DEFAULT_MODE, ALT_MODE, VERSION_PATTERN
+from .constants import DEFAULT_VERSION, DEFAULT_MODE, ALT_MODE, VERSION_PATTERN, ONE_SECOND
 import re
+import warnings
+from typing import Any, Mapping
+
+
+class Headers(dict):
+    """
+    The headers of the options, counting their changes so clients know when to rebuild the headers they prebuilt.
+    """
+
+    __slots__ = ("revision",)
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.revision = 0
+
+    def __setitem__(self, key: str, value: str) -> None:
+        super().__setitem__(key, value)
+        self.revision += 1
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self.revision += 1
+
+    def __ior__(self, other: Mapping[str, str]) -> "Headers":
+        self.update(other)
+        return self
+
+    def clear(self) -> None:
+        super().clear()
+        self.revision += 1
+
+    def pop(self, *args: Any) -> Any:
+        self.revision += 1
+        return super().pop(*args)
+
+    def popitem(self) -> Any:
+        self.revision += 1
+        return super().popitem()
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        self.revision += 1
+        return super().setdefault(key, default)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        super().update(*args, **kwargs)
+        self.revision += 1
 
 
 class Options(object):
@@ -16,21 +65,45 @@ class Options(object):
             HTTPStatus.SERVICE_UNAVAILABLE.value,
             HTTPStatus.GATEWAY_TIMEOUT.value,
         ]
+        # Backoff in ms of the first retry Shopify gave no timing for, doubled for each retry and jittered
+        self.retry_backoff = ONE_SECOND // 2
+        # Longest backoff in ms between retries
+        self.retry_max_backoff = 10 * ONE_SECOND
+        # Retries allowed per shop, so retries cannot pile onto an outage, None for no limit
+        self.retry_budget = RetryBudget()
+        # Time in ms a call may take with its retries, no retry is made past it, None for no limit
+        self.retry_deadline = None
+        # Circuit breaker per shop, calls to a failing shop fail fast, None to disable
+        self.circuit_breaker = None
         # Always send these headers with every request
         self.headers = {
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
-        # Time storage implementation (REST & GraphQL)
-        self.time_store = TimeMemoryStore()
-        # Cost storage implementation (GraphQL)
-        self.cost_store = CostMemoryStore()
+        # Bucket storage implementation (REST)
+        self.rest_bucket_store = BoundedMemoryStore()
+        # Bucket storage implementation (GraphQL)
+        self.graphql_bucket_store = BoundedMemoryStore()
+        # Estimated cost of GraphQL queries, to reserve before the query is sent
+        self.cost_estimator = CostEstimator()
+        # Cache of REST GET and GraphQL query responses, None to disable
+        self.response_cache = None
+        # Shares one call between identical read requests in flight (AsyncClient), None to disable
+        self.single_flight = None
+        # Connection pool shared by AsyncClients and their bulk transfers, None for a pool per client
+        self.transport = None
+        # JSON codec for request bodies, response bodies and bulk files
+        self.json_codec = JsonCodec()
         # Deferrer implementation for getting current time and sleeping
         self.deferrer = SleepDeferrer()
-        # Number of calls per second for REST... 2 for regulatr, 4 for plus
+        # Number of calls per second leaked from the REST bucket... 2 for regular, scaled up for plus
         self.rest_limit = 2
-        # Number of cost points allowed per second for GraphQL... 50 for regular, 100 for plus
+        # Size of the REST bucket... 40 for regular, plus is detected from the call limit header
+        self.rest_bucket_size = 40
+        # Number of cost points restored per second for GraphQL... 50 for regular, plus is detected from the response
         self.graphql_limit = 50
+        # Size of the GraphQL bucket... 1000 for regular, plus is detected from the response
+        self.graphql_bucket_size = 1000
         # Methods to run before firing REST API calls
         self.rest_pre_actions = []
         # Methods to run after firing REST API calls
@@ -39,11 +112,34 @@ class Options(object):
         self.graphql_pre_actions = []
         # Methods to run after firing GraphQL API calls
         self.graphql_post_actions = []
+        # Bytes of bulk operation results kept in memory before spooling to disk
+        self.bulk_spool_size = 10 * 1024 * 1024
+        # Bytes of a bulk mutation file, larger mutations are split into more bulk operations
+        self.bulk_mutation_max_size = 100 * 1000 * 1000
+        # Number of bulk operations of each type a shop can run at once... 1 before API version 2026-01
+        self.bulk_max_concurrent = 1
+        # Shortest time in ms to wait between polls of a bulk operation
+        self.bulk_poll_interval = ONE_SECOND
+        # Longest time in ms to wait between polls of a bulk operation
+        self.bulk_poll_max_interval = 30 * ONE_SECOND
+        # Fraction of the time a bulk operation has been running to wait before polling again
+        self.bulk_poll_backoff = 0.1
+        # Time in ms to wait for a bulk operation to complete, None for no limit
+        self.bulk_poll_timeout = None
         # Version to use for API calls
         self._version = DEFAULT_VERSION
         # Mode to use... public or private
         self._mode = DEFAULT_MODE
 
+    @property
+    def headers(self) -> Headers:
+        return self._headers
+
+    @headers.setter
+    def headers(self, value: Mapping[str, str]) -> None:
+        # Copied, so changes made to it in place are counted
+        self._headers = value if isinstance(value, Headers) else Headers(value)
+
     @property
     def version(self) -> str:
         return self._version
@@ -64,6 +160,34 @@ class Options(object):
             raise ValueError(f"Type must be either {DEFAULT_MODE} or {ALT_MODE}")
         self._mode = value
 
+    @property
+    def time_store(self) -> StateStore:
+        """
+        Deprecated, alias of `rest_bucket_store`.
+        """
+
+        warnings.warn("time_store is deprecated, use rest_bucket_store", DeprecationWarning, stacklevel=2)
+        return self.rest_bucket_store
+
+    @time_store.setter
+    def time_store(self, value: StateStore) -> None:
+        warnings.warn("time_store is deprecated, use rest_bucket_store", DeprecationWarning, stacklevel=2)
+        self.rest_bucket_store = value
+
+    @property
+    def cost_store(self) -> StateStore:
+        """
+        Deprecated, alias of `graphql_bucket_store`.
+        """
+
+        warnings.warn("cost_store is deprecated, use graphql_bucket_store", DeprecationWarning, stacklevel=2)
+        return self.graphql_bucket_store
+
+    @cost_store.setter
+    def cost_store(self, value: StateStore) -> None:
+        warnings.warn("cost_store is deprecated, use graphql_bucket_store", DeprecationWarning, stacklevel=2)
+        self.graphql_bucket_store = value
+
     @property
     def is_public(self) -> bool:
         return self.mode == DEFAULT_MODE
@@ -0,0 +1,184 @@
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from .clients import AsyncClient
+from .models import Session
+from .options import Options
+from .transport import SharedTransport
+
+
+class PooledClient:
+    """
+    A client held by a `ClientPool`, with its bookkeeping.
+    """
+
+    __slots__ = ("client", "touched_at", "in_use", "retired")
+
+    def __init__(self, client: AsyncClient, touched_at: float):
+        self.client = client
+        self.touched_at = touched_at
+        # Number of `ClientPool.client` blocks using the client, it is not evicted meanwhile
+        self.in_use = 0
+        # Removed from the pool while in use, closed once the last block exits
+        self.retired = False
+
+
+class ClientPool:
+    """
+    Hands out an `AsyncClient` per shop, created on first use and reused after.
+
+    Every client shares the options, so the rate limit stores and `options.transport`.
+    If no transport is set, the pool sets a `SharedTransport` of its own and closes it with the pool.
+
+    Clients idle for longer than `ttl` seconds are closed, and past `max_clients`
+    the least recently used client is closed.
+    """
+
+    def __init__(
+        self,
+        options: Options,
+        max_clients: int = 1000,
+        ttl: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+        **kwargs: Any,
+    ):
+        """
+        Args:
+            options: The options for every client.
+            max_clients: Number of clients to hold.
+            ttl: Seconds a client can be idle before it is closed.
+            clock: Source of the current time in seconds.
+            kwargs: Passed on to every `AsyncClient`, example: `timeout`.
+        """
+
+        self.options = options
+        self.max_clients = max_clients
+        self.ttl = ttl
+        self.clock = clock
+        self.kwargs = kwargs
+        self.owns_transport = options.transport is None
+        if self.owns_transport:
+            options.transport = SharedTransport()
+        self.container: "OrderedDict[str, PooledClient]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.container)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Hits, misses and evictions of the pool so far, and the number of clients held.
+        """
+
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self)}
+
+    async def get(self, session: Session) -> AsyncClient:
+        """
+        Get the client for the session's shop, marking it as most recently used.
+        Idle and least recently used clients are closed along the way.
+
+        A client from `get` may be closed by a later eviction, use `client` to hold on to it for a while.
+
+        Args:
+            session: The shop's session. If the credentials changed, a new client is created.
+        """
+
+        return (await self._checkout(session)).client
+
+    @asynccontextmanager
+    async def client(self, session: Session) -> AsyncIterator[AsyncClient]:
+        """
+        Use the client for the session's shop, it is not closed until the block exits,
+        even if the credentials change meanwhile.
+
+        Args:
+            session: The shop's session.
+        """
+
+        pooled = await self._checkout(session)
+        pooled.in_use += 1
+        try:
+            yield pooled.client
+        finally:
+            pooled.in_use -= 1
+            pooled.touched_at = self.clock()
+            if pooled.retired and not pooled.in_use:
+                await pooled.client.aclose()
+
+    async def _checkout(self, session: Session) -> PooledClient:
+        now = self.clock()
+        domain = session.domain
+        pooled = self.container.get(domain)
+        if pooled is not None and not self._matches(pooled.client.session, session):
+            # Credentials changed, example: a new access token
+            await self._evict(domain)
+            pooled = None
+
+        if pooled is None:
+            self.misses += 1
+            pooled = PooledClient(AsyncClient(session, self.options, **self.kwargs), now)
+            self.container[domain] = pooled
+        else:
+            self.hits += 1
+            self.container.move_to_end(domain)
+            pooled.touched_at = now
+
+        await self._evict_idle(now, domain)
+        return pooled
+
+    @staticmethod
+    def _matches(current: Session, session: Session) -> bool:
+        return (current.key, current.password, current.secret) == (session.key, session.password, session.secret)
+
+    async def _evict_idle(self, now: float, keep: str) -> None:
+        """
+        Close clients past `max_clients` and past `ttl`, least recently used first.
+        Clients in use, and the client of `keep` being checked out, are skipped.
+        """
+
+        evict: List[str] = []
+        over = len(self.container) - self.max_clients
+        for domain, pooled in self.container.items():
+            if pooled.in_use or domain == keep:
+                continue
+            if over > 0:
+                over -= 1
+            elif now - pooled.touched_at <= self.ttl:
+                # Least recently used are at the front, stop at the first one still fresh
+                break
+            evict.append(domain)
+
+        for domain in evict:
+            await self._evict(domain)
+
+    async def _evict(self, domain: str) -> None:
+        pooled = self.container.pop(domain)
+        self.evictions += 1
+        if pooled.in_use:
+            # Closed by the last block using it
+            pooled.retired = True
+        else:
+            await pooled.client.aclose()
+
+    async def aclose(self) -> None:
+        """
+        Close every client, and the transport if the pool created it.
+        """
+
+        while self.container:
+            _, pooled = self.container.popitem(last=False)
+            await pooled.client.aclose()
+        if self.owns_transport:
+            await self.options.transport.aclose()
+            self.options.transport = None
+
+    async def __aenter__(self) -> "ClientPool":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
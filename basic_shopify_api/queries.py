@@ -0,0 +1,115 @@
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+# Directory of the GraphQL templates shipped with the package
+GQL_DIR = Path(__file__).parent / "gql"
+
+
+# Tokens of a GraphQL document, the placeholders of templates are kept as names
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<ignored>[\s,\ufeff]+|\#[^\n\r]*)
+    | (?P<string>\"\"\"(?:\\\"\"\"|(?!\"\"\")[\s\S])*(?:\"\"\"|$)|"(?:\\.|[^"\\\n\r])*"?)
+    | (?P<word>[_A-Za-z][_0-9A-Za-z]*|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|%\(\w+\)s)
+    | (?P<punctuator>\.\.\.|[\s\S])
+    """,
+    re.VERBOSE,
+)
+
+
+@lru_cache(maxsize=1024)
+def minify_query(query: str) -> str:
+    """
+    Minify a GraphQL document: comments, commas and whitespace are dropped,
+    except a single space between names and numbers. Strings and block strings are kept as they are.
+
+    Results are memoized by the text of the document.
+
+    Args:
+        query: The GraphQL document.
+    """
+
+    tokens: List[str] = []
+    word = False
+    for match in TOKEN_PATTERN.finditer(query):
+        kind = match.lastgroup
+        if kind == "ignored":
+            continue
+
+        is_word = kind == "word"
+        if is_word and word:
+            # Two names (or numbers) in a row need a separator
+            tokens.append(" ")
+        tokens.append(match.group())
+        word = is_word
+    return "".join(tokens)
+
+
+class QueryRegistry:
+    """
+    The GraphQL templates of a directory, loaded and minified once.
+
+    Rendered templates and minified user queries are cached, the least recently used are forgotten first,
+    so repeated calls do no disk I/O and no string processing.
+    """
+
+    def __init__(self, path: Path = GQL_DIR, max_size: int = 256):
+        """
+        Args:
+            path: The directory of the `.gql` templates, named by their file name without extension.
+            max_size: The number of rendered documents and user queries to remember.
+        """
+
+        self.max_size = max_size
+        self.templates = {file.stem: minify_query(file.read_text()) for file in sorted(path.glob("*.gql"))}
+        self.container: "OrderedDict[Tuple[Any, ...], str]" = OrderedDict()
+
+    def _cached(self, key: Tuple[Any, ...]) -> Optional[str]:
+        document = self.container.get(key)
+        if document is not None:
+            self.container.move_to_end(key)
+        return document
+
+    def _remember(self, key: Tuple[Any, ...], document: str) -> str:
+        self.container[key] = document
+        if len(self.container) > self.max_size:
+            self.container.popitem(last=False)
+        return document
+
+    def render(self, name: str, **params: str) -> str:
+        """
+        Render a template, each parameter is minified before it is placed.
+
+        Args:
+            name: The name of the template, example: "bulkoperation".
+            params: The values of the template's `%(name)s` placeholders.
+        """
+
+        key = (name, *sorted(params.items()))
+        document = self._cached(key)
+        if document is None:
+            document = self._remember(
+                key, self.templates[name] % {param: minify_query(value) for param, value in params.items()}
+            )
+        return document
+
+    def parse(self, query: str) -> str:
+        """
+        Minify a user query.
+
+        Args:
+            query: The GraphQL document.
+        """
+
+        key = (None, query)
+        document = self._cached(key)
+        if document is None:
+            document = self._remember(key, minify_query(query))
+        return document
+
+
+# Registry of the package's templates
+queries = QueryRegistry()
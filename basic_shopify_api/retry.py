@@ -0,0 +1,88 @@
+import random
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from .bucket import LeakyBucket
+
+
+def full_jitter(
+    retries: int,
+    base: float,
+    cap: float,
+    rand: Callable[[], float] = random.random,
+) -> float:
+    """
+    Time in ms to wait before a retry: exponential backoff with full jitter,
+    a random time between 0 and `base * 2 ** retries`, capped.
+
+    The randomness spreads out the retries of calls which failed together,
+    so they do not hit Shopify again all at the same moment.
+
+    Args:
+        retries: The number of retries done so far.
+        base: The backoff of the first retry in ms.
+        cap: The longest backoff in ms.
+        rand: Source of random numbers between 0 and 1.
+    """
+
+    return rand() * min(cap, base * 2 ** retries)
+
+
+class RetryBudget:
+    """
+    Retries allowed per shop, a token bucket: `capacity` retries at once, restored at `refill_rate` per second.
+
+    Once a shop's budget is spent, failed calls are returned as they are instead of retried,
+    so retries cannot pile onto Shopify while it is failing.
+    """
+
+    def __init__(self, capacity: float = 10, refill_rate: float = 1.0, max_shops: int = 10000):
+        """
+        Args:
+            capacity: The number of retries a shop can burst.
+            refill_rate: The number of retries restored per second.
+            max_shops: The number of shops to track, the least recently used are forgotten first.
+        """
+
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_shops = max_shops
+        # Retries spent per shop, leaked back at the refill rate
+        self.container: "OrderedDict[str, LeakyBucket]" = OrderedDict()
+        # Number of retries allowed
+        self.allowed = 0
+        # Number of retries refused for lack of budget
+        self.denied = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Retries allowed and refused so far.
+        """
+
+        return {"allowed": self.allowed, "denied": self.denied}
+
+    def withdraw(self, domain: str, now: int) -> bool:
+        """
+        Take a retry from the shop's budget, returns False if it is spent.
+
+        Args:
+            domain: The shop's domain.
+            now: The current time in ms.
+        """
+
+        bucket = self.container.get(domain)
+        if bucket is None:
+            bucket = LeakyBucket(self.capacity, self.refill_rate, updated_at=now)
+            self.container[domain] = bucket
+            if len(self.container) > self.max_shops:
+                self.container.popitem(last=False)
+        else:
+            self.container.move_to_end(domain)
+
+        bucket.leak(now)
+        if bucket.reserve(1) is False:
+            self.allowed += 1
+            return True
+        self.denied += 1
+        return False
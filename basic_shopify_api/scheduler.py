@@ -0,0 +1,247 @@
+import asyncio
+import heapq
+from itertools import chain, count
+from typing import (Any, Awaitable, Callable, Dict, Generator, List, Optional,
+                    Set, Tuple)
+
+from .bulk import BulkRows
+from .models import BulkProgress
+
+# Key of a queue, the shop's domain and the job type
+QueueKey = Tuple[str, str]
+# Entry of a queue, ordered by priority (highest first), then by submission
+QueueEntry = Tuple[int, int, "BulkJob"]
+
+
+class BulkJob:
+    """
+    Handle of a bulk operation submitted to a `BulkScheduler`.
+    Await it for the result of the bulk operation.
+    """
+
+    def __init__(self, client: Any, job_type: str, priority: int, start: Callable[[], Awaitable[Any]]):
+        """
+        Args:
+            client: The AsyncClient of the shop.
+            job_type: "QUERY" or "MUTATION".
+            priority: Jobs of a higher priority start first.
+            start: Runs the bulk operation until it is complete.
+        """
+
+        self.client = client
+        self.job_type = job_type
+        self.priority = priority
+        # "QUEUED", "RUNNING", "COMPLETED", "FAILED" or "CANCELLED"
+        self.status = "QUEUED"
+        self._start = start
+        self._future: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+        self._task: Optional["asyncio.Task[Any]"] = None
+
+    @property
+    def key(self) -> QueueKey:
+        return (self.client.session.domain, self.job_type)
+
+    def __await__(self) -> Generator[Any, None, Any]:
+        return asyncio.shield(self._future).__await__()
+
+    def done(self) -> bool:
+        """
+        Determine if the job is complete, failed or cancelled.
+        """
+
+        return self._future.done()
+
+    def result(self) -> Any:
+        """
+        Get the result of the job, raises if it is not done or failed.
+        """
+
+        return self._future.result()
+
+    def cancel(self) -> bool:
+        """
+        Cancel the job. A queued job is never started; a running job stops waiting,
+        but the bulk operation itself keeps running on Shopify's side.
+        """
+
+        if self._future.done():
+            return False
+        if self._task is not None:
+            self._task.cancel()
+        else:
+            self.status = "CANCELLED"
+            self._future.cancel()
+        return True
+
+
+class BulkScheduler:
+    """
+    Queues bulk operations per shop and starts each one as soon as the shop has a free slot,
+    `options.bulk_max_concurrent` of each job type.
+
+    Slots are freed as jobs complete, so thousands of shops can be submitted at once
+    without polling `is_bulk_job_running`.
+    """
+
+    def __init__(self, max_running: Optional[int] = None):
+        """
+        Args:
+            max_running: The number of jobs to run at once over all shops, `None` for no limit.
+        """
+
+        self.max_running = max_running
+        self.running = 0
+        self._sequence = count()
+        # Jobs which may start, over all shops
+        self._ready: List[QueueEntry] = []
+        # Jobs held back until their shop has a free slot
+        self._parked: Dict[QueueKey, List[QueueEntry]] = {}
+        # Running jobs per shop and job type
+        self._slots: Dict[QueueKey, int] = {}
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of jobs waiting to start.
+        """
+
+        entries = chain(self._ready, *self._parked.values())
+        return sum(1 for _, _, job in entries if not job.done())
+
+    def submit_query(
+        self,
+        client: Any,
+        sub_query: str,
+        variables: Optional[Dict[str, Any]] = None,
+        priority: int = 0,
+        assemble: bool = False,
+        progress: Optional[Callable[[BulkProgress], Any]] = None,
+    ) -> BulkJob:
+        """
+        Queue a bulk query, see `AsyncClient.run_bulk_operation_query`.
+
+        Args:
+            client: The AsyncClient of the shop.
+            sub_query: The GraphQL query.
+            variables: The variables of the query.
+            priority: Jobs of a higher priority start first.
+            assemble: Nest child rows into their parents.
+            progress: Called with the progress of the job.
+        """
+
+        async def start() -> Any:
+            return await client.run_bulk_operation_query(sub_query, variables or {}, True, assemble, progress)
+
+        return self._submit(BulkJob(client, "QUERY", priority, start))
+
+    def submit_mutation(
+        self,
+        client: Any,
+        query: str,
+        rows: BulkRows,
+        key: Optional[str] = "input",
+        priority: int = 0,
+        progress: Optional[Callable[[BulkProgress], Any]] = None,
+    ) -> BulkJob:
+        """
+        Queue a bulk mutation, see `AsyncClient.run_bulk_operation_mutation`.
+
+        Args:
+            client: The AsyncClient of the shop.
+            query: The GraphQL mutation.
+            rows: The rows to run the mutation for.
+            key: Wrap each row in a dict under this key.
+            priority: Jobs of a higher priority start first.
+            progress: Called with the progress of the job.
+        """
+
+        async def start() -> Any:
+            return await client.run_bulk_operation_mutation(query, rows, key, True, progress)
+
+        return self._submit(BulkJob(client, "MUTATION", priority, start))
+
+    async def join(self) -> None:
+        """
+        Wait until every submitted job is done.
+        """
+
+        # Queued jobs only wait on running ones, which start them as they finish
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    async def close(self) -> None:
+        """
+        Cancel every queued and running job.
+        """
+
+        for entries in [self._ready, *self._parked.values()]:
+            for _, _, job in entries:
+                job.cancel()
+        self._ready.clear()
+        self._parked.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    def _submit(self, job: BulkJob) -> BulkJob:
+        heapq.heappush(self._ready, (-job.priority, next(self._sequence), job))
+        self._dispatch()
+        return job
+
+    def _has_slot(self, key: QueueKey, job: BulkJob) -> bool:
+        return self._slots.get(key, 0) < max(job.client.options.bulk_max_concurrent, 1)
+
+    def _dispatch(self) -> None:
+        """
+        Start the best jobs which fit, parking the ones of full shops until a slot frees.
+        """
+
+        while self._ready and (self.max_running is None or self.running < self.max_running):
+            entry = heapq.heappop(self._ready)
+            job = entry[2]
+            if job.done():
+                continue
+
+            key = job.key
+            if not self._has_slot(key, job):
+                heapq.heappush(self._parked.setdefault(key, []), entry)
+                continue
+            self._start(key, job)
+
+    def _start(self, key: QueueKey, job: BulkJob) -> None:
+        self._slots[key] = self._slots.get(key, 0) + 1
+        self.running += 1
+        job.status = "RUNNING"
+        job._task = asyncio.ensure_future(job._start())
+        self._tasks.add(job._task)
+        job._task.add_done_callback(lambda task: self._finish(key, job, task))
+
+    def _finish(self, key: QueueKey, job: BulkJob, task: "asyncio.Task[Any]") -> None:
+        self._tasks.discard(task)
+        self.running -= 1
+        self._slots[key] -= 1
+        if not self._slots[key]:
+            del self._slots[key]
+
+        if task.cancelled():
+            job.status = "CANCELLED"
+            job._future.cancel()
+        elif task.exception() is not None:
+            job.status = "FAILED"
+            job._future.set_exception(task.exception())
+        else:
+            job.status = "COMPLETED"
+            job._future.set_result(task.result())
+
+        # The shop has a free slot, its best parked job may start again
+        parked = self._parked.get(key, [])
+        while parked:
+            entry = heapq.heappop(parked)
+            if not entry[2].done():
+                heapq.heappush(self._ready, entry)
+                break
+        if not parked:
+            self._parked.pop(key, None)
+        self._dispatch()
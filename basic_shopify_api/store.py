@@ -1,7 +1,23 @@
 from .models import Session
 from abc import ABC, abstractmethod
-from typing import List
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Callable, ContextManager, Iterable, Iterator, List, Optional
 from .types import StoreValue, StoreContainer
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Not available on Windows
+    fcntl = None
 
 
 class StateStore(ABC):
@@ -36,6 +52,23 @@ class StateStore(ABC):
 
         pass  # pragma: no cover
 
+    def replace(self, session: Session, values: List[StoreValue]) -> None:
+        """
+        Replace all entries for a session in the container.
+        """
+
+        self.reset(session)
+        for value in values:
+            self.append(session, value)
+
+    def lock(self, session: Session) -> ContextManager:
+        """
+        Lock the entries for a session, so they can be read and written back atomically.
+        Stores shared between threads or processes should override this.
+        """
+
+        return nullcontext()
+
 
 class TimeMemoryStore(StateStore):
     def all(self, session: Session) -> List[StoreValue]:
@@ -73,3 +106,304 @@ class CostMemoryStore(StateStore):
 
     def reset(self, session: Session) -> None:
         self.container[session.domain] = []
+
+
+class BucketMemoryStore(StateStore):
+    def all(self, session: Session) -> List[StoreValue]:
+        domain = session.domain
+        if domain not in self.container:
+            # Trigger creation of dict for shop
+            self.reset(session)
+        return self.container[domain]
+
+    def append(self, session: Session, value: StoreValue) -> None:
+        domain = session.domain
+        if domain not in self.container:
+            # Trigger creation of dict for shop
+            self.reset(session)
+        self.container[domain].append(value)
+
+    def reset(self, session: Session) -> None:
+        self.container[session.domain] = []
+
+    def replace(self, session: Session, values: List[StoreValue]) -> None:
+        self.container[session.domain] = list(values)
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer of values, once full the oldest value is overwritten.
+    """
+
+    __slots__ = ("values", "start", "count", "touched_at")
+
+    def __init__(self, size: int):
+        self.values = array("d", bytes(8 * size))
+        self.start = 0
+        self.count = 0
+        self.touched_at = 0.0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def all(self) -> List[StoreValue]:
+        size = len(self.values)
+        return [self.values[(self.start + i) % size] for i in range(self.count)]
+
+    def append(self, value: StoreValue) -> None:
+        size = len(self.values)
+        if self.count < size:
+            self.values[(self.start + self.count) % size] = value
+            self.count += 1
+        else:
+            # Full, overwrite the oldest
+            self.values[self.start] = value
+            self.start = (self.start + 1) % size
+
+    def clear(self) -> None:
+        self.start = 0
+        self.count = 0
+
+    def replace(self, values: Iterable[StoreValue]) -> None:
+        self.clear()
+        for value in values:
+            self.append(value)
+
+
+class BoundedMemoryStore(StateStore):
+    """
+    In-memory store with a fixed amount of memory, for processes serving many shops.
+
+    Each shop holds a ring buffer of `size` values. Shops idle for longer than `ttl` seconds
+    are forgotten, and past `max_shops` the least recently used shop is forgotten.
+    Buckets are empty again once drained, so forgetting an idle shop loses nothing.
+    """
+
+    def __init__(
+        self,
+        size: int = 8,
+        max_shops: int = 10000,
+        ttl: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            size: Number of values each shop can hold, the oldest are overwritten first.
+            max_shops: Number of shops to hold.
+            ttl: Seconds a shop can be idle before it is forgotten.
+            clock: Source of the current time in seconds.
+        """
+
+        super().__init__()
+        self.size = size
+        self.max_shops = max_shops
+        self.ttl = ttl
+        self.clock = clock
+        self.container: "OrderedDict[str, RingBuffer]" = OrderedDict()
+
+    def _buffer(self, session: Session) -> RingBuffer:
+        """
+        Get the buffer for the session, marking it as most recently used.
+        Idle and least recently used shops are evicted along the way.
+        """
+
+        now = self.clock()
+        domain = session.domain
+        buffer = self.container.get(domain)
+        if buffer is None:
+            buffer = RingBuffer(self.size)
+            self.container[domain] = buffer
+        else:
+            self.container.move_to_end(domain)
+        buffer.touched_at = now
+
+        # Least recently used are at the front, stop at the first one still in use
+        while len(self.container) > self.max_shops:
+            self.container.popitem(last=False)
+        while self.container:
+            oldest = next(iter(self.container.values()))
+            if now - oldest.touched_at <= self.ttl:
+                break
+            self.container.popitem(last=False)
+
+        return buffer
+
+    def all(self, session: Session) -> List[StoreValue]:
+        return self._buffer(session).all()
+
+    def append(self, session: Session, value: StoreValue) -> None:
+        self._buffer(session).append(value)
+
+    def reset(self, session: Session) -> None:
+        self._buffer(session).clear()
+
+    def replace(self, session: Session, values: List[StoreValue]) -> None:
+        self._buffer(session).replace(values)
+
+
+class SharedFileStore(StateStore):
+    """
+    A store shared between processes on the same host, backed by a memory-mapped file.
+
+    Each shop is given a fixed-size slot in the file, found by a hash of its domain, once it has values to keep.
+    Slots which are empty, or idle for longer than `ttl` seconds, are reclaimed for other shops;
+    buckets are empty again once drained, so forgetting an idle shop loses nothing.
+    If no slot can be reclaimed near its home, the least recently used one is taken over.
+    Reads and writes are done under a file lock, so all processes coordinate on the same state.
+    All processes must use the same `slots` and `size` for a file.
+    """
+
+    # Number of slots to probe for a shop before one is taken over
+    MAX_PROBES = 32
+    # Key of a slot which was never used
+    EMPTY_KEY = bytes(16)
+
+    def __init__(
+        self,
+        path: str,
+        slots: int = 4096,
+        size: int = 8,
+        ttl: float = 3600.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Open (or create) the file.
+
+        Args:
+            path: Path to the file, shared by all processes.
+            slots: Number of shops the file can hold.
+            size: Number of values each shop can hold, the oldest are dropped first.
+            ttl: Seconds a shop can be idle before its slot can be reclaimed.
+            clock: Source of the current time in seconds, the same for all processes.
+        """
+
+        if fcntl is None:  # pragma: no cover
+            raise RuntimeError("SharedFileStore requires fcntl, which is not available on this platform")
+
+        super().__init__()
+        self.path = path
+        self.slots = slots
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        # Slot layout: domain hash, number of values, time last written, values
+        self._record = struct.Struct(f"16sId{size}d")
+        self._header = struct.Struct("16sId")
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._pid = None
+        self._open()
+
+    def _open(self) -> None:
+        """
+        Open and map the file for the current process.
+        """
+
+        length = self._record.size * self.slots
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        current_length = os.fstat(self._fd).st_size
+        if current_length == 0:
+            os.ftruncate(self._fd, length)
+        elif current_length != length:
+            os.close(self._fd)
+            raise ValueError(f"File {self.path} was created with a different number of slots or size")
+
+        self._map = mmap.mmap(self._fd, length)
+        self._pid = os.getpid()
+
+    def close(self) -> None:
+        """
+        Unmap and close the file.
+        """
+
+        self._map.close()
+        os.close(self._fd)
+
+    @contextmanager
+    def lock(self, session: Session = None) -> Iterator[None]:
+        """
+        Lock the whole file, re-entrant within the same process.
+        """
+
+        with self._thread_lock:
+            if self._pid != os.getpid():
+                # Forked, the file lock would be shared with the parent unless reopened
+                self._open()
+
+            if self._depth == 0:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _slot(self, session: Session, claim: bool = True) -> Optional[int]:
+        """
+        Find the offset of the slot for the session, claiming one if needed.
+        Without `claim`, returns None if the session has no slot.
+        Must be called under the lock.
+        """
+
+        key = hashlib.blake2b(session.domain.encode("utf-8"), digest_size=16).digest()
+        home = int.from_bytes(key[:8], "little") % self.slots
+        now = self.clock()
+        # Slot to claim: the first free one, else the least recently used
+        free = None
+        oldest = None
+        oldest_at = math.inf
+        for probe in range(min(self.MAX_PROBES, self.slots)):
+            offset = ((home + probe) % self.slots) * self._record.size
+            slot_key, count, touched_at = self._header.unpack_from(self._map, offset)
+            if slot_key == key:
+                return offset
+            if slot_key == self.EMPTY_KEY:
+                # Never used, no shop was placed past it
+                if free is None:
+                    free = offset
+                break
+            if free is None and (count == 0 or now - touched_at > self.ttl):
+                free = offset
+            if touched_at < oldest_at:
+                oldest, oldest_at = offset, touched_at
+
+        if not claim:
+            return None
+        offset = free if free is not None else oldest
+        self._record.pack_into(self._map, offset, key, 0, now, *([0.0] * self.size))
+        return offset
+
+    def _read(self, offset: Optional[int]) -> List[StoreValue]:
+        if offset is None:
+            return []
+        _, count, _, *values = self._record.unpack_from(self._map, offset)
+        return values[:count]
+
+    def _write(self, offset: int, values: List[StoreValue]) -> None:
+        values = list(values)[-self.size:]
+        padding = [0.0] * (self.size - len(values))
+        key = self._map[offset:offset + 16]
+        self._record.pack_into(self._map, offset, key, len(values), self.clock(), *values, *padding)
+
+    def all(self, session: Session) -> List[StoreValue]:
+        with self.lock(session):
+            return self._read(self._slot(session, claim=False))
+
+    def append(self, session: Session, value: StoreValue) -> None:
+        with self.lock(session):
+            offset = self._slot(session)
+            self._write(offset, self._read(offset) + [value])
+
+    def reset(self, session: Session) -> None:
+        with self.lock(session):
+            offset = self._slot(session, claim=False)
+            if offset is not None:
+                self._write(offset, [])
+
+    def replace(self, session: Session, values: List[StoreValue]) -> None:
+        with self.lock(session):
+            offset = self._slot(session, claim=bool(values))
+            if offset is not None:
+                self._write(offset, values)
@@ -0,0 +1,85 @@
+import asyncio
+from typing import Any, Iterable
+
+import httpx
+
+
+class BorrowedTransport(httpx.AsyncBaseTransport):
+    """
+    A client's view of a `SharedTransport`. Closing the client leaves the shared pool open.
+    """
+
+    def __init__(self, pool: httpx.AsyncBaseTransport):
+        self.pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.pool.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class SharedTransport:
+    """
+    One connection pool shared by the clients of many shops and by bulk uploads and downloads,
+    so connections (and their TLS handshakes) are reused between them.
+
+    Set it as `options.transport`, and close it once every client is done.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 5.0,
+        http2: bool = False,
+        **kwargs: Any,
+    ):
+        """
+        Args:
+            max_connections: The most connections open at once, over all hosts.
+            max_keepalive_connections: The most idle connections kept open for reuse.
+            keepalive_expiry: The seconds an idle connection is kept open.
+            http2: Use HTTP/2 where the host supports it, requires `httpx[http2]`.
+            kwargs: Passed on to `httpx.AsyncHTTPTransport`, example: `retries`, `verify`.
+        """
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.pool = httpx.AsyncHTTPTransport(limits=self.limits, http2=http2, **kwargs)
+
+    def borrow(self) -> BorrowedTransport:
+        """
+        Get a transport for a client, which uses the shared pool.
+        """
+
+        return BorrowedTransport(self.pool)
+
+    async def warm(self, urls: Iterable[str]) -> None:
+        """
+        Open connections ahead of the first calls, one per URL, by sending a HEAD request to each.
+        Repeat a URL to open more connections to its host. Failures are ignored.
+
+        Args:
+            urls: The URLs to connect to, example: "https://john-doe.myshopify.com".
+        """
+
+        async with httpx.AsyncClient(transport=self.borrow()) as client:
+            await asyncio.gather(*[client.head(url) for url in urls], return_exceptions=True)
+
+    async def aclose(self) -> None:
+        """
+        Close every connection of the pool.
+        """
+
+        await self.pool.aclose()
+
+    async def __aenter__(self) -> "SharedTransport":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
@@ -1,4 +1,4 @@
-from typing import Union, List, Dict, Optional
+from typing import Any, Tuple, Union, List, Dict, Optional
 from httpx._types import RequestData, QueryParamTypes
 
 # Joins HTTPX's query or post data
@@ -11,5 +11,7 @@ StoreContainer = Dict[str, List[StoreValue]]
 ParsedBody = Optional[dict]
 # Parsed error body from response
 ParsedError = Optional[Union[dict, Exception]]
+# Decoded JSON body from response, and the exception if it could not be decoded
+Decoded = Tuple[Any, Optional[Exception]]
 # Time to sleep for deferrer
 SleepTime = Union[float, int]
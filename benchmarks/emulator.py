@@ -0,0 +1,71 @@
+"""
+Benchmark of the client against the Shopify emulator, in real time: REST calls under the leaky bucket
+for several shops at once, GraphQL pagination under the cost bucket, and a bulk query.
+
+    PYTHONPATH=. python benchmarks/emulator.py
+"""
+
+import asyncio
+import time
+
+from basic_shopify_api import AsyncClient, Options, Session, ShopifyEmulator
+
+SHOPS = 10
+CALLS = 45
+LATENCY = 0.05
+PAGINATION_QUERY = """
+query ($cursor: String) {
+    products(first: 250, after: $cursor) {
+        edges { node { id title } }
+        pageInfo { hasNextPage endCursor }
+    }
+}
+"""
+
+
+async def rest(options: Options, emulator: ShopifyEmulator) -> None:
+    async def shop(number: int) -> None:
+        async with AsyncClient(Session(f"shop-{number}.myshopify.com", "abc", "123"), options) as client:
+            await asyncio.gather(*[client.rest("get", "/admin/api/shop.json") for _ in range(CALLS)])
+
+    started = time.monotonic()
+    await asyncio.gather(*[shop(number) for number in range(SHOPS)])
+    elapsed = time.monotonic() - started
+    print(
+        f"REST: {SHOPS * CALLS} calls over {SHOPS} shops in {elapsed:.2f}s "
+        f"({SHOPS * CALLS / elapsed:.1f} calls/s), {emulator.stats['throttled']} throttled"
+    )
+
+
+async def graphql(options: Options, emulator: ShopifyEmulator) -> None:
+    throttled = emulator.stats["throttled"]
+    started = time.monotonic()
+    async with AsyncClient(Session("graphql.myshopify.com", "abc", "123"), options) as client:
+        nodes = [node async for node in client.graphql_stream_with_pagination("products", PAGINATION_QUERY)]
+    elapsed = time.monotonic() - started
+    print(
+        f"GraphQL: {len(nodes)} products paginated in {elapsed:.2f}s, "
+        f"{emulator.stats['throttled'] - throttled} throttled"
+    )
+
+
+async def bulk(options: Options) -> None:
+    started = time.monotonic()
+    async with AsyncClient(Session("bulk.myshopify.com", "abc", "123"), options) as client:
+        rows = list(await client.run_bulk_operation_query("{ products { edges { node { id title } } } }"))
+    print(f"Bulk: {len(rows)} products queried in {time.monotonic() - started:.2f}s")
+
+
+async def main() -> None:
+    emulator = ShopifyEmulator(resources={"products": 1000}, latency=LATENCY, bulk_rate=500)
+    options = Options()
+    options.transport = emulator
+
+    print(f"Emulator latency {LATENCY * 1000:.0f}ms\n")
+    await rest(options, emulator)
+    await graphql(options, emulator)
+    await bulk(options)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
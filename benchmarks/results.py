@@ -0,0 +1,111 @@
+"""
+Benchmark of building results for responses, as done on every call.
+
+Compares the previous eager, dict-backed results (body decoded and link extracted on every call)
+with the lazy, __slots__-based results, when the caller only checks the status, and when it reads the body.
+
+    PYTHONPATH=. python benchmarks/results.py
+"""
+
+import json
+import re
+import timeit
+import tracemalloc
+
+from httpx import Response
+
+from basic_shopify_api import Client, Options, Session
+from basic_shopify_api.codec import JsonCodec
+from basic_shopify_api.constants import LINK_HEADER, LINK_PATTERN, REST
+
+CALLS = 20000
+
+BODY = json.dumps({"products": [{"id": i, "title": f"Product {i}", "tags": ["a", "b"]} for i in range(25)]})
+HEADERS = {
+    LINK_HEADER: (
+        '<https://example.myshopify.com/admin/api/2020-04/products.json?page_info=abc>; rel="previous", '
+        '<https://example.myshopify.com/admin/api/2020-04/products.json?page_info=def>; rel="next"'
+    )
+}
+
+
+class EagerLink:
+    def __init__(self, next, prev):
+        self.next = next
+        self.prev = prev
+
+
+class EagerResult:
+    def __init__(self, response, status, body, errors, retries=0, link=None):
+        self.response = response
+        self.status = status,
+        self.body = body
+        self.errors = errors
+        self.retries = retries
+        self.link = link
+
+
+def eager_parse(response: Response) -> EagerResult:
+    """
+    The previous parsing: decode the body and extract the link on every call.
+    """
+
+    errors = None
+    try:
+        body = response.json()
+        if "errors" in body or "error" in body:
+            errors = body.get("errors", body.get("error", None))
+            body = None
+    except Exception as e:
+        errors = e
+        body = None
+
+    link = {"next": None, "prev": None}
+    if LINK_HEADER in response.headers:
+        for result in re.compile(LINK_PATTERN).findall(response.headers[LINK_HEADER]):
+            link[result[1][0:4]] = result[0]
+    return EagerResult(response, response.status_code, body, errors, link=EagerLink(**link))
+
+
+def measure(name: str, parse, read_body: bool) -> None:
+    responses = [Response(200, headers=HEADERS, content=BODY.encode("utf-8")) for _ in range(CALLS)]
+
+    def run():
+        results = []
+        for response in responses:
+            result = parse(response)
+            if read_body:
+                result.body
+            elif 200 not in result.status:
+                raise AssertionError
+            results.append(result)
+        return results
+
+    seconds = timeit.timeit(run, number=1)
+
+    tracemalloc.start()
+    results = run()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del results
+
+    print(f"{name:<28} {seconds / CALLS * 1000000:>8.2f} us/call {memory / CALLS:>10.0f} bytes/result")
+
+
+def main() -> None:
+    options = Options()
+    options.json_codec = JsonCodec()
+    client = Client(Session("example.myshopify.com", "abc", "123"), options)
+
+    def lazy_parse(response: Response):
+        return client._parse_response(REST, response, 0)
+
+    print(f"{CALLS} REST responses of {len(BODY)} bytes\n")
+    measure("eager, status only", eager_parse, False)
+    measure("lazy, status only", lazy_parse, False)
+    measure("eager, body read", eager_parse, True)
+    measure("lazy, body read", lazy_parse, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -28,6 +28,9 @@ setup(
     install_requires=[
         "httpx>=0.13"
     ],
+    extras_require={
+        "http2": ["httpx[http2]"]
+    },
     platforms="Any",
     python_requires=">=3.6",
     zip_safe=False,
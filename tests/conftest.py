@@ -8,7 +8,7 @@ from pathlib import Path
 
 from multiprocessing import Process
 from wsgiref.simple_server import make_server
-from basic_shopify_api.constants import RETRY_HEADER
+from basic_shopify_api.constants import CALL_LIMIT_HEADER, RETRY_HEADER
 from basic_shopify_api.models import ApiResult
 from typing import Any, Generator
 from basic_shopify_api.types import ParsedError
@@ -21,6 +21,8 @@ def local_server_app(environ, start_response):
     fixture = environ.get("HTTP_X_TEST_FIXTURE", f"{method}_{path}")
     if "HTTP_X_TEST_RETRY" in environ:
         headers.append((RETRY_HEADER, environ["HTTP_X_TEST_RETRY"]))
+    if "HTTP_X_TEST_CALL_LIMIT" in environ:
+        headers.append((CALL_LIMIT_HEADER, environ["HTTP_X_TEST_CALL_LIMIT"]))
 
     with open(os.path.dirname(__file__) + f"/fixtures/{fixture}") as fixture:
         data = fixture.read().encode("utf-8")
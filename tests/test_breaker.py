@@ -0,0 +1,115 @@
+import pytest
+from pytest_httpx import HTTPXMock
+from .utils import generate_opts_and_sess, FakeDeferrer
+from basic_shopify_api import AsyncClient, CircuitBreaker, CircuitOpenError, Client, Session
+from basic_shopify_api.breaker import CLOSED, HALF_OPEN, OPEN
+
+REST_URL = "https://example.myshopify.com/admin/api/2020-04/shop.json"
+OTHER_URL = "https://other.myshopify.com/admin/api/2020-04/shop.json"
+
+
+def test_breaker_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=1000)
+    for _ in range(2):
+        breaker.allow("a", 0)
+        breaker.record("a", False, 0)
+    breaker.allow("a", 0)
+    breaker.record("a", True, 0)
+    assert breaker.state("a") == CLOSED
+
+    # A success in between starts the count over
+    for _ in range(3):
+        breaker.allow("a", 0)
+        breaker.record("a", False, 0)
+    assert breaker.state("a") == OPEN
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.allow("a", 400)
+    assert error.value.retry_in == 600
+
+    # Half-open after the timeout, one trial at a time
+    breaker.allow("a", 1000)
+    assert breaker.state("a") == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow("a", 1000)
+
+    # A failed trial opens it again, a successful one closes it
+    breaker.record("a", False, 1000)
+    assert breaker.state("a") == OPEN
+    breaker.allow("a", 2000)
+    breaker.record("a", True, 2000)
+    assert breaker.state("a") == CLOSED
+    assert breaker.stats == {"opened": 2, "rejected": 2, "tripped": 0}
+
+
+def test_breaker_error_rate():
+    breaker = CircuitBreaker(failure_threshold=100, error_rate=0.5, window=10, min_calls=4)
+    for success in [True, False, True]:
+        breaker.record("a", success, 0)
+    assert breaker.state("a") == CLOSED
+
+    breaker.record("a", False, 0)
+    assert breaker.state("a") == OPEN
+    assert breaker.state("b") == CLOSED
+
+
+def test_breaker_trial_never_landed():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=1000)
+    breaker.record("a", False, 0)
+    breaker.allow("a", 1000)
+
+    # A cancelled trial makes way at once, a lost one after the timeout
+    breaker.release("a")
+    breaker.allow("a", 1000)
+    with pytest.raises(CircuitOpenError):
+        breaker.allow("a", 1500)
+    breaker.allow("a", 2000)
+    assert breaker.state("a") == HALF_OPEN
+
+
+def test_breaker_fail_fast(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=REST_URL, status_code=401, is_reusable=True)
+
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        c.options.circuit_breaker = CircuitBreaker(failure_threshold=2)
+
+        # Revoked token, opens after two calls
+        for _ in range(2):
+            assert 401 in c.rest("get", "/admin/api/shop.json").status
+        with pytest.raises(CircuitOpenError):
+            c.rest("get", "/admin/api/shop.json")
+        assert len(httpx_mock.get_requests()) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_breaker_other_shops(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=REST_URL, status_code=503, is_reusable=True)
+    httpx_mock.add_response(url=OTHER_URL, json={"shop": {"id": 2}})
+
+    session, options = generate_opts_and_sess()
+    options.deferrer = FakeDeferrer()
+    options.circuit_breaker = CircuitBreaker(failure_threshold=2)
+    async with AsyncClient(session, options) as c:
+        # No more retries once the circuit opened
+        result = await c.rest("get", "/admin/api/shop.json")
+        assert 503 in result.status
+        assert result.retries == 1
+        with pytest.raises(CircuitOpenError):
+            await c.rest("get", "/admin/api/shop.json")
+
+    # Other shops are not affected
+    async with AsyncClient(Session("other.myshopify.com", "abc", "123"), options) as c:
+        result = await c.rest("get", "/admin/api/shop.json")
+        assert result.body["shop"]["id"] == 2
+
+
+@pytest.mark.asyncio
+async def test_async_breaker_pagination():
+    session, options = generate_opts_and_sess()
+    options.deferrer = FakeDeferrer()
+    options.circuit_breaker = CircuitBreaker(failure_threshold=1)
+    options.circuit_breaker.record(session.domain, False, options.deferrer.current_time())
+    async with AsyncClient(session, options) as c:
+        # Not taken for a failed query
+        with pytest.raises(CircuitOpenError):
+            await c.graphql_call_with_pagination("products", "query { products { edges { node { id } } } }")
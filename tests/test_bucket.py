@@ -0,0 +1,70 @@
+from basic_shopify_api import CostEstimator, LeakyBucket
+
+
+def test_bucket_reserve():
+    bucket = LeakyBucket(capacity=40, leak_rate=2)
+    for i in range(40):
+        assert bucket.reserve(1) is False
+    assert bucket.level == 40
+
+    # Full, wait for one call to leak out
+    assert bucket.reserve(1) == 500
+    assert bucket.reserve(3) == 1500
+    assert bucket.level == 40
+
+
+def test_bucket_reserve_over_capacity():
+    bucket = LeakyBucket(capacity=1000, leak_rate=50, level=500)
+    # Never wait longer than it takes to drain the whole bucket
+    assert bucket.reserve(5000) == 10000
+
+
+def test_bucket_leak():
+    bucket = LeakyBucket(capacity=40, leak_rate=2, level=40, updated_at=1000)
+    bucket.leak(2000)
+    assert bucket.level == 38
+    assert bucket.available == 2
+
+    bucket.leak(100000)
+    assert bucket.level == 0
+    assert bucket.updated_at == 100000
+
+
+def test_bucket_release():
+    bucket = LeakyBucket(capacity=1000, leak_rate=50, level=100)
+    bucket.release(60)
+    assert bucket.level == 40
+    bucket.release(60)
+    assert bucket.level == 0
+
+
+def test_bucket_sync():
+    bucket = LeakyBucket(capacity=40, leak_rate=2, level=10)
+    bucket.sync(32, 80, 4)
+    assert bucket.to_values() == [80, 4, 32, 0]
+
+    # Local level includes in-flight calls, keep it
+    bucket.sync(5, 80, 4)
+    assert bucket.level == 32
+
+
+def test_bucket_values():
+    bucket = LeakyBucket.from_values([], 40, 2)
+    assert bucket.to_values() == [40, 2, 0.0, 0]
+
+    bucket = LeakyBucket.from_values([80, 4, 10, 1000], 40, 2)
+    assert bucket.to_values() == [80, 4, 10, 1000]
+
+
+def test_cost_estimator():
+    estimator = CostEstimator(default=50, max_size=2)
+    assert estimator.estimate("{ a }") == 50
+
+    estimator.update("{ a }", 10.0)
+    estimator.update("{ b }", 20)
+    assert estimator.estimate("{ a }") == 10
+
+    # Least recently used is forgotten
+    estimator.update("{ c }", 30)
+    assert estimator.estimate("{ b }") == 50
+    assert estimator.estimate("{ a }") == 10
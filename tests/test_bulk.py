@@ -0,0 +1,63 @@
+import pytest
+from basic_shopify_api import assemble_bulk_rows
+from basic_shopify_api.bulk import JsonlShards
+
+
+def test_assemble_bulk_rows():
+    rows = [
+        {"id": "gid://shopify/Order/1"},
+        {"id": "gid://shopify/LineItem/1", "__parentId": "gid://shopify/Order/1"},
+        {"id": "gid://shopify/Discount/1", "__parentId": "gid://shopify/LineItem/1"},
+        {"id": "gid://shopify/LineItem/2", "__parentId": "gid://shopify/Order/1"},
+        {"id": "gid://shopify/Order/2"},
+        {"title": "No ID", "__parentId": "gid://shopify/Order/2"},
+    ]
+    orders = assemble_bulk_rows(iter(rows))
+
+    # Each order is complete before the next one is read
+    assert next(orders) == {
+        "id": "gid://shopify/Order/1",
+        "LineItem": [
+            {"id": "gid://shopify/LineItem/1", "Discount": [{"id": "gid://shopify/Discount/1"}]},
+            {"id": "gid://shopify/LineItem/2"},
+        ],
+    }
+    assert next(orders) == {"id": "gid://shopify/Order/2", "__children": [{"title": "No ID"}]}
+    assert list(orders) == []
+
+
+def test_assemble_bulk_rows_key():
+    rows = [{"id": "1"}, {"id": "2", "__parentId": "1"}]
+    assert list(assemble_bulk_rows(rows, key=lambda row: "items")) == [{"id": "1", "items": [{"id": "2"}]}]
+
+
+def test_assemble_bulk_rows_out_of_order():
+    rows = [{"id": "1"}, {"id": "3", "__parentId": "2"}]
+    with pytest.raises(ValueError):
+        list(assemble_bulk_rows(rows))
+
+
+@pytest.mark.asyncio
+async def test_jsonl_shards_chunks(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr("basic_shopify_api.bulk.UPLOAD_CHUNK_SIZE", 15)
+    rows = ({"id": i} for i in range(3))
+    chunks = [chunk async for chunk in JsonlShards(rows).shard()]
+
+    # Chunks are sent as they fill, not after all rows are read
+    assert chunks == [b'{"id":0}\n{"id":1}\n', b'{"id":2}\n']
+
+
+@pytest.mark.asyncio
+async def test_jsonl_shards():
+    shards = JsonlShards(({"id": i} for i in range(5)), "input", max_size=50)
+    contents = []
+    while await shards.has_next():
+        contents.append(b"".join([chunk async for chunk in shards.shard()]))
+
+    # Each shard stays under the max size, split between rows
+    assert contents == [
+        b'{"input":{"id":0}}\n{"input":{"id":1}}\n',
+        b'{"input":{"id":2}}\n{"input":{"id":3}}\n',
+        b'{"input":{"id":4}}\n',
+    ]
+    assert shards.shards == 3
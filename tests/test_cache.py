@@ -0,0 +1,177 @@
+import gzip
+import pytest
+from httpx import Request, Response
+from pytest_httpx import HTTPXMock
+from .utils import generate_opts_and_sess
+from basic_shopify_api import AsyncClient, Client, DiskCache, MemoryCache
+from basic_shopify_api.cache import CachedResponse
+
+SHOP_URL = "https://example.myshopify.com/admin/api/2020-04/shop.json"
+GRAPHQL_URL = "https://example.myshopify.com/admin/api/2020-04/graphql.json"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def entry(content: bytes, stored_at: float) -> CachedResponse:
+    return CachedResponse(SHOP_URL, 200, [("etag", '"v1"')], content, stored_at)
+
+
+def test_rest_cache(httpx_mock: HTTPXMock):
+    clock = FakeClock()
+    httpx_mock.add_response(url=f"{SHOP_URL}?a=1&b=2", json={"shop": {"name": "One"}}, headers={"etag": '"v1"'})
+    httpx_mock.add_response(url=f"{SHOP_URL}?a=1&b=2", status_code=304, headers={"x-shopify-shop-api-call-limit": "2/40"})
+
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.response_cache = MemoryCache(ttl=60, clock=clock)
+        assert c.rest("get", "/admin/api/shop.json", {"b": 2, "a": 1}).body["shop"]["name"] == "One"
+
+        # Fresh, no call and nothing taken from the bucket
+        with c._bucket("rest") as bucket:
+            level = bucket.level
+        result = c.rest("get", "/admin/api/shop.json", {"a": 1, "b": 2})
+        assert result.body["shop"]["name"] == "One"
+        with c._bucket("rest") as bucket:
+            assert bucket.level <= level
+        assert len(httpx_mock.get_requests()) == 1
+
+        # Stale, revalidated with the ETag
+        clock.now += 61
+        result = c.rest("get", "/admin/api/shop.json", {"a": 1, "b": 2})
+        assert httpx_mock.get_requests()[-1].headers["if-none-match"] == '"v1"'
+        assert result.response.status_code == 200
+        assert result.body["shop"]["name"] == "One"
+        assert result.response.headers["x-shopify-shop-api-call-limit"] == "2/40"
+
+
+def test_rest_cache_skipped(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=SHOP_URL, method="POST", json={"shop": {}}, is_reusable=True)
+    httpx_mock.add_response(url=SHOP_URL, method="GET", json={"shop": {}}, is_reusable=True)
+
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.response_cache = MemoryCache()
+        c.rest("post", "/admin/api/shop.json", {})
+        c.rest("post", "/admin/api/shop.json", {})
+        c.rest("get", "/admin/api/shop.json", cache=False)
+        c.rest("get", "/admin/api/shop.json", cache=False)
+        assert len(httpx_mock.get_requests()) == 4
+
+
+def test_rest_cache_sessions(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=SHOP_URL, json={"shop": {}}, is_reusable=True)
+    cache = MemoryCache()
+
+    # A cache shared between sessions keeps a response per access token
+    for password in ["123", "456", "123"]:
+        sess, opts = generate_opts_and_sess()
+        sess.password = password
+        opts.response_cache = cache
+        with Client(sess, opts) as c:
+            c.rest("get", "/admin/api/shop.json")
+    assert [request.headers["x-shopify-access-token"] for request in httpx_mock.get_requests()] == ["123", "456"]
+
+    # And per headers which can change the response
+    with Client(sess, opts) as c:
+        c.rest("get", "/admin/api/shop.json", headers={"Accept-Language": "fr"})
+        c.rest("get", "/admin/api/shop.json", headers={"accept-language": "fr"})
+    assert len(httpx_mock.get_requests()) == 3
+
+
+def test_rest_cache_disabled(httpx_mock: HTTPXMock, monkeypatch: pytest.MonkeyPatch):
+    httpx_mock.add_response(url=SHOP_URL, json={"shop": {}})
+    httpx_mock.add_response(url=GRAPHQL_URL, json={"data": {"shop": {}}})
+    keys = []
+    monkeypatch.setattr(Client, "_request_key", lambda *args: keys.append(args))
+
+    # Without a cache, no key is built
+    with Client(*generate_opts_and_sess()) as c:
+        c.rest("get", "/admin/api/shop.json")
+        c.graphql("{ shop { id } }")
+    assert keys == []
+
+
+@pytest.mark.asyncio
+async def test_graphql_cache(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=GRAPHQL_URL, json={"data": {"shop": {"id": 1}}}, is_reusable=True)
+
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.response_cache = MemoryCache()
+        for _ in range(2):
+            assert (await c.graphql("{ shop { id } }", {"b": 1, "a": 2})).body["data"]["shop"]["id"] == 1
+            await c.graphql("mutation { shopUpdate { id } }")
+        await c.graphql("{ shop { id } }", {"a": 2, "b": 1})
+        # One query, the same query with other variables, and two mutations
+        await c.graphql("{ shop { id } }", {"a": 3})
+        assert len(httpx_mock.get_requests()) == 4
+
+
+@pytest.mark.asyncio
+async def test_graphql_cache_errors(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=GRAPHQL_URL, json={"errors": [{"message": "Oops"}]}, is_reusable=True)
+
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.response_cache = MemoryCache()
+        await c.graphql("{ shop { id } }")
+        await c.graphql("{ shop { id } }")
+        assert len(httpx_mock.get_requests()) == 2
+
+
+def test_memory_cache():
+    clock = FakeClock()
+    cache = MemoryCache(max_age=100, max_size=2, clock=clock)
+    cache.set("a", entry(b"a", clock.now))
+    cache.set("b", entry(b"b", clock.now))
+    cache.get("a")
+    cache.set("c", entry(b"c", clock.now))
+
+    # Least recently used forgotten
+    assert cache.get("b") is None
+    assert cache.get("a").content == b"a"
+
+    clock.now += 101
+    assert cache.get("a") is None
+
+
+def test_disk_cache(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "responses.sqlite")
+    cache = DiskCache(path, max_size=2, clock=clock)
+    cache.set("a", entry(b"a", clock.now))
+    clock.now += 1
+    cache.set("b", entry(b"b", clock.now))
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.set("c", entry(b"c", clock.now))
+    cache.close()
+
+    # Kept between runs, least recently used forgotten
+    cache = DiskCache(path, max_size=2, clock=clock)
+    assert cache.get("b") is None
+    kept = cache.get("a")
+    assert kept.content == b"a"
+    assert kept.etag == '"v1"'
+    assert kept.to_response().content == b"a"
+
+    cache.clear()
+    assert cache.get("c") is None
+    cache.close()
+
+
+def test_cached_response_headers():
+    response = Response(
+        200,
+        headers={"content-encoding": "gzip", "etag": '"v2"'},
+        content=gzip.compress(b"{}"),
+        request=Request("GET", SHOP_URL),
+    )
+    # The body is kept decoded, the headers must not say otherwise
+    kept = CachedResponse.from_response(response, 0.0)
+    assert kept.etag == '"v2"'
+    assert "content-encoding" not in kept.to_response().headers
+    assert kept.to_response().content == b"{}"
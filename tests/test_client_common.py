@@ -1,4 +1,5 @@
 import pytest
+from pytest_httpx import HTTPXMock
 from .utils import generate_opts_and_sess
 from basic_shopify_api import Client
 from basic_shopify_api.constants import ACCESS_TOKEN_HEADER, ALT_MODE
@@ -14,6 +15,50 @@ def test_build_headers():
         assert ACCESS_TOKEN_HEADER not in headers
 
 
+def test_build_headers_prebuilt():
+    with Client(*generate_opts_and_sess()) as c:
+        # Without headers for the call, the base headers are shared and read-only
+        headers = c._build_headers({})
+        assert c._build_headers({}) is headers
+        with pytest.raises(TypeError):
+            headers["X-Test"] = "1"
+
+        # Headers for the call win, and leave the base headers untouched
+        merged = c._build_headers({"Accept": "text/plain", "X-Test": "1"})
+        assert merged["Accept"] == "text/plain"
+        assert merged[ACCESS_TOKEN_HEADER] == "123"
+        assert "X-Test" not in c._build_headers({})
+
+        # Rebuilt when the headers of the options are replaced or the password changes
+        c.options.headers = {**c.options.headers, "X-Shop": "1"}
+        c.session.password = "456"
+        headers = c._build_headers({})
+        assert headers["X-Shop"] == "1"
+        assert headers[ACCESS_TOKEN_HEADER] == "456"
+
+        # Rebuilt when the headers of the options are changed in place
+        c.options.headers["X-Shop"] = "2"
+        assert c._build_headers({})["X-Shop"] == "2"
+        c.options.headers.update({"X-Shop": "3"})
+        assert c._build_headers({})["X-Shop"] == "3"
+        c.options.headers.pop("X-Shop")
+        assert "X-Shop" not in c._build_headers({})
+
+
+def test_pre_action_adds_header(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url="https://example.myshopify.com/admin/api/2020-04/shop.json", json={"shop": {}})
+
+    def add_header(inst, **kwargs):
+        kwargs["headers"]["X-Request-Id"] = "abc"
+
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.rest_pre_actions = [add_header]
+        c.rest("get", "/admin/api/shop.json")
+        assert "X-Request-Id" not in c._base_headers()
+
+    assert httpx_mock.get_request().headers["x-request-id"] == "abc"
+
+
 def test_build_request():
     with Client(*generate_opts_and_sess()) as c:
         request = c._build_request(
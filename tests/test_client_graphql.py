@@ -1,7 +1,9 @@
+import asyncio
+from io import BytesIO
 from unittest.mock import AsyncMock
 import pytest
-from .utils import generate_opts_and_sess, local_server_session, async_local_server_session
-from basic_shopify_api import Client, AsyncClient
+from .utils import generate_opts_and_sess, local_server_session, async_local_server_session, FakeDeferrer
+from basic_shopify_api import Client, AsyncClient, ApiResult
 from pytest_httpx._httpx_mock import HTTPXMock
 from httpx import Response as HttpxResponse
 import jsonlines
@@ -57,7 +59,7 @@ async def test_poll_until_complete(local_server, mock_graphql_response: AsyncMoc
         job_id = "gid://shopify/BulkOperation/1"
         url = "https://download.com"
         mocked_response = "Data Downloaded"
-        mock_graphql_response(f"bulk_job_completed.json")
+        mock_graphql_response(f"bulk_operation_completed.json")
         httpx_mock.add_response(url=url, text=mocked_response)
         response = await c.poll_until_complete(job_id, "QUERY")
         assert response.text == mocked_response
@@ -74,8 +76,8 @@ async def test_run_bulk_operation_query(local_server, mock_graphql_response: Asy
         job_running = AsyncMock(return_value=False)
         monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.is_bulk_job_running", job_running)
 
-        complete_response = AsyncMock(return_value=HttpxResponse(status_code=204, content=b'{"data": {"entity": "data"}}'))
-        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.poll_until_complete", complete_response)
+        complete_response = AsyncMock(return_value={"id": "gid://shopify/BulkOperation/1", "url": None})
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.wait_until_complete", complete_response)
         
         response = await c.run_bulk_operation_query("query", {}, wait)
         assert isinstance(response, expected_type)
@@ -89,10 +91,292 @@ async def test_run_bulk_operation_mutation(local_server, mock_graphql_response:
         mock_graphql_response(f"create_and_submit_mutation.json")
         httpx_mock.add_response(url="https://upload.com", text="Data Uploaded")
 
-        complete_response = AsyncMock(return_value=HttpxResponse(status_code=204, content=b'{"data": {"entity": "data"}}'))
-        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.poll_until_complete", complete_response)
+        complete_response = AsyncMock(return_value={"id": "gid://shopify/BulkOperation/1", "url": None})
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.wait_until_complete", complete_response)
         
         row_data = [{"field1": "value1", "field2": "value2"}]
         response = await c.run_bulk_operation_mutation("query", row_data, "input", wait)
         assert isinstance(response, expected_type)
         
+
+
+def product_page(ids: list[int], has_next_page: bool) -> ApiResult:
+    return ApiResult(
+        response=HttpxResponse(status_code=200),
+        status=200,
+        body={
+            "data": {
+                "products": {
+                    "edges": [{"node": {"id": id}} for id in ids],
+                    "pageInfo": {"hasNextPage": has_next_page, "endCursor": f"cursor-{ids[-1]}"},
+                }
+            }
+        },
+        errors=None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_graphql_stream_with_pagination(monkeypatch: pytest.MonkeyPatch) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        graphql = AsyncMock(side_effect=[product_page([1, 2], True), product_page([3, 4], True), product_page([5], False)])
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.graphql", graphql)
+
+        nodes = []
+        async for node in c.graphql_stream_with_pagination("products", "Query"):
+            if not nodes:
+                # Next page is already being fetched while the first is processed
+                await asyncio.sleep(0)
+                assert graphql.await_count == 2
+            nodes.append(node["id"])
+
+        assert nodes == [1, 2, 3, 4, 5]
+        assert graphql.call_args_list[1].args[1] == {"cursor": "cursor-2"}
+
+
+@pytest.mark.asyncio
+async def test_graphql_stream_with_pagination_pages(monkeypatch: pytest.MonkeyPatch) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        graphql = AsyncMock(side_effect=[product_page([1, 2], True), product_page([3, 4], True)])
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.graphql", graphql)
+
+        pages = [page async for page in c.graphql_stream_with_pagination("products", "Query", max_limit=3, pages=True)]
+        # No page is fetched past the limit
+        assert pages == [[{"id": 1}, {"id": 2}], [{"id": 3}]]
+        assert graphql.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_graphql_stream_with_pagination_errors(mock_graphql_response: AsyncMock) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        mock_graphql_response("get_errors.json")
+        with pytest.raises(ValueError):
+            [node async for node in c.graphql_stream_with_pagination("products", "Query")]
+
+
+@pytest.mark.asyncio
+async def test_download_bulk_results(httpx_mock: HTTPXMock) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.bulk_spool_size = 16
+        url = "https://download.com"
+        httpx_mock.add_response(url=url, content=b'{"id": 1}\n{"id": 2}\n')
+
+        reader = await c.download_bulk_results(url)
+        # Past the spool size, the results are on disk and not in memory
+        assert reader._fp._rolled
+        assert [row["id"] for row in reader] == [1, 2]
+
+        reader = await c.download_bulk_results(None)
+        assert list(reader) == []
+
+
+@pytest.mark.asyncio
+async def test_run_bulk_operation_mutation_stream(mock_graphql_response: AsyncMock, httpx_mock: HTTPXMock) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        mock_graphql_response("create_and_submit_mutation.json")
+        httpx_mock.add_response(url="https://upload.com", text="Data Uploaded")
+
+        async def rows():
+            for i in range(3):
+                yield {"id": i}
+
+        await c.run_bulk_operation_mutation("query", rows(), "input", False)
+
+        request = httpx_mock.get_request(url="https://upload.com")
+        # Sent with its length, not chunked
+        assert "transfer-encoding" not in request.headers
+        assert int(request.headers["content-length"]) == len(request.content)
+        boundary = request.headers["content-type"].split("boundary=")[1]
+        body = request.content.decode("utf-8")
+        assert 'name="key"\r\n\r\nthing\r\n' in body
+        assert '{"input":{"id":0}}\n{"input":{"id":1}}\n{"input":{"id":2}}\n' in body
+        assert body.endswith(f"--{boundary}--\r\n")
+
+
+@pytest.mark.asyncio
+async def test_run_bulk_operation_mutation_shards(monkeypatch: pytest.MonkeyPatch) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.bulk_mutation_max_size = 50
+        events = []
+        uploads = []
+
+        async def upload(self, content):
+            lines = b"".join([chunk async for chunk in content]).splitlines()
+            uploads.append(len(lines))
+            events.append(f"upload {len(lines)}")
+            return f"path-{len(uploads)}"
+
+        async def start(self, query, path):
+            events.append(f"start {path}")
+            return path
+
+        async def wait(self, job_id, job_type, progress=None, expected_count=None):
+            await asyncio.sleep(0)
+            events.append(f"complete {job_id} of {expected_count}")
+            return {"id": job_id, "url": job_id}
+
+        counts = {"path-1": 2, "path-2": 2, "path-3": 1}
+
+        async def download(self, url):
+            events.append(f"download {url}")
+            lines = [f'{{"job": "{url}", "__lineNumber": {i}}}\n' for i in range(counts[url])]
+            return BytesIO("".join(lines).encode("utf-8"))
+
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient._upload_bulk_mutation", upload)
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient._start_bulk_mutation", start)
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.wait_until_complete", wait)
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient._download_bulk_file", download)
+
+        rows = ({"id": i} for i in range(5))
+        reader = await c.run_bulk_operation_mutation("query", rows)
+
+        # The next shard is uploaded while the current one runs, and started before its results are downloaded
+        assert events == [
+            "upload 2", "start path-1",
+            "upload 2", "complete path-1 of 2", "start path-2", "download path-1",
+            "upload 1", "complete path-2 of 2", "start path-3", "download path-2",
+            "complete path-3 of 1", "download path-3",
+        ]
+        rows = list(reader)
+        assert [row["job"] for row in rows] == ["path-1", "path-1", "path-2", "path-2", "path-3"]
+        # Line numbers keep counting across shards
+        assert [row["__lineNumber"] for row in rows] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failing", ["wait", "start"])
+async def test_run_bulk_operation_mutation_shards_failure(monkeypatch: pytest.MonkeyPatch, failing: str) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.bulk_mutation_max_size = 50
+        files = []
+
+        async def upload(self, content):
+            [chunk async for chunk in content]
+            return "path"
+
+        async def start(self, query, path):
+            if failing == "start" and files:
+                raise ValueError("failed")
+            return path
+
+        async def wait(self, job_id, job_type, progress=None, expected_count=None):
+            if failing == "wait" and files:
+                raise ValueError("failed")
+            return {"id": job_id, "url": job_id}
+
+        async def download(self, url):
+            files.append(BytesIO(b'{"__lineNumber": 0}\n'))
+            return files[-1]
+
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient._upload_bulk_mutation", upload)
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient._start_bulk_mutation", start)
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.wait_until_complete", wait)
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient._download_bulk_file", download)
+
+        with pytest.raises(ValueError):
+            await c.run_bulk_operation_mutation("query", ({"id": i} for i in range(5)))
+        # Results of the shard which completed are closed
+        assert len(files) == 1 and files[0].closed
+
+
+def bulk_operation(status: str, object_count: int) -> ApiResult:
+    return ApiResult(
+        response=HttpxResponse(status_code=200),
+        status=200,
+        body={
+            "data": {
+                "node": {
+                    "id": "gid://shopify/BulkOperation/1",
+                    "status": status,
+                    "objectCount": str(object_count),
+                    "fileSize": None,
+                    "url": None,
+                }
+            }
+        },
+        errors=None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_wait_until_complete_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        statuses = [bulk_operation("RUNNING", count) for count in range(0, 1000, 10)] + [bulk_operation("COMPLETED", 1000)]
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.graphql", AsyncMock(side_effect=statuses))
+
+        progress = []
+        await c.wait_until_complete("gid://shopify/BulkOperation/1", "QUERY", progress.append)
+
+        # Waits grow with the time the job has been running
+        sleeps = c.options.deferrer.sleeps
+        assert sleeps[:3] == [1000, 1000, 1000]
+        assert sleeps == sorted(sleeps)
+        assert max(sleeps) == c.options.bulk_poll_max_interval
+        assert progress[-1].status == "COMPLETED"
+        assert progress[-1].object_count == 1000
+
+
+@pytest.mark.asyncio
+async def test_wait_until_complete_eta(monkeypatch: pytest.MonkeyPatch) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer(start=0)
+        statuses = [bulk_operation("RUNNING", 0), bulk_operation("RUNNING", 100), bulk_operation("COMPLETED", 150)]
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.graphql", AsyncMock(side_effect=statuses))
+
+        etas = []
+
+        async def progress(bulk_progress):
+            etas.append(bulk_progress.eta)
+
+        await c.wait_until_complete("gid://shopify/BulkOperation/1", "MUTATION", progress, expected_count=150)
+
+        # 100 objects per second, 50 left
+        assert etas[1] == 0.5
+        assert c.options.deferrer.sleeps == [1000, 1000]
+
+
+@pytest.mark.asyncio
+async def test_wait_until_complete_timeout(monkeypatch: pytest.MonkeyPatch) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        graphql = AsyncMock(return_value=bulk_operation("RUNNING", 0))
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.graphql", graphql)
+
+        with pytest.raises(TimeoutError):
+            await c.wait_until_complete("gid://shopify/BulkOperation/1", "QUERY", timeout=2500)
+        assert sum(c.options.deferrer.sleeps) == 2500
+
+
+@pytest.mark.asyncio
+async def test_wait_until_complete_concurrent(monkeypatch: pytest.MonkeyPatch) -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        c.options.bulk_max_concurrent = 5
+
+        async def graphql(self, query, variables=None, cache=True):
+            result = bulk_operation("COMPLETED", 1)
+            result.body["data"]["node"]["id"] = variables["id"]
+            return result
+
+        job_running = AsyncMock(return_value=True)
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.is_bulk_job_running", job_running)
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.graphql", graphql)
+
+        # Each job is polled by its own ID
+        jobs = await asyncio.gather(
+            c.wait_until_complete("gid://shopify/BulkOperation/1", "QUERY"),
+            c.wait_until_complete("gid://shopify/BulkOperation/2", "QUERY"),
+        )
+        assert [job["id"] for job in jobs] == ["gid://shopify/BulkOperation/1", "gid://shopify/BulkOperation/2"]
+
+        # A running job does not block another
+        submitted = ApiResult(
+            response=HttpxResponse(status_code=200),
+            status=200,
+            body={"data": {"bulkOperationRunQuery": {"bulkOperation": {"id": "gid://shopify/BulkOperation/3"}, "userErrors": []}}},
+            errors=None,
+        )
+        monkeypatch.setattr("basic_shopify_api.clients.async_client.AsyncClient.graphql", AsyncMock(return_value=submitted))
+        assert await c.run_bulk_operation_query("query", wait=False) == "gid://shopify/BulkOperation/3"
+        job_running.assert_not_called()
@@ -1,13 +1,18 @@
+import asyncio
 import pytest
 from http import HTTPStatus
-from .utils import generate_opts_and_sess, local_server_session, async_local_server_session
-from basic_shopify_api import Client, AsyncClient
+from httpx import ReadTimeout, Response
+from pytest_httpx import HTTPXMock
+from .utils import generate_opts_and_sess, local_server_session, async_local_server_session, FakeDeferrer
+from basic_shopify_api import Client, AsyncClient, Options, SharedFileStore
+from basic_shopify_api.constants import GRAPHQL
 
 
 @pytest.mark.usefixtures("local_server")
 @local_server_session
 def test_rest_retry():
     with Client(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
         response = c.rest(
             method="get",
             path="/admin/shop.json",
@@ -15,23 +20,44 @@ def test_rest_retry():
         )
         assert 502 in response.status
         assert response.retries == c.options.max_retries
+        # Backed off exponentially, with full jitter
+        first, second = c.options.deferrer.sleeps
+        assert 0 <= first <= c.options.retry_backoff
+        assert 0 <= second <= c.options.retry_backoff * 2
 
 
 @pytest.mark.usefixtures("local_server")
 @local_server_session
 def test_rest_rate_limit():
     with Client(*generate_opts_and_sess()) as c:
-        for i in range(2):
-            c.options.time_store.append(c.session, c.options.deferrer.current_time())
+        c.options.deferrer = FakeDeferrer()
+        # Burst up to the size of the bucket without limiting
+        for i in range(c.options.rest_bucket_size):
+            assert c._rest_rate_limit_required() is False
 
         c.rest("get", "/admin/api/shop.json")
-        assert len(c.options.time_store.all(c.session)) == 1
+        # Only wait the time it takes for one call to leak out of the bucket
+        assert c.options.deferrer.sleeps == [500]
+
+
+@pytest.mark.usefixtures("local_server")
+@local_server_session
+def test_rest_rate_limit_header():
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        c.rest("get", "/admin/api/shop.json", headers={"x-test-call-limit": "400/400"})
+
+        # Plus bucket detected, and the leak rate scaled with it
+        bucket = c.options.rest_bucket_store.all(c.session)
+        assert bucket[:3] == [400, 20, 400]
+        assert c._rest_rate_limit_required() == 50
 
 
 @pytest.mark.usefixtures("local_server")
 @local_server_session
 def test_graphql_retry():
     with Client(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
         response = c.graphql(
             query="{ shop { name } }",
             headers={"x-test-status": f"{HTTPStatus.BAD_GATEWAY.value} {HTTPStatus.BAD_GATEWAY.phrase}"},
@@ -44,19 +70,57 @@ def test_graphql_retry():
 @local_server_session
 def test_graphql_cost_limit():
     with Client(*generate_opts_and_sess()) as c:
-        for i in range(2):
-            c.options.time_store.append(c.session, c.options.deferrer.current_time())
-        c.options.cost_store.append(c.session, 100)
+        c.options.deferrer = FakeDeferrer()
+        c.options.graphql_bucket_store.replace(c.session, [1000, 50, 1000, c.options.deferrer.current_time()])
 
+        # Unknown query, wait for the default estimate to be restored
         c.graphql("{ shop { name } }")
-        assert len(c.options.time_store.all(c.session)) == 1
-        assert len(c.options.cost_store.all(c.session)) == 1
+        assert c.options.deferrer.sleeps == [1000]
+
+        # Reserved estimate was swapped for the actual cost, and the requested cost is remembered
+        assert c.options.graphql_bucket_store.all(c.session)[2] == 951
+        assert c.options.cost_estimator.estimate("{ shop { name } }") == 1
+
+
+@pytest.mark.usefixtures("local_server")
+@local_server_session
+def test_graphql_cost_sync():
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        c.graphql("{ shop { name } }", headers={"x-test-fixture": "post_graphql_expensive.json"})
+
+        assert c.options.graphql_bucket_store.all(c.session)[:3] == [1000, 50, 604]
+        assert c.options.cost_estimator.estimate("{ shop { name } }") == 1000
+
+
+def test_graphql_cost_throttled():
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        assert c._graphql_cost_limit_required(500) is False
+
+        response = Response(status_code=200, json={
+            "errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+            "extensions": {
+                "cost": {
+                    "requestedQueryCost": 500,
+                    "actualQueryCost": None,
+                    "throttleStatus": {"maximumAvailable": 2000.0, "currentlyAvailable": 100, "restoreRate": 100.0},
+                },
+            },
+        })
+        c._cost_update(response.json(), "{ products { id } }", 500)
+        assert c._retry_required(response, 0) == 0.0
+
+        # Plus bucket detected, wait the exact time for the requested cost to be restored
+        assert c.options.graphql_bucket_store.all(c.session)[:3] == [2000.0, 100.0, 1900]
+        assert c._graphql_cost_limit_required(500) == 4000
 
 
 @pytest.mark.usefixtures("local_server")
 @local_server_session
 def test_rest_retry_header():
     with Client(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
         response = c.rest(
             method="get",
             path="/admin/shop.json",
@@ -67,6 +131,9 @@ def test_rest_retry_header():
         )
         assert 502 in response.status
         assert response.retries == c.options.max_retries
+        # Paced by the header, not backed off nor taken from the budget
+        assert c.options.deferrer.sleeps == [1000, 1000]
+        assert c.options.retry_budget.stats == {"allowed": 0, "denied": 0}
 
 
 @pytest.mark.asyncio
@@ -74,6 +141,7 @@ def test_rest_retry_header():
 @async_local_server_session
 async def test_async_rest_retry():
     async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
         response = await c.rest(
             method="get",
             path="/admin/shop.json",
@@ -88,11 +156,12 @@ async def test_async_rest_retry():
 @async_local_server_session
 async def test_async_rest_rate_limit():
     async with AsyncClient(*generate_opts_and_sess()) as c:
-        for i in range(2):
-            c.options.time_store.append(c.session, c.options.deferrer.current_time())
+        c.options.deferrer = FakeDeferrer()
+        for i in range(c.options.rest_bucket_size):
+            assert c._rest_rate_limit_required() is False
 
         await c.rest("get", "/admin/api/shop.json")
-        assert len(c.options.time_store.all(c.session)) == 1
+        assert c.options.deferrer.sleeps == [500]
 
 
 @pytest.mark.asyncio
@@ -100,10 +169,95 @@ async def test_async_rest_rate_limit():
 @async_local_server_session
 async def test_async_graphql_cost_limit():
     async with AsyncClient(*generate_opts_and_sess()) as c:
-        for i in range(2):
-            c.options.time_store.append(c.session, c.options.deferrer.current_time())
-        c.options.cost_store.append(c.session, 100)
+        c.options.deferrer = FakeDeferrer()
+        c.options.graphql_bucket_store.replace(c.session, [1000, 50, 1000, c.options.deferrer.current_time()])
 
         await c.graphql("{ shop { name } }")
-        assert len(c.options.time_store.all(c.session)) == 1
-        assert len(c.options.cost_store.all(c.session)) == 1
+        assert c.options.deferrer.sleeps == [1000]
+        assert c.options.graphql_bucket_store.all(c.session)[2] == 951
+
+
+@pytest.mark.asyncio
+async def test_async_rest_rate_limit_concurrent():
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.rest_bucket_size = 2
+        c.options.rest_limit = 200
+        order = []
+
+        async def call(i):
+            await c._rest_rate_limit()
+            order.append(i)
+
+        await asyncio.gather(*(call(i) for i in range(10)))
+        # Waiters are served in order of arrival, and each took exactly one spot in the bucket
+        assert order == list(range(10))
+        assert c.options.rest_bucket_store.all(c.session)[2] <= 2
+
+
+@pytest.mark.asyncio
+async def test_async_rate_limit_cancelled():
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.graphql_bucket_store.replace(c.session, [1000, 50, 1000, c.options.deferrer.current_time()])
+
+        lock = c._bucket_lock(GRAPHQL)
+        waiting = asyncio.ensure_future(c._graphql_cost_limit(500))
+        await asyncio.sleep(0.01)
+        assert lock.locked()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        # Nothing was reserved and the lock was given up for the next waiter
+        assert c.options.graphql_bucket_store.all(c.session)[2] <= 1000
+        assert not lock.locked()
+
+
+@pytest.mark.asyncio
+async def test_async_rest_failed_release(httpx_mock: HTTPXMock):
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        httpx_mock.add_exception(ReadTimeout("Timed out"))
+        with pytest.raises(ReadTimeout):
+            await c.rest("get", "/admin/api/shop.json")
+
+        # The call never completed, the reservation was given back
+        assert c.options.rest_bucket_store.all(c.session)[2] == 0
+
+
+def test_rest_failed_release(httpx_mock: HTTPXMock):
+    with Client(*generate_opts_and_sess()) as c:
+        httpx_mock.add_exception(ReadTimeout("Timed out"))
+        with pytest.raises(ReadTimeout):
+            c.rest("get", "/admin/api/shop.json")
+
+        # The call never completed, the reservation was given back
+        assert c.options.rest_bucket_store.all(c.session)[2] == 0
+
+
+def test_graphql_failed_release(httpx_mock: HTTPXMock):
+    with Client(*generate_opts_and_sess()) as c:
+        httpx_mock.add_exception(ReadTimeout("Timed out"))
+        with pytest.raises(ReadTimeout):
+            c.graphql("{ shop { name } }")
+
+        # The call never completed, the reserved cost was given back
+        assert c.options.graphql_bucket_store.all(c.session)[2] == 0
+
+
+@pytest.mark.usefixtures("local_server")
+@local_server_session
+def test_rest_rate_limit_shared(tmp_path):
+    sess, opts = generate_opts_and_sess()
+    opts.rest_bucket_store = SharedFileStore(str(tmp_path / "rest"))
+    opts.deferrer = FakeDeferrer()
+
+    # Another process has filled the bucket
+    other_opts = Options()
+    other_opts.rest_bucket_store = SharedFileStore(str(tmp_path / "rest"))
+    other_opts.deferrer = opts.deferrer
+    with Client(sess, other_opts) as c:
+        for i in range(c.options.rest_bucket_size):
+            c._rest_rate_limit_required()
+
+    with Client(sess, opts) as c:
+        c.rest("get", "/admin/api/shop.json")
+        assert c.options.deferrer.sleeps == [500]
@@ -21,6 +21,13 @@ def test_version_path():
     with Client(*generate_opts_and_sess()) as c:
         assert c.version_path("/admin/api/shop.json") == "/admin/api/2020-04/shop.json"
         assert c.version_path("/admin/api/shop.json", True) == "/admin/api/2020-04/shop.json"
+        assert c.version_path("/admin/api/2020-04/shop.json") == "/admin/api/2020-04/shop.json"
+        assert c.version_path("/admin/oauth/access_scopes.json") == "/admin/oauth/access_scopes.json"
+        assert c.version_path("/admin/oauth/access_token") == "/admin/oauth/access_token"
+
+        # Memoized by version
+        c.options.version = "unstable"
+        assert c.version_path("/admin/api/shop.json") == "/admin/api/unstable/shop.json"
 
 
 def test_rest_extract_link():
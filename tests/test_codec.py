@@ -0,0 +1,78 @@
+import pytest
+from pytest_httpx import HTTPXMock
+from .utils import generate_opts_and_sess
+from basic_shopify_api import AsyncClient, Client
+from basic_shopify_api.codec import JsonCodec, OrjsonCodec, fastest_codec, orjson
+from basic_shopify_api.options import Options
+
+GRAPHQL_URL = "https://example.myshopify.com/admin/api/2020-04/graphql.json"
+
+
+class CountingCodec(JsonCodec):
+    def __init__(self):
+        self.encoded = 0
+        self.decoded = 0
+
+    def dumps(self, value):
+        self.encoded += 1
+        return super().dumps(value)
+
+    def loads(self, data):
+        self.decoded += 1
+        return super().loads(data)
+
+
+def test_codecs():
+    value = {"title": "Café", "ids": [1, 2], "price": 1.5, "gift": None}
+    assert JsonCodec().dumps(value) == '{"title":"Café","ids":[1,2],"price":1.5,"gift":null}'.encode("utf-8")
+    assert JsonCodec().loads(JsonCodec().dumps(value)) == value
+    # Faster codecs are opt-in
+    assert type(Options().json_codec) is JsonCodec
+    if orjson is not None:
+        assert OrjsonCodec().loads(OrjsonCodec().dumps(value)) == value
+        assert isinstance(fastest_codec(), OrjsonCodec)
+
+
+def test_json_codec_encodes_as_before():
+    # As the standard library does for HTTPX's `json=`
+    assert JsonCodec().dumps({1: float("nan"), "big": 2 ** 70}) == b'{"1":NaN,"big":1180591620717411303424}'
+    assert JsonCodec().loads(b"1180591620717411303424") == 2 ** 70
+
+
+def test_graphql_single_decode(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        url=GRAPHQL_URL,
+        json={
+            "data": {"shop": {"id": 1}},
+            "extensions": {
+                "cost": {
+                    "requestedQueryCost": 10,
+                    "actualQueryCost": 5,
+                    "throttleStatus": {"maximumAvailable": 1000, "currentlyAvailable": 995, "restoreRate": 50},
+                }
+            },
+        },
+    )
+
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.json_codec = codec = CountingCodec()
+        result = c.graphql("{ shop { id } }", {"first": 1})
+
+        # One encode for the request, one decode shared by the result, the cost and the retry check
+        assert result.body["data"]["shop"]["id"] == 1
+        assert c.options.cost_estimator.estimate("{ shop { id } }") == 10
+        assert (codec.encoded, codec.decoded) == (1, 1)
+        assert httpx_mock.get_request().headers["content-type"] == "application/json"
+
+
+@pytest.mark.asyncio
+async def test_async_rest_single_decode(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(json={"product": {"id": 1}})
+
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.json_codec = codec = CountingCodec()
+        result = await c.rest("post", "/admin/api/products.json", {"product": {"title": "Café"}})
+
+        assert result.body["product"]["id"] == 1
+        assert (codec.encoded, codec.decoded) == (1, 1)
+        assert httpx_mock.get_request().content == '{"product":{"title":"Café"}}'.encode("utf-8")
@@ -0,0 +1,107 @@
+import httpx
+import pytest
+from .utils import generate_opts_and_sess, FakeDeferrer
+from basic_shopify_api import AsyncClient, ShopifyEmulator
+from basic_shopify_api.constants import CALL_LIMIT_HEADER
+from basic_shopify_api.queries import minify_query
+
+PAGINATION_QUERY = """
+query ($cursor: String) {
+    products(first: 100, after: $cursor) {
+        edges { node { id title } }
+        pageInfo { hasNextPage endCursor }
+    }
+}
+"""
+
+
+def emulated_client(**kwargs) -> AsyncClient:
+    session, options = generate_opts_and_sess()
+    options.deferrer = deferrer = FakeDeferrer()
+    options.transport = ShopifyEmulator(clock=lambda: deferrer.current_time() / 1000, **kwargs)
+    return AsyncClient(session, options)
+
+
+@pytest.mark.asyncio
+async def test_emulator_rest_pagination():
+    async with emulated_client() as c:
+        ids = []
+        params = {"limit": 100}
+        while params is not None:
+            result = await c.rest("get", "/admin/api/products.json", params)
+            ids += [product["id"] for product in result.body["products"]]
+            params = {"limit": 100, "page_info": result.link.next} if result.link.next else None
+
+        assert ids == list(range(1, 251))
+        assert result.link.prev is not None
+        assert result.response.headers[CALL_LIMIT_HEADER] == "3/40"
+        assert (await c.rest("get", "/admin/api/products/count.json")).body == {"count": 250}
+
+
+@pytest.mark.asyncio
+async def test_emulator_rest_throttled():
+    async with emulated_client() as c:
+        # Another process filled the bucket
+        emulator = c.options.transport
+        emulator.shop("example.myshopify.com").rest_bucket.level = 40
+
+        result = await c.rest("get", "/admin/api/shop.json")
+        assert 200 in result.status
+        assert result.retries == 1
+        assert c.options.deferrer.sleeps == [1000]
+        assert emulator.stats == {"requests": 2, "throttled": 1}
+
+
+@pytest.mark.asyncio
+async def test_emulator_graphql():
+    async with emulated_client() as c:
+        emulator = c.options.transport
+        emulator.shop("example.myshopify.com").graphql_bucket.level = 1000
+
+        nodes = [node async for node in c.graphql_stream_with_pagination("products", PAGINATION_QUERY)]
+        assert [node["id"] for node in nodes] == [f"gid://shopify/Product/{n}" for n in range(1, 251)]
+        # Throttled first, then paced by the cost limiting
+        assert emulator.stats["throttled"] >= 1
+        assert c.options.cost_estimator.estimate(minify_query(PAGINATION_QUERY)) == 102
+
+
+@pytest.mark.asyncio
+async def test_emulator_bulk():
+    async with emulated_client(bulk_rate=100) as c:
+        rows = list(await c.run_bulk_operation_query("{ products { edges { node { id title } } } }"))
+        assert len(rows) == 250
+        assert rows[0] == {"id": "gid://shopify/Product/1", "title": "Product 1"}
+
+        mutation = "mutation call($input: ProductInput!) { productCreate(input: $input) { product { id } } }"
+        results = list(await c.run_bulk_operation_mutation(mutation, [{"title": "A"}, {"title": "B"}]))
+        assert [line["data"]["productCreate"]["input"] for line in results] == [
+            {"input": {"title": "A"}}, {"input": {"title": "B"}}
+        ]
+        assert [line["__lineNumber"] for line in results] == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_emulator_serve():
+    emulator = ShopifyEmulator()
+    server = await emulator.serve()
+    host, port = server.sockets[0].getsockname()[:2]
+    try:
+        async with httpx.AsyncClient(base_url=f"http://{host}:{port}") as client:
+            response = await client.get("/admin/api/2020-04/products/count.json")
+            assert response.json() == {"count": 250}
+            response = await client.post("/admin/api/2020-04/products.json", json={"product": {"title": "A"}})
+            assert response.status_code == 201
+            assert response.json() == {"product": {"title": "A", "id": 251}}
+
+            # Streamed bodies are sent in chunks
+            async def chunks():
+                yield b'--b\r\nContent-Disposition: form-data; name="key"\r\n\r\nupload\r\n'
+                yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.jsonl"\r\n\r\n{}\r\n--b--\r\n'
+
+            headers = {"Content-Type": "multipart/form-data; boundary=b"}
+            response = await client.post("/_emulator/uploads", content=chunks(), headers=headers)
+            assert response.status_code == 201
+            assert emulator.shop(f"{host}:{port}").uploads == {"upload": b"{}"}
+    finally:
+        server.close()
+        await server.wait_closed()
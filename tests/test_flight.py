@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from pytest_httpx import HTTPXMock
+from .utils import generate_opts_and_sess
+from basic_shopify_api import AsyncClient, SingleFlight
+
+GRAPHQL_URL = "https://example.myshopify.com/admin/api/2020-04/graphql.json"
+SHOP_URL = "https://example.myshopify.com/admin/api/2020-04/shop.json"
+
+
+@pytest.mark.asyncio
+async def test_single_flight_graphql(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=GRAPHQL_URL, json={"data": {"product": {"id": 1}}}, is_reusable=True)
+
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.single_flight = SingleFlight()
+        query = "query ($id: ID!) { product(id: $id) { id } }"
+        results = await asyncio.gather(*[c.graphql(query, {"id": "1"}) for _ in range(5)])
+
+        # One call, one result shared
+        assert len(httpx_mock.get_requests()) == 1
+        assert all(result is results[0] for result in results)
+        assert c.options.single_flight.stats == {"sent": 1, "coalesced": 4, "in_flight": 0}
+
+        # Other variables and mutations are sent on their own
+        await asyncio.gather(
+            c.graphql(query, {"id": "2"}),
+            c.graphql("mutation { productUpdate { id } }"),
+            c.graphql("mutation { productUpdate { id } }"),
+        )
+        assert len(httpx_mock.get_requests()) == 4
+        assert c.options.single_flight.stats["sent"] == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_rest(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=SHOP_URL, method="GET", json={"shop": {}}, is_reusable=True)
+    httpx_mock.add_response(url=SHOP_URL, method="PUT", json={"shop": {}}, is_reusable=True)
+
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.single_flight = SingleFlight()
+        await asyncio.gather(*[c.rest("get", "/admin/api/shop.json") for _ in range(3)])
+        await asyncio.gather(*[c.rest("put", "/admin/api/shop.json", {"shop": {}}) for _ in range(2)])
+        assert len(httpx_mock.get_requests()) == 3
+        assert c.options.single_flight.coalesced == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_sessions(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=SHOP_URL, method="GET", json={"shop": {}}, is_reusable=True)
+
+    # Calls with other access tokens or headers are not shared, as the cache
+    sess, options = generate_opts_and_sess()
+    options.single_flight = SingleFlight()
+    other, _ = generate_opts_and_sess()
+    other.password = "456"
+    async with AsyncClient(sess, options) as c, AsyncClient(other, options) as o:
+        await asyncio.gather(
+            c.rest("get", "/admin/api/shop.json"),
+            c.rest("get", "/admin/api/shop.json"),
+            o.rest("get", "/admin/api/shop.json"),
+            c.rest("get", "/admin/api/shop.json", headers={"Accept-Language": "fr"}),
+        )
+    assert len(httpx_mock.get_requests()) == 3
+    assert options.single_flight.coalesced == 1
+
+
+@pytest.mark.asyncio
+async def test_single_flight_disabled(httpx_mock: HTTPXMock, monkeypatch: pytest.MonkeyPatch):
+    httpx_mock.add_response(url=SHOP_URL, json={"shop": {}})
+    httpx_mock.add_response(url=GRAPHQL_URL, json={"data": {"shop": {}}})
+    keys = []
+    monkeypatch.setattr(AsyncClient, "_request_key", lambda *args: keys.append(args))
+
+    # Without single-flight or a cache, no key is built
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        await c.rest("get", "/admin/api/shop.json")
+        await c.graphql("{ shop { id } }")
+    assert keys == []
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancel():
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def send():
+        await release.wait()
+        return "result"
+
+    first = asyncio.ensure_future(flights.run("key", send))
+    second = asyncio.ensure_future(flights.run("key", send))
+    await asyncio.sleep(0)
+
+    # Cancelling the first request leaves the call to the second
+    first.cancel()
+    release.set()
+    assert await second == "result"
+    assert flights.stats == {"sent": 1, "coalesced": 1, "in_flight": 0}
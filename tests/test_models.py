@@ -0,0 +1,58 @@
+import json
+from httpx import Response
+from basic_shopify_api import ApiResult, RestResult
+from basic_shopify_api.models import RestLink
+
+
+class CountingLoads:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, data):
+        self.calls += 1
+        return json.loads(data)
+
+
+def test_result_lazy_body():
+    loads = CountingLoads()
+    result = ApiResult(response=Response(200, json={"data": {"id": 1}}), status=200, loads=loads)
+
+    # Nothing decoded until the body is used
+    assert 200 in result.status
+    assert loads.calls == 0
+    assert result.body == {"data": {"id": 1}}
+    assert result.errors is None
+    assert loads.calls == 1
+
+    result.body = {"changed": True}
+    assert result.body == {"changed": True}
+    assert not hasattr(result, "__dict__")
+
+
+def test_result_lazy_errors():
+    result = ApiResult(response=Response(200, json={"errors": [{"message": "Oops"}]}), status=200, loads=json.loads)
+    assert result.body is None
+    assert result.errors == [{"message": "Oops"}]
+
+    result = ApiResult(response=Response(500, content=b"<html>"), status=500, loads=json.loads)
+    assert result.body is None
+    assert isinstance(result.errors, Exception)
+
+    # Parsed already, as before
+    result = ApiResult(response=Response(200), status=200, body={"a": 1}, errors=None)
+    assert result.body == {"a": 1}
+
+
+def test_rest_result_lazy_link():
+    header = (
+        '<https://example.myshopify.com/admin/api/2020-04/products.json?page_info=abc>; rel="previous", '
+        '<https://example.myshopify.com/admin/api/2020-04/products.json?page_info=def>; rel="next"'
+    )
+    result = RestResult(response=Response(200, headers={"link": header}, json={}), status=200)
+    assert result._link is None
+    assert (result.link.prev, result.link.next) == ("abc", "def")
+    assert result.link is result.link
+
+    result = RestResult(response=Response(200, json={}), status=200)
+    assert (result.link.prev, result.link.next) == (None, None)
+    assert not hasattr(RestLink(None, None), "__dict__")
@@ -1,5 +1,5 @@
 import pytest
-from basic_shopify_api import Options
+from basic_shopify_api import BoundedMemoryStore, Options
 
 
 def test_options_version():
@@ -34,3 +34,16 @@ def test_options_failed_type():
     with pytest.raises(ValueError):
         opts = Options()
         opts.mode = "oops"
+
+
+def test_options_deprecated_stores():
+    opts = Options()
+    store = BoundedMemoryStore()
+    with pytest.deprecated_call():
+        opts.time_store = store
+    with pytest.deprecated_call():
+        assert opts.time_store is opts.rest_bucket_store is store
+    with pytest.deprecated_call():
+        opts.cost_store = store
+    with pytest.deprecated_call():
+        assert opts.cost_store is opts.graphql_bucket_store is store
@@ -0,0 +1,97 @@
+import pytest
+from pytest_httpx._httpx_mock import HTTPXMock
+from basic_shopify_api import ClientPool, Options, Session, SharedTransport
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def shop(name: str, password: str = "123") -> Session:
+    return Session(f"{name}.myshopify.com", "abc", password)
+
+
+@pytest.mark.asyncio
+async def test_client_pool_reuse() -> None:
+    opts = Options()
+    async with ClientPool(opts) as pool:
+        client = await pool.get(shop("a"))
+        assert await pool.get(shop("a")) is client
+        assert await pool.get(shop("b")) is not client
+
+        # New credentials get a new client
+        rotated = await pool.get(shop("a", password="456"))
+        assert rotated is not client
+        assert client.is_closed
+        assert pool.stats == {"hits": 1, "misses": 3, "evictions": 1, "size": 2}
+
+        # The clients share the options and the pool's transport
+        assert rotated.options is opts
+        assert rotated._transport.pool is opts.transport.pool
+
+    assert opts.transport is None
+    assert rotated.is_closed
+
+
+@pytest.mark.asyncio
+async def test_client_pool_eviction() -> None:
+    clock = FakeClock()
+    async with ClientPool(Options(), max_clients=2, ttl=60, clock=clock) as pool:
+        a = await pool.get(shop("a"))
+        b = await pool.get(shop("b"))
+        await pool.get(shop("a"))
+
+        # Least recently used goes first
+        await pool.get(shop("c"))
+        assert b.is_closed and not a.is_closed
+        assert len(pool) == 2
+
+        # Idle clients go, unless in use
+        async with pool.client(shop("a")) as held:
+            clock.now = 100
+            d = await pool.get(shop("d"))
+            assert not held.is_closed
+            assert list(pool.container) == ["a.myshopify.com", "d.myshopify.com"]
+        assert pool.stats["evictions"] == 2
+        assert not d.is_closed
+
+
+@pytest.mark.asyncio
+async def test_client_pool_full_of_held_clients() -> None:
+    async with ClientPool(Options(), max_clients=1) as pool:
+        async with pool.client(shop("a")) as held:
+            # Nothing can be evicted, the client checked out is kept open
+            client = await pool.get(shop("b"))
+            assert not client.is_closed and not held.is_closed
+            assert len(pool) == 2
+
+
+@pytest.mark.asyncio
+async def test_client_pool_rotation_in_use() -> None:
+    async with ClientPool(Options()) as pool:
+        async with pool.client(shop("a")) as held:
+            rotated = await pool.get(shop("a", password="456"))
+            # The old client is out of the pool, but kept open for its holder
+            assert pool.container["a.myshopify.com"].client is rotated
+            assert not held.is_closed
+        assert held.is_closed
+        assert not rotated.is_closed
+
+
+@pytest.mark.asyncio
+async def test_client_pool_keeps_transport(httpx_mock: HTTPXMock) -> None:
+    opts = Options()
+    opts.transport = SharedTransport()
+    httpx_mock.add_response(url="https://a.myshopify.com/admin/shop.json", json={})
+
+    async with ClientPool(opts) as pool:
+        async with pool.client(shop("a")) as client:
+            await client.get("/admin/shop.json")
+
+    # The transport was set by the caller, who closes it
+    assert opts.transport is not None
+    await opts.transport.aclose()
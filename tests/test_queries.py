@@ -0,0 +1,71 @@
+from pathlib import Path
+from unittest.mock import patch
+from basic_shopify_api.queries import QueryRegistry, minify_query, queries
+
+
+def test_templates_loaded_once():
+    assert "bulkoperation" in queries.templates
+    assert "\n" not in queries.templates["bulkoperation"]
+
+    # Rendering does not touch the disk
+    with patch.object(Path, "read_text", side_effect=AssertionError), patch("builtins.open", side_effect=AssertionError):
+        document = queries.render("current_bulkoperation", job_type="QUERY")
+    assert "currentBulkOperation(type:QUERY)" in document
+
+
+def test_render_cached():
+    registry = QueryRegistry(max_size=2)
+    sub_query = """
+    {
+        products {
+            edges { node { id } }
+        }
+    }
+    """
+    first = registry.render("query_bulkoperation", sub_query=sub_query)
+    assert registry.render("query_bulkoperation", sub_query=sub_query) is first
+    assert minify_query(sub_query) in first
+
+    # Least recently used are forgotten
+    registry.parse("{ shop { id } }")
+    registry.parse("{ shop { name } }")
+    assert len(registry.container) == 2
+    assert ("query_bulkoperation", ("sub_query", sub_query)) not in registry.container
+
+
+def test_parse_cached():
+    registry = QueryRegistry()
+    query = "query {\n  shop {\n    id\n  }\n}"
+    assert registry.parse(query) == minify_query(query)
+    assert registry.parse(query) is registry.parse(query)
+
+
+def test_minify_query():
+    query = r"""
+    # Products to export
+    query Products($first: Int = 10, $after: String) {
+      products(first: $first, after: $after, query: "title:'a, b' # kept") {
+        edges { node { id ...Fields } }
+        price: metafield(value: -1.5e3, list: [1, 2], escaped: "x\"y")
+      }
+    }
+    fragment Fields on Product { title }
+    """
+    assert minify_query(query) == (
+        r"query Products($first:Int=10$after:String){"
+        r"""products(first:$first after:$after query:"title:'a, b' # kept"){"""
+        r"edges{node{id...Fields}}"
+        r'price:metafield(value:-1.5e3 list:[1 2]escaped:"x\"y")}}'
+        r"fragment Fields on Product{title}"
+    )
+    # Memoized by the text of the query
+    assert minify_query(query) is minify_query(query)
+
+
+def test_minify_query_block_string():
+    query = r'''{ note(text: """
+      keep   this \""" # too
+    """) }'''
+    assert minify_query(query) == r'''{note(text:"""
+      keep   this \""" # too
+    """)}'''
@@ -0,0 +1,88 @@
+import pytest
+from pytest_httpx import HTTPXMock
+from .utils import generate_opts_and_sess, FakeDeferrer
+from basic_shopify_api import AsyncClient, Client, RetryBudget
+from basic_shopify_api.retry import full_jitter
+
+REST_URL = "https://example.myshopify.com/admin/api/2020-04/shop.json"
+GRAPHQL_URL = "https://example.myshopify.com/admin/api/2020-04/graphql.json"
+
+
+def test_full_jitter():
+    assert full_jitter(0, 500, 10000, rand=lambda: 1.0) == 500
+    assert full_jitter(3, 500, 10000, rand=lambda: 1.0) == 4000
+    assert full_jitter(10, 500, 10000, rand=lambda: 1.0) == 10000
+    assert full_jitter(3, 500, 10000, rand=lambda: 0.5) == 2000
+    assert 0 <= full_jitter(2, 500, 10000) <= 2000
+
+
+def test_retry_budget():
+    budget = RetryBudget(capacity=2, refill_rate=1.0, max_shops=2)
+    assert budget.withdraw("a.myshopify.com", 0) is True
+    assert budget.withdraw("a.myshopify.com", 0) is True
+    assert budget.withdraw("a.myshopify.com", 0) is False
+    # Each shop has its own budget
+    assert budget.withdraw("b.myshopify.com", 0) is True
+    # Restored over time
+    assert budget.withdraw("a.myshopify.com", 1000) is True
+    assert budget.stats == {"allowed": 4, "denied": 1}
+
+    # Least recently used shops are forgotten
+    budget.withdraw("c.myshopify.com", 1000)
+    assert list(budget.container) == ["a.myshopify.com", "c.myshopify.com"]
+
+
+def test_retry_actions_once(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=REST_URL, status_code=503)
+    httpx_mock.add_response(url=REST_URL, status_code=503)
+    httpx_mock.add_response(url=REST_URL, json={"shop": {"id": 1}})
+
+    pre, post = [], []
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        c.options.retry_backoff = 0
+        c.options.rest_pre_actions = [lambda inst, **kwargs: pre.append(kwargs["url"])]
+        c.options.rest_post_actions = [lambda inst, result: post.append(result.retries)]
+        result = c.rest("get", "/admin/api/shop.json")
+
+        assert 200 in result.status
+        assert result.retries == 2
+        assert len(httpx_mock.get_requests()) == 3
+        # Actions ran once for the call, the rate limit for every attempt
+        assert pre == ["/admin/api/2020-04/shop.json"]
+        assert post == [2]
+        assert c.options.rest_bucket_store.all(c.session)[2] == 3
+
+
+def test_retry_budget_spent(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=GRAPHQL_URL, status_code=502, is_reusable=True)
+
+    with Client(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        c.options.retry_budget = RetryBudget(capacity=1, refill_rate=0.001)
+        result = c.graphql("{ shop { id } }")
+        assert 502 in result.status
+        assert result.retries == 1
+
+        # Nothing left for the next call, returned as is
+        result = c.graphql("{ shop { id } }")
+        assert result.retries == 0
+        assert len(httpx_mock.get_requests()) == 3
+        assert c.options.retry_budget.stats == {"allowed": 1, "denied": 2}
+
+
+@pytest.mark.asyncio
+async def test_async_retry_deadline(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=REST_URL, status_code=504, is_reusable=True)
+
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.options.deferrer = FakeDeferrer()
+        c.options.retry_backoff = 1000
+        c.options.retry_deadline = 1500
+        c.options.max_retries = 10
+        result = await c.rest("get", "/admin/api/shop.json")
+
+        # Retried while the backoff ends before the deadline
+        assert 504 in result.status
+        assert sum(c.options.deferrer.sleeps) <= 1500
+        assert len(httpx_mock.get_requests()) == result.retries + 1
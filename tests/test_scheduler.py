@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from basic_shopify_api import BulkScheduler
+
+
+class FakeClient:
+    def __init__(self, domain: str, concurrent: int = 1):
+        self.session = SimpleNamespace(domain=domain)
+        self.options = SimpleNamespace(bulk_max_concurrent=concurrent)
+        self.started = []
+        self.releases = {}
+
+    async def _run(self, name):
+        self.started.append(name)
+        self.releases[name] = asyncio.Event()
+        await self.releases[name].wait()
+        if name == "fail":
+            raise ValueError("Job failed")
+        return f"{self.session.domain}:{name}"
+
+    async def run_bulk_operation_query(self, sub_query, variables, wait, assemble, progress):
+        return await self._run(sub_query)
+
+    async def run_bulk_operation_mutation(self, query, rows, key, wait, progress):
+        return await self._run(query)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_slots_and_priority():
+    scheduler = BulkScheduler()
+    client = FakeClient("shop-a")
+    first = scheduler.submit_query(client, "first")
+    low = scheduler.submit_query(client, "low")
+    high = scheduler.submit_query(client, "high", priority=10)
+    mutation = scheduler.submit_mutation(client, "mutation", [])
+    await settle()
+
+    # One query and one mutation at a time for the shop
+    assert client.started == ["first", "mutation"]
+    assert (first.status, low.status, high.status) == ("RUNNING", "QUEUED", "QUEUED")
+    assert scheduler.pending == 2
+
+    # A freed slot goes to the highest priority
+    client.releases["first"].set()
+    assert await first == "shop-a:first"
+    await settle()
+    assert client.started == ["first", "mutation", "high"]
+
+    for name in ["high", "mutation", "low"]:
+        await settle()
+        client.releases[name].set()
+    await scheduler.join()
+    assert [job.result() for job in (low, high, mutation)] == ["shop-a:low", "shop-a:high", "shop-a:mutation"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_shops_and_max_running():
+    scheduler = BulkScheduler(max_running=2)
+    clients = [FakeClient(f"shop-{i}", concurrent=5) for i in range(3)]
+    jobs = [scheduler.submit_query(client, "export") for client in clients]
+    await settle()
+
+    # Shops run side by side, up to the overall limit
+    assert scheduler.running == 2
+    assert [job.status for job in jobs] == ["RUNNING", "RUNNING", "QUEUED"]
+
+    clients[0].releases["export"].set()
+    await settle()
+    assert jobs[2].status == "RUNNING"
+
+    for client in clients[1:]:
+        client.releases["export"].set()
+    await scheduler.join()
+    assert [await job for job in jobs] == ["shop-0:export", "shop-1:export", "shop-2:export"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_failure_and_cancel():
+    scheduler = BulkScheduler()
+    client = FakeClient("shop-a")
+    failing = scheduler.submit_query(client, "fail")
+    cancelled = scheduler.submit_query(client, "cancelled")
+    after = scheduler.submit_query(client, "after")
+    await settle()
+
+    assert cancelled.cancel()
+    client.releases["fail"].set()
+    with pytest.raises(ValueError):
+        await failing
+    assert failing.status == "FAILED"
+
+    # The cancelled job never starts, the next one takes the slot
+    await settle()
+    assert cancelled.status == "CANCELLED"
+    assert client.started == ["fail", "after"]
+
+    await scheduler.close()
+    assert after.status == "CANCELLED"
@@ -0,0 +1,156 @@
+import pytest
+from multiprocessing import Process
+from basic_shopify_api import BoundedMemoryStore, Session, SharedFileStore
+from basic_shopify_api.store import RingBuffer
+
+
+def increment(path: str, times: int) -> None:
+    store = SharedFileStore(path, slots=8)
+    sess = Session("example.myshopify.com")
+    for i in range(times):
+        with store.lock(sess):
+            values = store.all(sess) or [0]
+            store.replace(sess, [values[0] + 1])
+    store.close()
+
+
+def test_shared_file_store(tmp_path):
+    store = SharedFileStore(str(tmp_path / "state"), slots=8, size=3)
+    sess = Session("example.myshopify.com")
+    other = Session("other.myshopify.com")
+    assert store.all(sess) == []
+
+    store.append(sess, 1)
+    store.append(sess, 2.5)
+    store.append(other, 3)
+    assert store.all(sess) == [1, 2.5]
+    assert store.all(other) == [3]
+
+    # Oldest values are dropped once the slot is full
+    store.replace(sess, [1, 2, 3, 4])
+    assert store.all(sess) == [2, 3, 4]
+
+    store.reset(sess)
+    assert store.all(sess) == []
+    assert store.all(other) == [3]
+    store.close()
+
+
+def test_shared_file_store_layout(tmp_path):
+    SharedFileStore(str(tmp_path / "state"), slots=8).close()
+    with pytest.raises(ValueError):
+        SharedFileStore(str(tmp_path / "state"), slots=16)
+
+
+def test_shared_file_store_processes(tmp_path):
+    path = str(tmp_path / "state")
+    processes = [Process(target=increment, args=(path, 200)) for i in range(4)]
+    [process.start() for process in processes]
+    [process.join() for process in processes]
+
+    # Every update from every process was kept
+    store = SharedFileStore(path, slots=8)
+    assert store.all(Session("example.myshopify.com")) == [800]
+    store.close()
+
+
+def used_slots(store):
+    return sum(1 for slot in range(store.slots) if store._map[slot * store._record.size:][:16] != store.EMPTY_KEY)
+
+
+def test_shared_file_store_no_claim_on_read(tmp_path):
+    store = SharedFileStore(str(tmp_path / "state"), slots=4)
+    for i in range(10):
+        sess = Session(f"shop-{i}.myshopify.com")
+        assert store.all(sess) == []
+        store.reset(sess)
+        store.replace(sess, [])
+    # Reads of shops without values take no slot
+    assert used_slots(store) == 0
+    store.close()
+
+
+def test_shared_file_store_exhaustion(tmp_path):
+    now = [0.0]
+    store = SharedFileStore(str(tmp_path / "state"), slots=4, ttl=60, clock=lambda: now[0])
+    shops = [Session(f"shop-{i}.myshopify.com") for i in range(5)]
+    for i, sess in enumerate(shops[:4]):
+        now[0] = i
+        store.append(sess, i)
+
+    # All slots are live, the least recently used shop makes way
+    now[0] = 10
+    store.append(shops[4], 4)
+    assert store.all(shops[4]) == [4]
+    assert store.all(shops[0]) == []
+    assert [store.all(sess) for sess in shops[1:4]] == [[1], [2], [3]]
+    store.close()
+
+
+def test_shared_file_store_reclaim(tmp_path):
+    now = [0.0]
+    store = SharedFileStore(str(tmp_path / "state"), slots=4, ttl=60, clock=lambda: now[0])
+    shops = [Session(f"shop-{i}.myshopify.com") for i in range(8)]
+    for sess in shops[:4]:
+        store.append(sess, 1)
+
+    # A drained slot is reclaimed, even if it is the most recently used
+    now[0] = 10
+    store.reset(shops[3])
+    store.append(shops[4], 1)
+    assert [store.all(sess) for sess in shops[:5]] == [[1], [1], [1], [], [1]]
+
+    # Idle slots are reclaimed, live ones are kept
+    now[0] = 65
+    store.append(shops[4], 2)
+    store.append(shops[5], 1)
+    store.append(shops[6], 1)
+    store.append(shops[7], 1)
+    assert [store.all(sess) for sess in shops] == [[], [], [], [], [1, 2], [1], [1], [1]]
+    store.close()
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(3)
+    for value in range(5):
+        buffer.append(value)
+    assert buffer.all() == [2, 3, 4]
+    assert len(buffer) == 3
+
+    buffer.replace([7])
+    assert buffer.all() == [7]
+    buffer.clear()
+    assert buffer.all() == []
+
+
+def test_bounded_memory_store():
+    store = BoundedMemoryStore(size=2)
+    sess = Session("example.myshopify.com")
+    store.append(sess, 1)
+    store.append(sess, 2)
+    store.append(sess, 3)
+    assert store.all(sess) == [2, 3]
+
+    store.replace(sess, [4])
+    assert store.all(sess) == [4]
+    store.reset(sess)
+    assert store.all(sess) == []
+
+
+def test_bounded_memory_store_eviction():
+    now = [0.0]
+    store = BoundedMemoryStore(max_shops=2, ttl=60, clock=lambda: now[0])
+    sessions = [Session(f"shop-{i}.myshopify.com") for i in range(3)]
+    for sess in sessions:
+        store.append(sess, 1)
+
+    # Least recently used shop was forgotten
+    assert list(store.container) == ["shop-1.myshopify.com", "shop-2.myshopify.com"]
+
+    # Idle shops are forgotten
+    now[0] = 30.0
+    store.all(sessions[1])
+    now[0] = 61.0
+    store.all(sessions[0])
+    assert list(store.container) == ["shop-1.myshopify.com", "shop-0.myshopify.com"]
+    assert store.all(sessions[0]) == []
@@ -0,0 +1,52 @@
+import pytest
+from pytest_httpx._httpx_mock import HTTPXMock
+from basic_shopify_api import AsyncClient, Session, SharedTransport
+from .utils import generate_opts_and_sess
+
+
+@pytest.mark.asyncio
+async def test_shared_transport(httpx_mock: HTTPXMock) -> None:
+    transport = SharedTransport(max_connections=10, max_keepalive_connections=5)
+    _, opts = generate_opts_and_sess()
+    opts.transport = transport
+    httpx_mock.add_response(url="https://example.myshopify.com/admin/shop.json", json={})
+    httpx_mock.add_response(url="https://other.myshopify.com/admin/shop.json", json={})
+
+    # Shops share the pool, closing one client leaves it open for the others
+    async with AsyncClient(Session("example.myshopify.com", "abc", "123"), opts) as c:
+        assert c._transport.pool is transport.pool
+        await c.get("/admin/shop.json")
+    async with AsyncClient(Session("other.myshopify.com", "abc", "123"), opts) as c:
+        assert c.transfers._transport.pool is transport.pool
+        await c.get("/admin/shop.json")
+    assert transport.limits.max_keepalive_connections == 5
+
+    await transport.aclose()
+
+
+@pytest.mark.asyncio
+async def test_shared_transport_warm(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(method="HEAD", url="https://example.myshopify.com", is_reusable=True)
+
+    async with SharedTransport() as transport:
+        await transport.warm(["https://example.myshopify.com"] * 2)
+    assert len(httpx_mock.get_requests()) == 2
+
+
+@pytest.mark.asyncio
+async def test_transfers_client_reused() -> None:
+    c = AsyncClient(*generate_opts_and_sess())
+    transfers = c.transfers
+    assert c.transfers is transfers
+    assert transfers.auth is None
+
+    await c.aclose()
+    assert transfers.is_closed
+
+
+@pytest.mark.asyncio
+async def test_transfers_client_closed_on_exit() -> None:
+    async with AsyncClient(*generate_opts_and_sess()) as c:
+        c.transfers
+    assert c._transfers.is_closed
+    assert c.is_closed
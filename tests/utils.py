@@ -2,6 +2,7 @@ import pytest
 from functools import wraps
 from unittest.mock import patch, PropertyMock
 from basic_shopify_api import Options, Session
+from basic_shopify_api.deferrer import Deferrer
 from basic_shopify_api.constants import DEFAULT_MODE
 
 
@@ -29,3 +30,23 @@ def generate_opts_and_sess(mode=DEFAULT_MODE):
 
     sess = Session("example.myshopify.com", "abc", "123")
     return (sess, opts)
+
+
+class FakeDeferrer(Deferrer):
+    """
+    Deferrer with a fake clock, sleeping moves the clock forward instantly.
+    """
+
+    def __init__(self, start: int = 1000000):
+        self.time = start
+        self.sleeps = []
+
+    def current_time(self) -> int:
+        return self.time
+
+    def sleep(self, length) -> None:
+        self.sleeps.append(length)
+        self.time += length
+
+    async def asleep(self, length) -> None:
+        self.sleep(length)